@@ -1,6 +1,6 @@
 import argparse
 import struct
-from time import perf_counter
+from time import perf_counter_ns
 from collections import deque
 import statistics
 
@@ -14,6 +14,8 @@ YOUR_TURN_IP: str = "127.0.0.1"
 MIDDLEMAN_IP: str = "127.0.0.1"
 PING_DEFAULT_FREQUENCY: float = 100.0
 PING_STAT_PUBLISH: float = 1.0
+# Departure time in integer nanoseconds, as a float loses precision once the process runs for a while
+PING_PACKET = struct.Struct(">LQ100x")
 
 
 class ExampleClient(DatagramProtocol):
@@ -35,6 +37,8 @@ class ExampleClient(DatagramProtocol):
         self._connected = False
         self._counter: int = 0
         self._ping_buffer = deque(maxlen=2048)
+        self._highest_counter: int = -1
+        self._reordered: int = 0  # Pongs received after a later one
     
     def set_send_addr(self, host, port) -> None:
         self._send_addr = (host, port)
@@ -82,19 +86,22 @@ class ExampleClient(DatagramProtocol):
                 return
 
         # Calculate the time it took for the packet to reach server and back to client
-        # TODO: Ping packets can get delivered unordered, so keep track of which packet is which
         counter: int
-        departure_time: float
-        counter, departure_time = struct.unpack(">Lf100x", data)
-        ping_ms: float = (perf_counter() - departure_time) * 1000
+        departure_time: int
+        counter, departure_time = PING_PACKET.unpack(data)
+        ping_ms: float = (perf_counter_ns() - departure_time) / 1e6
         self._ping_buffer.append(ping_ms)
+        if counter < self._highest_counter:
+            self._reordered += 1
+        else:
+            self._highest_counter = counter
 
     def connectionRefused(self):
         print("Failed to reach Your TURN relay!")
         reactor.stop()
 
     def ping_server(self) -> None:
-        payload = struct.pack(">Lf100x", self._counter, perf_counter())
+        payload = PING_PACKET.pack(self._counter, perf_counter_ns())
 
         if self._bypass:
             payload = make_turn_packet(self._id, payload)
@@ -109,7 +116,7 @@ class ExampleClient(DatagramProtocol):
         ping_max = max(self._ping_buffer)
         ping_min = min(self._ping_buffer)
         ping_std = statistics.stdev(self._ping_buffer)
-        print(f"Ping statistics [ms]: Mean:{ping_mean:.6f}\tMax:{ping_max:.6f}\tMin:{ping_min:.6f}\tSTD:{ping_std:.6f}")
+        print(f"Ping statistics [ms]: Mean:{ping_mean:.6f}\tMax:{ping_max:.6f}\tMin:{ping_min:.6f}\tSTD:{ping_std:.6f}\tReordered:{self._reordered}")
 
 
 if __name__ == "__main__":
@@ -123,12 +130,29 @@ if __name__ == "__main__":
     arg_parser.add_argument("-p", "--relay-port", type=int, default=YOUR_TURN_PORT)
     arg_parser.add_argument("-f", "--frequency", type=float, default=PING_DEFAULT_FREQUENCY)
     arg_parser.add_argument("-b", "--bypass", action="store_true", help="Bypass Middleman")
+    arg_parser.add_argument("-m", "--metrics-port", type=int, default=0, help="Local Prometheus metrics port of the Middleman, 0 disables it")
+    arg_parser.add_argument("--compress", action="store_true", help="Compress the packets, once the other side accepts the dictionary")
+    arg_parser.add_argument("--fec-group", type=int, default=0, help="Send a FEC parity packet after every N packets, 0 disables it")
+    arg_parser.add_argument("--direct", action="store_true", help="Talk to the other side directly, when the NATs let it")
+    arg_parser.add_argument("--hop-trace-period", type=int, default=0, help="Stamp every N-th packet on each hop, 0 disables it")
     args = arg_parser.parse_args()
 
     client_app = ExampleClient(args.id, args.frequency, bypass=args.bypass, verbose=args.verbose)
     if not args.bypass:
         set_client_interface_address = lambda i, p: client_app.set_send_addr("127.0.0.1", p)
-        middleman = YourTurnMiddleman(args.relay_ip, args.relay_port, False, id=args.id, verbose=args.verbose, on_peer_registered=set_client_interface_address)
+        middleman = YourTurnMiddleman(
+            args.relay_ip,
+            args.relay_port,
+            False,
+            id=args.id,
+            verbose=args.verbose,
+            on_peer_registered=set_client_interface_address,
+            metrics_port=args.metrics_port,
+            hop_trace_period=args.hop_trace_period,
+            direct=args.direct,
+            fec_group=args.fec_group,
+            compress=args.compress
+        )
     else:
         # Bypass Middleman and send directly to the Relay
         client_app.set_send_addr(args.relay_ip, args.relay_port)
@@ -1,6 +1,4 @@
 import argparse
-import struct
-from time import perf_counter
 
 from twisted.internet import reactor
 from twisted.internet.protocol import DatagramProtocol
@@ -26,11 +24,8 @@ class ExampleServer(DatagramProtocol):
             print(f"received {data!r} from {addr}")
         # Echo data back
         self.transport.write(data, addr)
-        # TODO: Calculate the time it took for the data to reach server
-        # NOTE: perf_counter has an undefined start
-        # counter, departure_time = struct.unpack(">Lf100x", data)
-        # ping = perf_counter() - departure_time
-        # print(f"TT [{counter}]:{ping}\ts")
+        # NOTE: Clocks of the Client & Server differ, so the time to reach the server is taken apart by the
+        # Middlemen instead, with --hop-trace-period
 
     def connectionRefused(self):
         print("Failed to reach Your TURN relay!")
@@ -47,9 +42,25 @@ if __name__ == "__main__":
     arg_parser.add_argument("-v", "--verbose", action="store_true")
     arg_parser.add_argument("-r", "--relay-ip", default=YOUR_TURN_IP)
     arg_parser.add_argument("-x", "--relay-port", type=int, default=YOUR_TURN_PORT)
+    arg_parser.add_argument("-m", "--metrics-port", type=int, default=0, help="Local Prometheus metrics port of the Middleman, 0 disables it")
+    arg_parser.add_argument("--compress", action="store_true", help="Compress the packets, once the other side accepts the dictionary")
+    arg_parser.add_argument("--fec-group", type=int, default=0, help="Send a FEC parity packet after every N packets, 0 disables it")
+    arg_parser.add_argument("--direct", action="store_true", help="Talk to the other side directly, when the NATs let it")
+    arg_parser.add_argument("--hop-trace-period", type=int, default=0, help="Stamp every N-th packet on each hop, 0 disables it")
     args = arg_parser.parse_args()
 
     # Run the Application first
     reactor.listenUDP(args.port, ExampleServer(verbose=args.verbose))
-    middleman = YourTurnMiddleman(args.relay_ip, args.relay_port, True, server_port=args.listen_port, verbose=args.verbose)
+    middleman = YourTurnMiddleman(
+        args.relay_ip,
+        args.relay_port,
+        True,
+        server_port=args.listen_port,
+        verbose=args.verbose,
+        metrics_port=args.metrics_port,
+        hop_trace_period=args.hop_trace_period,
+        direct=args.direct,
+        fec_group=args.fec_group,
+        compress=args.compress
+    )
     reactor.run()
@@ -0,0 +1,135 @@
+import socket
+
+from twisted.internet import defer, reactor, task
+from twisted.internet.protocol import DatagramProtocol
+from twisted.trial import unittest
+
+from your_turn import YourTurnRelay, make_turn_packet
+from your_turn_cluster import YourTurnClusterLink
+
+LOCALHOST: str = "127.0.0.1"
+CLIENT_ID: int = 5
+WAIT_TIME: float = 3.0  # [s]
+POLL_PERIOD: float = 0.01  # [s]
+
+
+class Peer(DatagramProtocol):
+    # Raw TURN peer, that keeps everything it receives
+    def __init__(self) -> None:
+        self.received: list = []
+
+    def datagramReceived(self, data: bytes, addr: tuple) -> None:
+        self.received.append(data)
+
+
+class YourTurnClusterTest(unittest.TestCase):
+    # Two cluster nodes linked over localhost, with peers registering on either of them
+    timeout = 10
+
+    def setUp(self) -> None:
+        # Links are bound first, as each node is started with the link address of the other one
+        link_sockets: list = []
+        for _ in range(2):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind((LOCALHOST, 0))
+            sock.setblocking(False)
+            link_sockets.append(sock)
+        self.link_addrs: list = [sock.getsockname() for sock in link_sockets]
+
+        self.relays: list = []
+        self.links: list = []
+        self.link_ports: list = []
+        self.relay_addrs: list = []
+        for node in range(2):
+            relay: YourTurnRelay = YourTurnRelay()
+            link: YourTurnClusterLink = YourTurnClusterLink(relay, [self.link_addrs[1 - node]])
+            self.relay_addrs.append((LOCALHOST, self.listen(relay).getHost().port))
+            link_port = reactor.adoptDatagramPort(link_sockets[node].fileno(), socket.AF_INET, link)
+            link_sockets[node].close()
+            self.addCleanup(self.stop_listening, link_port)
+            self.relays.append(relay)
+            self.links.append(link)
+            self.link_ports.append(link_port)
+
+    def listen(self, protocol: DatagramProtocol):
+        port = reactor.listenUDP(0, protocol, interface=LOCALHOST)
+        self.addCleanup(self.stop_listening, port)
+        return port
+
+    def stop_listening(self, port) -> None:
+        if port.connected:
+            port.stopListening()
+
+    def make_peer(self) -> Peer:
+        peer: Peer = Peer()
+        self.listen(peer)
+        return peer
+
+    @defer.inlineCallbacks
+    def wait_for(self, condition, what: str):
+        for _ in range(int(WAIT_TIME / POLL_PERIOD)):
+            if condition():
+                return
+            yield task.deferLater(reactor, POLL_PERIOD, lambda: None)
+        self.fail(f"Timed out waiting for {what}")
+
+    @defer.inlineCallbacks
+    def register(self, peer: Peer, peer_id: int, node: int):
+        registration: bytes = make_turn_packet(peer_id)
+        peer.transport.write(registration, self.relay_addrs[node])
+        yield self.wait_for(lambda: registration in peer.received, f"registration of peer {peer_id} on node {node}")
+
+    @defer.inlineCallbacks
+    def register_across(self):
+        # Server on the first node, Client on the second one, which only knows the Server once it's announced
+        server: Peer = self.make_peer()
+        client: Peer = self.make_peer()
+        yield self.register(server, 1, 0)
+        yield self.wait_for(lambda: 1 in self.links[1].get_peer_map(), "announcement of the Server")
+        yield self.register(client, CLIENT_ID, 1)
+        yield self.wait_for(lambda: CLIENT_ID in self.links[0].get_peer_map(), "announcement of the Client")
+        return server, client
+
+    @defer.inlineCallbacks
+    def test_forwarding(self):
+        server, client = yield self.register_across()
+        self.assertIsNone(self.links[0].get_peer_map().get_local(CLIENT_ID))
+        # Server learns about the Client registered on the other node
+        yield self.wait_for(lambda: make_turn_packet(CLIENT_ID) in server.received, "notification of the Server")
+
+        client.transport.write(make_turn_packet(1, b"ping"), self.relay_addrs[1])
+        yield self.wait_for(lambda: make_turn_packet(CLIENT_ID, b"ping") in server.received, "packet for the Server")
+        server.transport.write(make_turn_packet(CLIENT_ID, b"pong"), self.relay_addrs[0])
+        yield self.wait_for(lambda: make_turn_packet(CLIENT_ID, b"pong") in client.received, "packet for the Client")
+
+    @defer.inlineCallbacks
+    def test_peer_moves_between_nodes(self):
+        server, client = yield self.register_across()
+        # Client comes back on the node of the Server, e.g. after its NAT binding changed
+        moved: Peer = self.make_peer()
+        yield self.register(moved, CLIENT_ID, 0)
+        yield self.wait_for(lambda: self.links[1].get_peer_map().get_local(CLIENT_ID) is None, "takeover of the Client")
+        self.assertIsNotNone(self.links[0].get_peer_map().get_local(CLIENT_ID))
+        self.assertIn(CLIENT_ID, self.links[1].get_peer_map())
+
+        server.transport.write(make_turn_packet(CLIENT_ID, b"moved"), self.relay_addrs[0])
+        yield self.wait_for(lambda: make_turn_packet(CLIENT_ID, b"moved") in moved.received, "packet for the moved Client")
+        self.assertNotIn(make_turn_packet(CLIENT_ID, b"moved"), client.received)
+
+        # Periodic announcement of the old node, sent before it heard about the move, doesn't take the Client back
+        self.links[0].get_peer_map().add_remote(CLIENT_ID, self.link_addrs[1], 0)
+        self.assertIsNotNone(self.links[0].get_peer_map().get_local(CLIENT_ID))
+
+    @defer.inlineCallbacks
+    def test_stale_node_is_forgotten(self):
+        self.patch(YourTurnClusterLink, "ANNOUNCE_PERIOD", 0.1)
+        self.patch(YourTurnClusterLink, "STALE_TIME", 0.3)
+        yield self.register_across()
+        # Peers of a node are kept, while it keeps announcing them
+        yield task.deferLater(reactor, 0.5, lambda: None)
+        self.assertIn(1, self.links[1].get_peer_map())
+
+        yield self.link_ports[0].stopListening()
+        yield self.wait_for(lambda: 1 not in self.links[1].get_peer_map(), "the Server of the stopped node to be forgotten")
+        self.assertEqual(self.links[1].get_peer_map().get_remote_count(), 0)
+        self.assertIsNotNone(self.links[1].get_peer_map().get_local(CLIENT_ID))
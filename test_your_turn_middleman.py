@@ -0,0 +1,61 @@
+from twisted.internet import defer, reactor
+from twisted.internet.protocol import DatagramProtocol
+from twisted.trial import unittest
+
+from your_turn_middleman import YourTurnMiddlemanInterface
+
+LOCALHOST: str = "127.0.0.1"
+
+
+class Sink(DatagramProtocol):
+    # Fires its Deferred with the first datagram it gets
+    def __init__(self) -> None:
+        self.received: defer.Deferred = defer.Deferred()
+
+    def datagramReceived(self, data: bytes, addr: tuple) -> None:
+        if not self.received.called:
+            self.received.callback(data)
+
+
+class YourTurnMiddlemanInterfaceTest(unittest.TestCase):
+    timeout = 5
+
+    def listen(self, protocol: DatagramProtocol) -> int:
+        port = reactor.listenUDP(0, protocol, interface=LOCALHOST)
+        self.addCleanup(port.stopListening)
+        return port.getHost().port
+
+    @defer.inlineCallbacks
+    def test_receives_after_socket_was_full(self) -> None:
+        # Socket, that can't take any more, must not stop the interface from receiving, and the queued packet is
+        # sent once the socket takes it again
+        sink: Sink = Sink()
+        sink_port: int = self.listen(sink)
+        received: defer.Deferred = defer.Deferred()
+        interface: YourTurnMiddlemanInterface = YourTurnMiddlemanInterface(
+            1,
+            lambda id, data, addr: received.callback(data),
+            send_port=sink_port,
+            send_ip=LOCALHOST
+        )
+        interface_port: int = self.listen(interface)
+
+        write = interface.transport.write
+        calls: list = []
+
+        def write_once_full(data: bytes, addr: tuple = None) -> None:
+            calls.append(data)
+            if len(calls) == 1:
+                raise BlockingIOError()
+            write(data, addr)
+        interface.transport.write = write_once_full
+
+        interface.send_data(b"queued")
+        self.assertEqual(len(interface.get_send_queue()), 1)
+
+        sender: DatagramProtocol = DatagramProtocol()
+        self.listen(sender)
+        sender.transport.write(b"ping", (LOCALHOST, interface_port))
+        self.assertEqual((yield received), b"ping")
+        self.assertEqual((yield sink.received), b"queued")
+        self.assertEqual(len(interface.get_send_queue()), 0)
@@ -0,0 +1,194 @@
+import multiprocessing
+import unittest
+from multiprocessing.shared_memory import SharedMemory
+
+from your_turn import YourTurnPeer
+from your_turn_metrics import YourTurnMetrics, YourTurnPeerCounters
+from your_turn_logging import YourTurnLogger
+from your_turn_workers import (
+    SHARED_PEER_RECORD,
+    SHARED_PEER_SEQ,
+    SHARED_REGISTRY_GENERATION,
+    YourTurnSharedPeerTable,
+    YourTurnSharedRegistry,
+)
+
+CAPACITY: int = 16
+
+
+class DataPortStandIn:
+    def send(self, data: bytes, addr: tuple = None) -> None:
+        pass
+
+
+class TransportStandIn:
+    def write(self, data: bytes, addr: tuple = None) -> None:
+        pass
+
+
+class RelayStandIn:
+    # Only what the shared peer table of a worker asks its Relay for
+    def __init__(self) -> None:
+        self.transport = TransportStandIn()
+        self._data_port = DataPortStandIn()
+        self._metrics = YourTurnMetrics("test", {})
+        self._log = YourTurnLogger()
+
+    def get_data_port(self) -> DataPortStandIn:
+        return self._data_port
+
+    def get_metrics(self) -> YourTurnMetrics:
+        return self._metrics
+
+    def get_logger(self) -> YourTurnLogger:
+        return self._log
+
+
+class YourTurnSharedRegistryTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.registry = YourTurnSharedRegistry.create(multiprocessing.Lock(), CAPACITY)
+        self.addCleanup(self.registry.close, True)
+        self.next_id: int = 1
+
+    def ids_with_home(self, home: int, count: int) -> list:
+        # IDs, that all start their probe chains at the given slot
+        ids: list = []
+        while len(ids) < count:
+            if self.registry._first_slot(self.next_id) == home:
+                ids.append(self.next_id)
+            self.next_id += 1
+        return ids
+
+    def publish(self, *peer_ids) -> None:
+        for peer_id in peer_ids:
+            slot, _ = self.registry.publish(peer_id, ("127.0.0.1", 40000 + peer_id), 0, 1)
+            self.assertGreaterEqual(slot, 0)
+
+    def assert_slots(self, slots: dict) -> None:
+        for peer_id, slot in slots.items():
+            self.assertEqual(self.registry.find(peer_id), slot)
+            self.assertEqual(self.registry.read(slot)[1], peer_id)
+
+    def assert_empty(self) -> None:
+        for slot in range(CAPACITY):
+            self.assertEqual(self.registry.read(slot)[1], 0)
+
+    def test_publish_find_withdraw(self) -> None:
+        peer_id: int = self.ids_with_home(3, 1)[0]
+        slot, seq = self.registry.publish(peer_id, ("10.0.0.1", 4000), 1, 2)
+        self.assertEqual(slot, 3)
+        self.assertEqual(self.registry.read(slot), (seq, peer_id, bytes([10, 0, 0, 1]), 4000, 1, 2))
+        # Re-registration updates the record in place, with a new sequence
+        self.assertEqual(self.registry.publish(peer_id, ("10.0.0.2", 4001), 0, 1), (slot, seq + 2))
+        self.registry.withdraw(peer_id)
+        self.assertEqual(self.registry.find(peer_id), -1)
+        self.registry.withdraw(peer_id)
+        self.assert_empty()
+
+    def test_colliding_ids(self) -> None:
+        first, second, third = self.ids_with_home(5, 3)
+        self.publish(first, second, third)
+        self.assert_slots({first: 5, second: 6, third: 7})
+        self.assertEqual(self.registry.find(self.ids_with_home(5, 1)[0]), -1)
+
+        self.registry.withdraw(first)
+        self.assert_slots({second: 5, third: 6})
+        self.assertEqual(self.registry.read(7)[1], 0)
+        self.registry.withdraw(third)
+        self.registry.withdraw(second)
+        self.assert_empty()
+
+    def test_wrap_around(self) -> None:
+        first, second, third = self.ids_with_home(CAPACITY - 1, 3)
+        wrapped: int = self.ids_with_home(0, 1)[0]
+        self.publish(first, second, third, wrapped)
+        self.assert_slots({first: CAPACITY - 1, second: 0, third: 1, wrapped: 2})
+
+        self.registry.withdraw(first)
+        self.assert_slots({second: CAPACITY - 1, third: 0, wrapped: 1})
+        self.registry.withdraw(third)
+        self.assert_slots({second: CAPACITY - 1, wrapped: 0})
+        self.registry.withdraw(second)
+        self.registry.withdraw(wrapped)
+        self.assert_empty()
+
+    def test_delete_from_middle_of_chain(self) -> None:
+        first, second, last = self.ids_with_home(8, 3)
+        own_home: int = self.ids_with_home(10, 1)[0]
+        self.publish(first, second, own_home, last)
+        self.assert_slots({first: 8, second: 9, own_home: 10, last: 11})
+
+        # Record can't move in front of its home slot, the one behind it can
+        self.registry.withdraw(second)
+        self.assert_slots({first: 8, last: 9, own_home: 10})
+        self.assertEqual(self.registry.read(11)[1], 0)
+
+    def test_full_registry(self) -> None:
+        peer_ids: list = list(range(1, CAPACITY + 1))
+        self.publish(*peer_ids)
+        self.assertEqual(self.registry.publish(CAPACITY + 1, ("127.0.0.1", 1), 0, 1), (-1, 0))
+        self.assertEqual(self.registry.find(CAPACITY + 1), -1)
+        for peer_id in peer_ids:
+            self.registry.withdraw(peer_id)
+            self.assertEqual(self.registry.find(peer_id), -1)
+        self.assert_empty()
+
+    def test_churn_leaves_no_records(self) -> None:
+        for peer_id in range(1, 20 * CAPACITY):
+            self.publish(peer_id)
+            if peer_id > CAPACITY // 2:
+                self.registry.withdraw(peer_id - CAPACITY // 2)
+        for peer_id in range(19 * CAPACITY + CAPACITY // 2, 20 * CAPACITY):
+            self.assertGreaterEqual(self.registry.find(peer_id), 0)
+            self.registry.withdraw(peer_id)
+        self.assert_empty()
+
+    def test_dead_writer_does_not_hang_readers(self) -> None:
+        present: int = self.ids_with_home(2, 1)[0]
+        self.publish(present)
+        memory: SharedMemory = SharedMemory(name=self.registry.get_name())
+        self.addCleanup(memory.close)
+        # Writer died in the middle of a shift, and of writing the record after the present one
+        SHARED_REGISTRY_GENERATION.pack_into(memory.buf, 0, 1)
+        SHARED_PEER_SEQ.pack_into(memory.buf, SHARED_REGISTRY_GENERATION.size + 3 * SHARED_PEER_RECORD.size, 1)
+
+        self.assertEqual(self.registry.find(present), 2)
+        self.assertEqual(self.registry.find(self.ids_with_home(2, 1)[0]), -1)
+        self.assertEqual(self.registry.read(3)[0], 1)
+
+
+class YourTurnSharedPeerTableTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.registry = YourTurnSharedRegistry.create(multiprocessing.Lock(), CAPACITY)
+        self.addCleanup(self.registry.close, True)
+
+    def make_table(self, worker: int) -> YourTurnSharedPeerTable:
+        return YourTurnSharedPeerTable(self.registry, RelayStandIn(), worker)
+
+    def make_peer(self, peer_id: int, port: int) -> YourTurnPeer:
+        return YourTurnPeer(peer_id, "127.0.0.1", port, TransportStandIn().write, YourTurnPeerCounters())
+
+    def test_address_is_revalidated_after_re_registration_elsewhere(self) -> None:
+        first: YourTurnSharedPeerTable = self.make_table(1)
+        second: YourTurnSharedPeerTable = self.make_table(2)
+        first.add(5, self.make_peer(5, 40001))
+        self.assertEqual(second.get(5).get_addr(), ("127.0.0.1", 40001))
+        self.assertEqual(second.get_id_by_addr(("127.0.0.1", 40001)), 5)
+
+        # Peer comes back from another address through the other worker
+        second.add(5, self.make_peer(5, 40002))
+        self.assertIsNone(first.get_by_addr(("127.0.0.1", 40001)))
+        self.assertEqual(first.get_id_by_addr(("127.0.0.1", 40001)), -1)
+        self.assertEqual(first.get(5).get_addr(), ("127.0.0.1", 40002))
+        self.assertIs(first.get_by_addr(("127.0.0.1", 40002)), first.get(5))
+
+    def test_address_is_dropped_after_withdrawal_elsewhere(self) -> None:
+        first: YourTurnSharedPeerTable = self.make_table(1)
+        second: YourTurnSharedPeerTable = self.make_table(2)
+        second.add(7, self.make_peer(7, 40003))
+        self.assertEqual(first.get_id_by_addr(("127.0.0.1", 40003)), -1)
+        self.assertIsNotNone(first.get(7))
+        self.assertEqual(first.get_id_by_addr(("127.0.0.1", 40003)), 7)
+
+        second.remove(7)
+        self.assertIsNone(first.get_by_addr(("127.0.0.1", 40003)))
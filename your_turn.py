@@ -1,144 +1,998 @@
 import argparse
+import math
+import socket
 import struct
-from time import time
+from collections import deque
+from time import monotonic, monotonic_ns, time
 from typing import Callable
 
-from twisted.internet import reactor, task
+from twisted.internet import task
 from twisted.internet.protocol import DatagramProtocol
 
+from your_turn_backends import YOUR_TURN_BACKENDS, make_udp_socket, run_backend
+from your_turn_metrics import YourTurnMetrics, YourTurnMetricsServer, YourTurnPeerCounters
+from your_turn_logging import YourTurnLogger
+from your_turn_profiling import YourTurnProfiler
+from your_turn_snapshot import SNAPSHOT_PEER_BUNDLING, SNAPSHOT_PEER_VIA_DATA_PORT, YourTurnPeerSnapshot
+
 YOUR_TURN_PORT: int = 6969
+# Clients that registered on the main port can send raw payloads here, without any TURN encapsulation
+YOUR_TURN_DATA_PORT: int = 6968
 
 # Packet structure: UDP<TURN<prefix: uint16, sender/receiver id: uint32, Payload>>
 # When registering by having no data inside Payload field
 # the ID field represents the sender, if there is data in the Payload, then the ID represents the receiver
 TURN_MSG_PREFIX: int = 0xAA
 TURN_MSG_PREAMBLE_LEN: int = 6
+# Sent by the Relay to the Server, when the registration of the peer with the ID expired
+TURN_MSG_UNREGISTER_PREFIX: int = 0xAB
+# Registering with this prefix tells the Relay, that the peer can receive bundles. Packets with it carry a bundle
+# as their Payload: frames of the bundled datagrams, each being the length of the datagram followed by the datagram.
+TURN_MSG_BUNDLE_PREFIX: int = 0xAC
+TURN_BUNDLE_FRAME = struct.Struct(">H")
+# Sent by the Server with a group ID instead of a peer ID, the Relay sends the Payload to every member of the group
+TURN_MSG_GROUP_PREFIX: int = 0xAD
+# Sent by the Server to manage the group with the ID, Payload is the operation (uint8) followed by member IDs (uint32)
+TURN_MSG_GROUP_CONTROL_PREFIX: int = 0xAE
+TURN_GROUP_SET: int = 1  # Replaces the members of the group, creating it if needed
+TURN_GROUP_ADD: int = 2
+TURN_GROUP_DELETE: int = 3
+TURN_GROUP_OPERATION = struct.Struct(">B")
+# Echoed back by the Relay as is, without registering anything, so Middlemen can measure the RTT to it.
+# ID field carries the probe sequence & there is no Payload, so the echo can't be used for amplification.
+TURN_MSG_PROBE_PREFIX: int = 0xAF
+# Registering the Server with this prefix tells the Relay, that it takes the notifications about registered peers in
+# batches. Packets with it carry the batch as their Payload: records of the registered peers, collected over a tick.
+TURN_MSG_REGISTER_BATCH_PREFIX: int = 0xB0
+TURN_REGISTER_RECORD = struct.Struct(">LB")  # Peer ID, flags
+TURN_REGISTER_BUNDLING: int = 0x01  # Peer can receive bundles, same as a notification with the bundle prefix
+TURN_REGISTER_BATCH_MAX: int = 200  # Records per packet, so a batch fits into a single datagram
+# Sampled data packet, addressed like one with the normal prefix, but with a trace block in front of the Payload:
+# sequence number of the traced packets for the receiver, number of stamps & the stamps of the hops it passed.
+# Every hop adds its stamp with the monotonic time the packet came in & left, the receiving Middleman collects them.
+TURN_MSG_TRACE_PREFIX: int = 0xB1
+TURN_TRACE_HEADER = struct.Struct(">LB")  # Sequence number, number of stamps
+TURN_TRACE_STAMP = struct.Struct(">BQQ")  # Hop, ingress [ns], egress [ns]
+TURN_TRACE_HOP_MIDDLEMAN: int = 1
+TURN_TRACE_HOP_RELAY: int = 2
+TURN_TRACE_STAMPS_MAX: int = 8
+# Registering with this prefix tells the Relay, that the peer watches for its keep-alives, so their period can adapt.
+# Relay then sends the peer keep-alives with this prefix, their Payload is the period until the next one.
+TURN_MSG_KEEP_ALIVE_PREFIX: int = 0xB2
+TURN_KEEP_ALIVE_PERIOD = struct.Struct(">L")  # [ms]
+# Registering with this prefix tells the Relay, that the peer can talk to the other side directly. Once a Client & the
+# Server did, the Relay sends each of them the public address of the other one with this prefix & the ID of the other.
+TURN_MSG_DIRECT_PREFIX: int = 0xB3
+TURN_DIRECT_ADDR = struct.Struct(">4sH")  # IPv4 address, port
+# Sent by the Middlemen to each other, to open & keep the direct path between them, the ID is the sender ID.
+# Payload tells, whether the sender already received a probe from the receiver.
+TURN_MSG_DIRECT_PROBE_PREFIX: int = 0xB4
+TURN_DIRECT_PROBE = struct.Struct(">B")
+# Data packet protected by forward error correction, addressed like one with the normal prefix & forwarded untouched.
+# Payload starts with the FEC group sequence & the index of the packet in it, parity packets have the parity flag set
+# in the index, along with the number of data packets in the group. Only the receiving Middleman reads the FEC block.
+TURN_MSG_FEC_PREFIX: int = 0xB5
+TURN_FEC_HEADER = struct.Struct(">HB")  # Group sequence, index
+TURN_FEC_PARITY: int = 0x80
+# Data packet compressed by the sending Middleman, addressed like one with the normal prefix & forwarded untouched.
+# Payload is the ID of the dictionary, followed by the raw deflate stream of the original Payload.
+TURN_MSG_COMPRESSED_PREFIX: int = 0xB6
+# Dictionary offered by the sending Middleman for the compressed packets, addressed & forwarded the same way.
+# Payload is the dictionary ID followed by the dictionary, the receiver accepts it by returning just the ID.
+TURN_MSG_DICTIONARY_PREFIX: int = 0xB7
+TURN_DICTIONARY_ID = struct.Struct(">B")
+
+
+TURN_PREAMBLE = struct.Struct(">HL")
+TURN_MSG_ID_OFFSET: int = 2
+TURN_MSG_ID = struct.Struct(">L")
 
 
-def parse_turn_packet(turn_packet: bytes) -> tuple:
+def parse_turn_packet(turn_packet: bytes, expected_prefix: int = TURN_MSG_PREFIX) -> tuple:
     # TODO: Verify sender id is valid
     if len(turn_packet) < TURN_MSG_PREAMBLE_LEN:
         return ()
     
-    preamble = struct.unpack(">HL", turn_packet[:TURN_MSG_PREAMBLE_LEN])
-    prefix, peer_id = preamble
-    if prefix != TURN_MSG_PREFIX:
+    prefix, peer_id = TURN_PREAMBLE.unpack_from(turn_packet)
+    if prefix != expected_prefix:
         return ()
     
     return peer_id, turn_packet[TURN_MSG_PREAMBLE_LEN:]
 
 
-def make_turn_packet(id: int, payload: bytes = b"") -> bytes:
-    preamble: bytes = struct.pack(">HL", TURN_MSG_PREFIX, id)
-    return preamble + payload
+def parse_turn_message(turn_packet: bytes) -> tuple:
+    # Prefix, peer ID & Payload of a packet with any of the prefixes, empty if the packet isn't valid
+    if len(turn_packet) < TURN_MSG_PREAMBLE_LEN:
+        return ()
+
+    prefix, peer_id = TURN_PREAMBLE.unpack_from(turn_packet)
+    if prefix not in (
+        TURN_MSG_PREFIX,
+        TURN_MSG_UNREGISTER_PREFIX,
+        TURN_MSG_BUNDLE_PREFIX,
+        TURN_MSG_GROUP_PREFIX,
+        TURN_MSG_GROUP_CONTROL_PREFIX,
+        TURN_MSG_REGISTER_BATCH_PREFIX,
+        TURN_MSG_TRACE_PREFIX,
+        TURN_MSG_KEEP_ALIVE_PREFIX,
+        TURN_MSG_DIRECT_PREFIX,
+        TURN_MSG_DIRECT_PROBE_PREFIX,
+        TURN_MSG_FEC_PREFIX,
+        TURN_MSG_COMPRESSED_PREFIX,
+        TURN_MSG_DICTIONARY_PREFIX
+    ):
+        return ()
+
+    return prefix, peer_id, turn_packet[TURN_MSG_PREAMBLE_LEN:]
+
+
+def make_turn_packet(id: int, payload: bytes = b"", prefix: int = TURN_MSG_PREFIX) -> bytes:
+    return TURN_PREAMBLE.pack(prefix, id) + payload
+
+
+def make_turn_bundle_frame(datagram: bytes) -> bytes:
+    return TURN_BUNDLE_FRAME.pack(len(datagram)) + datagram
+
+
+def make_turn_group_control(group_id: int, operation: int, member_ids: list = ()) -> bytes:
+    payload: bytes = TURN_GROUP_OPERATION.pack(operation) + b"".join(TURN_MSG_ID.pack(member_id) for member_id in member_ids)
+    return make_turn_packet(group_id, payload, prefix=TURN_MSG_GROUP_CONTROL_PREFIX)
+
+
+def split_turn_bundle(bundle: bytes) -> list:
+    # Returns the bundled datagrams, a truncated frame ends the bundle
+    datagrams: list = []
+    offset: int = 0
+    while offset + TURN_BUNDLE_FRAME.size <= len(bundle):
+        size: int = TURN_BUNDLE_FRAME.unpack_from(bundle, offset)[0]
+        offset += TURN_BUNDLE_FRAME.size
+        if offset + size > len(bundle):
+            break
+        datagrams.append(bundle[offset:offset + size])
+        offset += size
+    return datagrams
+
+
+def make_turn_keep_alive(id: int, period: float) -> bytes:
+    return make_turn_packet(id, TURN_KEEP_ALIVE_PERIOD.pack(round(period * 1000)), prefix=TURN_MSG_KEEP_ALIVE_PREFIX)
+
+
+def make_turn_direct_offer(id: int, addr: tuple) -> bytes:
+    ip, port = addr
+    return make_turn_packet(id, TURN_DIRECT_ADDR.pack(socket.inet_aton(ip), port), prefix=TURN_MSG_DIRECT_PREFIX)
+
+
+def parse_turn_direct_addr(payload: bytes) -> tuple:
+    # (ip, port) offered by the Relay, empty if the Payload isn't valid
+    if len(payload) != TURN_DIRECT_ADDR.size:
+        return ()
+    ip, port = TURN_DIRECT_ADDR.unpack(payload)
+    return socket.inet_ntoa(ip), port
+
+
+def make_turn_trace_packet(id: int, sequence: int, stamps: list, payload: bytes) -> bytes:
+    trace: bytes = TURN_TRACE_HEADER.pack(sequence, len(stamps)) + b"".join(TURN_TRACE_STAMP.pack(*stamp) for stamp in stamps)
+    return TURN_PREAMBLE.pack(TURN_MSG_TRACE_PREFIX, id) + trace + payload
+
+
+def parse_turn_trace(payload: bytes) -> tuple:
+    # Sequence number, stamps & the Payload behind the trace block of a traced packet, empty if it isn't valid
+    if len(payload) < TURN_TRACE_HEADER.size:
+        return ()
+    sequence, stamp_count = TURN_TRACE_HEADER.unpack_from(payload)
+    end: int = TURN_TRACE_HEADER.size + stamp_count * TURN_TRACE_STAMP.size
+    if end > len(payload):
+        return ()
+    return sequence, list(TURN_TRACE_STAMP.iter_unpack(payload[TURN_TRACE_HEADER.size:end])), payload[end:]
+
+
+def add_turn_trace_stamp(turn_packet: bytes, hop: int, ingress: int) -> bytearray:
+    # Same traced packet with the stamp of the hop added behind the others, leaving now. None if the trace isn't valid.
+    if len(turn_packet) < TURN_MSG_PREAMBLE_LEN + TURN_TRACE_HEADER.size:
+        return None
+    sequence, stamp_count = TURN_TRACE_HEADER.unpack_from(turn_packet, TURN_MSG_PREAMBLE_LEN)
+    end: int = TURN_MSG_PREAMBLE_LEN + TURN_TRACE_HEADER.size + stamp_count * TURN_TRACE_STAMP.size
+    if stamp_count >= TURN_TRACE_STAMPS_MAX or end > len(turn_packet):
+        return None
+    stamped_packet = bytearray(turn_packet[:end])
+    TURN_TRACE_HEADER.pack_into(stamped_packet, TURN_MSG_PREAMBLE_LEN, sequence, stamp_count + 1)
+    stamped_packet += TURN_TRACE_STAMP.pack(hop, ingress, monotonic_ns())
+    stamped_packet += turn_packet[end:]
+    return stamped_packet
+
+
+def rewrite_turn_packet(turn_packet: bytes, id: int) -> bytearray:
+    # Same packet with the ID in the header replaced, copied only once
+    rewritten_packet = bytearray(turn_packet)
+    TURN_MSG_ID.pack_into(rewritten_packet, TURN_MSG_ID_OFFSET, id)
+    return rewritten_packet
+
+
+class YourTurnTimerWheel:
+    # Hashed timer wheel, each tick only visits the slot of timers that could be due, instead of all of them.
+    # Timers further away than one revolution share a slot with nearer ones & are skipped until their round comes.
+    def __init__(self, tick_period: float, slots: int = 512) -> None:
+        self._tick_period: float = tick_period
+        self._slots: list = [set() for _ in range(slots)]
+        self._deadlines: dict = {}  # key -> tick on which the timer is due
+        self._tick: int = 0
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, key) -> bool:
+        return key in self._deadlines
+
+    def schedule(self, key, delay: float) -> None:
+        # Rescheduling an already scheduled key moves its timer
+        self.cancel(key)
+        deadline: int = self._tick + max(1, math.ceil(delay / self._tick_period))
+        self._deadlines[key] = deadline
+        self._slots[deadline % len(self._slots)].add(key)
+
+    def cancel(self, key) -> None:
+        deadline: int = self._deadlines.pop(key, None)
+        if deadline is not None:
+            self._slots[deadline % len(self._slots)].discard(key)
+
+    def advance(self) -> list:
+        # Moves the wheel by one tick & returns the keys of timers that are due
+        self._tick += 1
+        slot: set = self._slots[self._tick % len(self._slots)]
+        due: list = [key for key in slot if self._deadlines[key] <= self._tick]
+        for key in due:
+            slot.discard(key)
+            del self._deadlines[key]
+        return due
+
+
+class YourTurnRateLimit:
+    # Token bucket limits of each peer except the server, a rate of 0 disables the limit.
+    # Buckets hold tokens for burst_time, which shouldn't be shorter than a tick, as the buckets refill on ticks.
+    MAX_PACKET_SIZE: int = 0xFFFF  # [B] Byte bucket always holds at least a packet, so big packets aren't blocked forever
+
+    def __init__(self, packets_per_s: float = 0, bytes_per_s: float = 0, burst_time: float = 1.0, defer: bool = False) -> None:
+        self.packet_rate: float = packets_per_s if packets_per_s > 0 else math.inf
+        self.byte_rate: float = bytes_per_s if bytes_per_s > 0 else math.inf
+        self.packet_burst: float = max(1.0, self.packet_rate * burst_time)
+        self.byte_burst: float = max(YourTurnRateLimit.MAX_PACKET_SIZE, self.byte_rate * burst_time)
+        self.defer: bool = defer  # Packets over the limit are delayed until the bucket refills, instead of dropped
+
+    def is_enabled(self) -> bool:
+        return self.packet_rate != math.inf or self.byte_rate != math.inf
 
 
 class YourTurnPeer:
-    STALE_TIME: float = 1.0  # [s]
+    # Peers are kept for every registered id, so keep records compact and store the address only once
+    __slots__ = (
+        "_id", "_addr", "_send", "_last_sent", "_last_received", "_counters", "_bundling",
+        "_packet_tokens", "_byte_tokens", "_refilled"
+    )
 
-    def __init__(self, ip: str, port: int, send_function: Callable) -> None:
-        self._ip: str = ip
-        self._port: int = port
+    # [s] Time without sending anything to the peer, after which a keep-alive is sent.
+    # Peers, that watch for the keep-alives, start with it & back off from there.
+    STALE_TIME: float = 1.0
+    # Monotonic time [s], cached by the relay on every tick, so the per-packet path doesn't have to read the clock
+    now: float = monotonic()
+
+    def __init__(self, id: int, ip: str, port: int, send_function: Callable, counters: YourTurnPeerCounters = None, bundling: bool = False) -> None:
+        self._id: int = id
+        self._addr: tuple = (ip, port)
         self._send: Callable = send_function  # Transport Function through which to send data to peer
+        self._counters: YourTurnPeerCounters = YourTurnPeerCounters() if counters is None else counters
+        self._bundling: bool = bundling  # Whether the peer can receive bundles
+
+        # Rate limit token buckets, which are filled up on the first packet
+        self._packet_tokens: float = 0
+        self._byte_tokens: float = 0
+        self._refilled: float = -math.inf  # [s]
+
+        self._last_sent: float = 0  # [s] When was the last packet sent
+        self._last_received: float = YourTurnPeer.now  # [s] When was the last packet received from the peer
 
-        self._last_packet: float = 0  # [s] When was the last packet sent
+    def get_id(self) -> int:
+        return self._id
 
     def get_addr(self) -> tuple:
-        return (self._ip, self._port)
-    
-    def is_stale(self) -> bool:
-        return (time() - self._last_packet) > YourTurnPeer.STALE_TIME
+        return self._addr
+
+    def get_send_function(self) -> Callable:
+        return self._send
+
+    def get_counters(self) -> YourTurnPeerCounters:
+        return self._counters
+
+    def is_bundling(self) -> bool:
+        return self._bundling
+
+    def get_send_idle_time(self) -> float:
+        return YourTurnPeer.now - self._last_sent
+
+    def get_receive_idle_time(self) -> float:
+        return YourTurnPeer.now - self._last_received
+
+    def set_receive_idle_time(self, idle_time: float) -> None:
+        self._last_received = YourTurnPeer.now - idle_time
+
+    def refresh(self, size: int) -> None:
+        # Record received message time & size
+        self._last_received = YourTurnPeer.now
+        counters: YourTurnPeerCounters = self._counters
+        counters.packets_in += 1
+        counters.bytes_in += size
     
+    def admit(self, size: int, rate_limit: YourTurnRateLimit) -> bool:
+        # Takes tokens for a packet from the peer, returns False if it's over the limit
+        now: float = YourTurnPeer.now
+        elapsed: float = now - self._refilled
+        if elapsed > 0:
+            self._refilled = now
+            self._packet_tokens = min(rate_limit.packet_burst, self._packet_tokens + elapsed * rate_limit.packet_rate)
+            self._byte_tokens = min(rate_limit.byte_burst, self._byte_tokens + elapsed * rate_limit.byte_rate)
+        if self._packet_tokens < 1 or self._byte_tokens < size:
+            return False
+        self._packet_tokens -= 1
+        self._byte_tokens -= size
+        return True
+
     def send(self, data: bytes) -> None:
-        # Record sent message time
-        self._last_packet = time()
-        self._send(data, self.get_addr())
+        # Record sent message time & size
+        self._last_sent = YourTurnPeer.now
+        counters: YourTurnPeerCounters = self._counters
+        counters.packets_out += 1
+        counters.bytes_out += len(data)
+        self._send(data, self._addr)
+
+
+# Registered peers, indexed both by ID and by address, so lookups don't depend on the number of peers
+class YourTurnPeerTable:
+    def __init__(self) -> None:
+        self._peers: dict = {}  # peer ID -> YourTurnPeer
+        self._peers_by_addr: dict = {}  # (ip, port) -> YourTurnPeer
+
+    def __len__(self) -> int:
+        return len(self._peers)
+
+    def __contains__(self, peer_id: int) -> bool:
+        return peer_id in self._peers
+
+    def __iter__(self):
+        return iter(self._peers)
+
+    def get(self, peer_id: int, default: YourTurnPeer = None) -> YourTurnPeer:
+        return self._peers.get(peer_id, default)
+
+    def is_owned(self, peer_id: int) -> bool:
+        # Whether this relay is responsible for keeping the peer alive & expiring it
+        return peer_id in self._peers
+
+    def get_local(self, peer_id: int) -> YourTurnPeer:
+        # Peer, that this relay sends to directly, not through another relay
+        return self.get(peer_id, None)
+
+    def get_by_addr(self, addr: tuple) -> YourTurnPeer:
+        return self._peers_by_addr.get(addr, None)
+
+    def get_id_by_addr(self, addr: tuple) -> int:
+        peer: YourTurnPeer = self._peers_by_addr.get(addr, None)
+        return -1 if peer is None else peer.get_id()
+
+    def add(self, peer_id: int, peer: YourTurnPeer) -> bool:
+        # Returns True if the ID was already registered and the old record got replaced
+        old_peer: YourTurnPeer = self._peers.get(peer_id, None)
+        if old_peer is not None:
+            self._unindex_addr(old_peer)
+        self._peers[peer_id] = peer
+        self._peers_by_addr[peer.get_addr()] = peer
+        return old_peer is not None
+
+    def remove(self, peer_id: int) -> YourTurnPeer:
+        peer: YourTurnPeer = self._peers.pop(peer_id, None)
+        if peer is not None:
+            self._unindex_addr(peer)
+        return peer
+
+    def _unindex_addr(self, peer: YourTurnPeer) -> None:
+        # Only drop the address entry if it wasn't since taken over by a different peer
+        addr: tuple = peer.get_addr()
+        if self._peers_by_addr.get(addr, None) is peer:
+            del self._peers_by_addr[addr]
+
+
+class YourTurnRelayDataPort(DatagramProtocol):
+    # Client ingress port, where senders are identified only by their address.
+    # Packets are forwarded to the server by prepending the pre-built header of the sender, without any parsing.
+    def __init__(self, relay: "YourTurnRelay", log: YourTurnLogger, verbose: bool = False) -> None:
+        super().__init__()
+
+        self._relay: YourTurnRelay = relay
+        self._log: YourTurnLogger = log
+        self._verbose: bool = verbose
+
+        # (ip, port) -> (registration packet of the sender, TURN header of its packets, YourTurnPeer)
+        self._senders_by_addr: dict = {}
+        self._addrs_by_id: dict = {}  # peer ID -> (ip, port)
+
+    def is_attached(self, peer_id: int) -> bool:
+        return peer_id in self._addrs_by_id
+
+    def attach(self, peer: YourTurnPeer, bundling: bool = False) -> None:
+        # Bundling senders send bundles without the TURN header, so they are forwarded with the bundle prefix
+        peer_id: int = peer.get_id()
+        self.detach(peer_id)
+        header: bytes = make_turn_packet(peer_id, prefix=TURN_MSG_BUNDLE_PREFIX if bundling else TURN_MSG_PREFIX)
+        self._senders_by_addr[peer.get_addr()] = (make_turn_packet(peer_id), header, peer)
+        self._addrs_by_id[peer_id] = peer.get_addr()
+
+    def detach(self, peer_id: int) -> None:
+        addr: tuple = self._addrs_by_id.pop(peer_id, None)
+        if addr is not None:
+            del self._senders_by_addr[addr]
+
+    def send(self, data: bytes, addr: tuple) -> None:
+        self.transport.write(data, addr)
+
+    def datagramReceived(self, data: bytes, addr: tuple) -> None:
+        if self._verbose and self._log.sample_trace():
+            self._log.trace(f"received {data.hex()} from {addr} on data port")
+
+        sender: tuple = self._senders_by_addr.get(addr, None)
+        if sender is None:
+            # Unknown address, the only thing accepted from it is a registration packet
+            self._relay.attach_data_peer(data, addr)
+            return
+        registration, header, peer = sender
+        peer.refresh(len(data))
+        if data == registration:
+            # Repeated registration renews the lease, confirm it again
+            peer.send(data)
+            return
+
+        server: YourTurnPeer = self._relay.get_server()
+        if server is None:
+            self._relay.get_metrics().increment("unknown_peer_drops")
+            return
+        rate_limit: YourTurnRateLimit = self._relay.get_rate_limit()
+        if rate_limit is not None and not peer.admit(len(data), rate_limit):
+            self._relay.throttle(peer, 1, header + data)
+            return
+        latency = self._relay.get_metrics().latency
+        start: float = latency.start()
+        server.send(header + data)
+        latency.stop(start)
 
 
 class YourTurnRelay(DatagramProtocol):
-    KEEP_ALIVE_PERIOD: float = 1.0  # [s]
+    TICK_PERIOD: float = 0.1  # [s]
+    # Registration of a peer expires, if nothing was received from it for this long
+    LEASE_TIME: float = 30.0  # [s]
+    GROUPS_MAX: int = 1024
+    DEFERRED_PACKETS_MAX: int = 64  # Packets over the rate limit, that are kept for a peer until its bucket refills
+    # Keep-alive period of the peers, that watch for the keep-alives, grows by the factor with each keep-alive, that
+    # didn't break the NAT binding, up to the ceiling. Breaking one shrinks the ceiling of the peer below the period.
+    KEEP_ALIVE_MAX: float = 15.0  # [s]
+    KEEP_ALIVE_BACKOFF: float = 2.0
+    METRICS_EVENTS: dict = {
+        "invalid_packets": "Packets, that aren't valid TURN packets",
+        "unknown_peer_drops": "Packets dropped, as the sender or receiver isn't registered",
+        "registrations": "Peer registrations",
+        "re_registrations": "Registrations replacing a registered peer with a new address",
+        "expirations": "Peers unregistered after their lease expired",
+        "unsupported_bundle_drops": "Bundles dropped, as the receiver can't split them",
+        "group_broadcasts": "Packets sent by the server to a group",
+        "group_drops": "Group packets dropped, as they weren't sent by the server, or the group doesn't exist",
+        "registration_batches": "Batches of registration notifications sent to the server",
+        "keep_alives": "Keep-alives sent to idle peers",
+        "binding_breaks": "Peers with adaptive keep-alives registering from a new address, which shrinks their period",
+        "direct_offers": "Public addresses exchanged between a Client & the Server, so they can talk directly",
+    }
 
-    def __init__(self, verbose: bool = False) -> None:
+    def __init__(self, verbose: bool = False, trace_sample: int = YourTurnLogger.TRACE_SAMPLE_PERIOD, rate_limit: YourTurnRateLimit = None, snapshot: YourTurnPeerSnapshot = None, keep_alive_max: float = KEEP_ALIVE_MAX, profile_dir: str = ".", profile_window: float = YourTurnProfiler.WINDOW) -> None:
         super().__init__()
 
         self._verbose: bool = verbose
+        # Verbose mode traces only every trace_sample-th packet
+        self._log = YourTurnLogger(trace_sample if verbose else 0)
 
-        self._peer_map: dict = {}
+        self._peer_map: YourTurnPeerTable = YourTurnPeerTable()
+        # Groups of the server, group ID -> IDs of the members, which don't have to be registered
+        self._groups: dict = {}
+        self._metrics = YourTurnMetrics(
+            "your_turn_relay",
+            YourTurnRelay.METRICS_EVENTS,
+            YourTurnMetrics.PEER_COUNTERS + YourTurnMetrics.RATE_LIMIT_COUNTERS
+        )
+        # Server isn't limited, so its packets always take the fast lane
+        self._rate_limit: YourTurnRateLimit = rate_limit if rate_limit is not None and rate_limit.is_enabled() else None
+        self._deferred: dict = {}  # sender ID -> deque of (receiver ID, packet) over the rate limit of the sender
+        # Leases of the peers kept across restarts, they are restored on the first tick, once the ports are open
+        self._snapshot: YourTurnPeerSnapshot = snapshot
+        self._is_restored: bool = snapshot is None
+        # Server takes registration notifications in batches, which are collected over a tick
+        self._is_server_batching: bool = False
+        self._pending_registrations: dict = {}  # peer ID -> TURN_REGISTER_* flags of the notification
+        self._keep_alive_max: float = max(YourTurnPeer.STALE_TIME, keep_alive_max)
+        # Peers watching for their keep-alives, peer ID -> [keep-alive period, ceiling of the period], kept by ID,
+        # so a new address of the peer is seen as a broken binding
+        self._keep_alive_periods: dict = {}
+        # Peers, that can talk to the other side directly, their addresses are offered to each other
+        self._direct_peers: set = set()
+        self._direct_server_addr: tuple = None  # Server address, that the direct Clients were last offered
+        self._metrics.add_gauge("peers", "Registered peers", lambda: len(self._peer_map))
+        self._metrics.add_gauge("keep_alive_share", "Share of keep-alives in the packets sent to peers", self.get_keep_alive_share)
+        # Only receives data if it is listening on a port
+        self._data_port: YourTurnRelayDataPort = YourTurnRelayDataPort(self, self._log, verbose=verbose)
+        # Keep-alive & lease deadlines of the registered peers, keyed by peer ID
+        self._keep_alive_timers = YourTurnTimerWheel(YourTurnRelay.TICK_PERIOD)
+        self._lease_timers = YourTurnTimerWheel(YourTurnRelay.TICK_PERIOD)
+        # Hot callbacks are timed, before anything takes a reference to them
+        self._profiler = YourTurnProfiler("your_turn_relay", YourTurnRelay.TICK_PERIOD, profile_dir, profile_window)
+        self._metrics.add_collector(self._profiler)
+        self.datagramReceived = self._profiler.wrap("datagramReceived", self.datagramReceived)
+        self._watchdog = self._profiler.wrap("_watchdog", self._watchdog)
         # This function is called periodically to make sure all peer connections stay alive
         self._keep_alive = task.LoopingCall(self._watchdog)
-        self._keep_alive.start(YourTurnRelay.KEEP_ALIVE_PERIOD, now=True)
-        # TODO: Implement optimized client transfer, by using a separate port for clients and avoiding packet parsing
-        # TODO: Lease server/client registration for a limited time if no data flow is detected
+
+    def startProtocol(self) -> None:
+        self._keep_alive.start(YourTurnRelay.TICK_PERIOD, now=True)
+
+    def stopProtocol(self) -> None:
+        if self._keep_alive.running:
+            self._keep_alive.stop()
+
+    def tick(self) -> None:
+        # Drives the keep-alive & lease timers, when the relay isn't run by the Twisted reactor
+        self._watchdog()
 
     def _watchdog(self) -> None:
-        for peer_id in self._peer_map:
-            peer: YourTurnPeer = self._peer_map[peer_id]
-            if not peer.is_stale():
+        YourTurnPeer.now = monotonic()
+        self._profiler.tick()
+        self._log.flush()
+        if self._pending_registrations:
+            self._notify_registrations()
+        if self._deferred:
+            self._release_deferred()
+
+        for peer_id in self._keep_alive_timers.advance():
+            peer: YourTurnPeer = self._peer_map.get(peer_id, None)
+            if peer is None or not self._peer_map.is_owned(peer_id):
+                continue
+            keep_alive_period: list = self._keep_alive_periods.get(peer_id, None)
+            period: float = YourTurnPeer.STALE_TIME if keep_alive_period is None else keep_alive_period[0]
+            idle_time: float = peer.get_send_idle_time()
+            if idle_time < period:
+                # Something was sent in the meantime, so postpone the keep-alive
+                self._keep_alive_timers.schedule(peer_id, period - idle_time)
+                continue
+            self._metrics.increment("keep_alives")
+            if keep_alive_period is None:
+                peer.send(make_turn_packet(peer_id))
+            else:
+                period = min(period * YourTurnRelay.KEEP_ALIVE_BACKOFF, keep_alive_period[1])
+                keep_alive_period[0] = period
+                peer.send(make_turn_keep_alive(peer_id, period))
+            self._keep_alive_timers.schedule(peer_id, period)
+
+        for peer_id in self._lease_timers.advance():
+            peer: YourTurnPeer = self._peer_map.get(peer_id, None)
+            if peer is None or not self._peer_map.is_owned(peer_id):
+                continue
+            idle_time: float = peer.get_receive_idle_time()
+            if idle_time < YourTurnRelay.LEASE_TIME:
+                self._lease_timers.schedule(peer_id, YourTurnRelay.LEASE_TIME - idle_time)
+                # Snapshot is only updated once per lease, when the lease would have expired otherwise
+                if self._snapshot is not None:
+                    self._snapshot.renew(peer_id, time() + YourTurnRelay.LEASE_TIME - idle_time)
                 continue
-            peer.send(make_turn_packet(peer_id))
+            self._metrics.increment("expirations")
+            self.unregister_peer(peer_id)
+
+        if not self._is_restored:
+            # Restored after the timers moved, so the keep-alives go out on the next tick, once all ports are open
+            self._restore_snapshot()
+
+    def set_peer_map(self, peer_map: YourTurnPeerTable) -> None:
+        self._peer_map = peer_map
+
+    def get_data_port(self) -> YourTurnRelayDataPort:
+        return self._data_port
+
+    def get_metrics(self) -> YourTurnMetrics:
+        return self._metrics
+
+    def get_logger(self) -> YourTurnLogger:
+        return self._log
+
+    def get_keep_alive_share(self) -> float:
+        packets_out: int = self._metrics.get_total("packets_out")
+        return self._metrics.get_event_count("keep_alives") / packets_out if packets_out > 0 else 0.0
+
+    def get_rate_limit(self) -> YourTurnRateLimit:
+        return self._rate_limit
+
+    def throttle(self, sender: YourTurnPeer, receiver_id: int, packet: bytes) -> None:
+        # Handles a packet over the rate limit of the sender
+        counters: YourTurnPeerCounters = sender.get_counters()
+        if self._rate_limit.defer:
+            deferred: deque = self._deferred.get(sender.get_id(), None)
+            if deferred is None:
+                deferred = deque()
+                self._deferred[sender.get_id()] = deferred
+            if len(deferred) < YourTurnRelay.DEFERRED_PACKETS_MAX:
+                deferred.append((receiver_id, bytes(packet)))
+                counters.packets_deferred += 1
+                return
+        counters.packets_dropped += 1
+        counters.bytes_dropped += len(packet)
+
+    def _release_deferred(self) -> None:
+        # Each sender is only limited by its own bucket, so a flooding sender doesn't delay the others
+        for sender_id in list(self._deferred):
+            deferred: deque = self._deferred[sender_id]
+            sender: YourTurnPeer = self._peer_map.get(sender_id, None)
+            while sender is not None and deferred and sender.admit(len(deferred[0][1]), self._rate_limit):
+                receiver_id, packet = deferred.popleft()
+                receiver: YourTurnPeer = self._peer_map.get(receiver_id, None)
+                if receiver is not None:
+                    receiver.send(packet)
+            if sender is None or not deferred:
+                del self._deferred[sender_id]
+
+    def get_server(self) -> YourTurnPeer:
+        return self._peer_map.get(1, None)
+
+    def get_profiler(self) -> YourTurnProfiler:
+        return self._profiler
 
     def get_peer_id_by_addr(self, addr: tuple) -> int:
-        for peer_id in self._peer_map:
-            peer = self._peer_map[peer_id]
-            if peer.get_addr() == addr:
-                return peer_id
-        return -1
+        return self._peer_map.get_id_by_addr(addr)
 
     def datagramReceived(self, data, addr) -> None:
-        if self._verbose:
-            print(f"received {data.hex()} from {addr}")
+        is_traced: bool = self._verbose and self._log.sample_trace()
+        if is_traced:
+            self._log.trace(f"received {data.hex()} from {addr}")
         
-        sender_ip, sender_port = addr
-        parsed_packet = parse_turn_packet(data)
-        if parsed_packet == ():
-            print("Invalid packet received!")
+        # Payload is never needed by the relay, so only the header is parsed
+        if len(data) < TURN_MSG_PREAMBLE_LEN:
+            prefix: int = -1
+        else:
+            prefix, peer_id = TURN_PREAMBLE.unpack_from(data)
+        ingress: int = 0
+        if prefix == TURN_MSG_TRACE_PREFIX and len(data) > TURN_MSG_PREAMBLE_LEN:
+            # Forwarded like any data packet, only with the stamp of the Relay added
+            ingress = monotonic_ns()
+        elif (
+            prefix == TURN_MSG_FEC_PREFIX or prefix == TURN_MSG_COMPRESSED_PREFIX or prefix == TURN_MSG_DICTIONARY_PREFIX
+        ) and len(data) > TURN_MSG_PREAMBLE_LEN:
+            # Forwarded like any data packet, the Payload is only read by the receiving Middleman
+            pass
+        elif prefix != TURN_MSG_PREFIX and prefix != TURN_MSG_BUNDLE_PREFIX:
+            if prefix == TURN_MSG_GROUP_PREFIX or prefix == TURN_MSG_GROUP_CONTROL_PREFIX:
+                self._received_group_packet(prefix, peer_id, data, addr)
+                return
+            if prefix == TURN_MSG_PROBE_PREFIX and len(data) == TURN_MSG_PREAMBLE_LEN:
+                self.transport.write(data, addr)
+                return
+            if prefix == TURN_MSG_KEEP_ALIVE_PREFIX and len(data) == TURN_MSG_PREAMBLE_LEN:
+                # Follows the normal registration, so older Relays ignore it as an invalid packet
+                peer: YourTurnPeer = self._peer_map.get_local(peer_id)
+                if peer is not None and peer.get_addr() == addr:
+                    self._adapt_keep_alive(peer)
+                    return
+            if prefix == TURN_MSG_DIRECT_PREFIX and len(data) == TURN_MSG_PREAMBLE_LEN:
+                # Follows the normal registration, so older Relays ignore it as an invalid packet
+                peer: YourTurnPeer = self._peer_map.get_local(peer_id)
+                if peer is not None and peer.get_addr() == addr:
+                    self._offer_direct(peer)
+                    return
+            if prefix == TURN_MSG_REGISTER_BATCH_PREFIX and len(data) == TURN_MSG_PREAMBLE_LEN and peer_id == 1:
+                # Follows the normal registration of the Server, so older Relays ignore it as an invalid packet
+                server: YourTurnPeer = self._peer_map.get(1, None)
+                if server is not None and server.get_addr() == addr:
+                    self._is_server_batching = True
+                    return
+            self._metrics.increment("invalid_packets")
+            self._log.log("invalid_packet", "Invalid packet received from {}:{}!", *addr)
             return
-        peer_id, payload = parsed_packet
         
-        if len(payload) <= 0:
-            self.register_peer(peer_id, addr)
+        if len(data) == TURN_MSG_PREAMBLE_LEN:
+            self.register_peer(peer_id, addr, bundling=prefix == TURN_MSG_BUNDLE_PREFIX)
         else:
             peer: YourTurnPeer = self._peer_map.get(peer_id, None)
             if peer is None:
-                print(f"Invalid peer ID {peer_id}")
+                self._metrics.increment("unknown_peer_drops")
+                self._log.log("invalid_peer_id", "Invalid peer ID {}", peer_id)
+                return
+            if prefix == TURN_MSG_BUNDLE_PREFIX and not peer.is_bundling():
+                self._metrics.increment("unsupported_bundle_drops")
+                self._log.log("unsupported_bundle", "Peer {} can't receive bundles", peer_id)
                 return
             
-            if self._verbose:
+            if is_traced:
+                sender_ip, sender_port = addr
                 peer_ip, peer_port = peer.get_addr()
-                print(f"{sender_ip}:{sender_port}\t-> {peer_ip}:{peer_port}")
+                self._log.trace(f"{sender_ip}:{sender_port}\t-> {peer_ip}:{peer_port}")
             
+            sender: YourTurnPeer = self._peer_map.get_by_addr(addr)
+            if sender is not None:
+                sender.refresh(len(data))
+            latency = self._metrics.latency
+            start: float = latency.start()
             if peer_id != 1:
-                peer.send(data)
+                packet: bytes = data
             else:
-                sender_id = self.get_peer_id_by_addr(addr)
-                if sender_id <= 0:
-                    print("Sender not yet registered!")
+                if sender is None:
+                    self._metrics.increment("unknown_peer_drops")
+                    self._log.log("sender_not_registered", "Sender {}:{} not yet registered!", *addr)
                     return
-                peer.send(make_turn_packet(sender_id, payload))
+                # Replace the receiver ID with the sender ID, so the server knows who the packet is from
+                packet = rewrite_turn_packet(data, sender.get_id())
+            if (
+                self._rate_limit is not None
+                and sender is not None
+                and sender.get_id() != 1
+                and not sender.admit(len(data), self._rate_limit)
+            ):
+                self.throttle(sender, peer_id, packet)
+                return
+            if ingress:
+                packet = add_turn_trace_stamp(packet, TURN_TRACE_HOP_RELAY, ingress)
+                if packet is None:
+                    self._metrics.increment("invalid_packets")
+                    self._log.log("invalid_trace", "Invalid trace from {}:{}!", *addr)
+                    return
+            peer.send(packet)
+            latency.stop(start)
     
-    def register_peer(self, id: int, registerer_addr: tuple) -> None:
-        # TODO: Disallow reregistration if id lease is still valid
-        is_registered: bool = id in self._peer_map
+    def _received_group_packet(self, prefix: int, group_id: int, data: bytes, addr: tuple) -> None:
+        # Only the server can send to & manage groups
+        sender: YourTurnPeer = self._peer_map.get_by_addr(addr)
+        if sender is None or sender.get_id() != 1:
+            self._metrics.increment("group_drops")
+            self._log.log("group_sender", "Group packet from {}:{}, which isn't the server!", *addr)
+            return
+        sender.refresh(len(data))
+        if prefix == TURN_MSG_GROUP_CONTROL_PREFIX:
+            self._control_group(group_id, data[TURN_MSG_PREAMBLE_LEN:])
+            return
+
+        members: set = self._groups.get(group_id, None)
+        if members is None:
+            self._metrics.increment("group_drops")
+            self._log.log("unknown_group", "Unknown group {}", group_id)
+            return
+        self._metrics.increment("group_broadcasts")
+        latency = self._metrics.latency
+        start: float = latency.start()
+        # Packet is copied once, only its header is rewritten for each of the members
+        packet = bytearray(data)
+        for member_id in members:
+            peer: YourTurnPeer = self._peer_map.get(member_id, None)
+            if peer is None:
+                continue
+            TURN_PREAMBLE.pack_into(packet, 0, TURN_MSG_PREFIX, member_id)
+            peer.send(packet)
+        latency.stop(start)
+
+    def _control_group(self, group_id: int, payload: bytes) -> None:
+        if len(payload) < TURN_GROUP_OPERATION.size or (len(payload) - TURN_GROUP_OPERATION.size) % TURN_MSG_ID.size != 0:
+            self._metrics.increment("invalid_packets")
+            self._log.log("invalid_group_control", "Invalid group control packet for group {}", group_id)
+            return
+        operation: int = TURN_GROUP_OPERATION.unpack_from(payload)[0]
+        member_ids: list = [member_id for (member_id,) in TURN_MSG_ID.iter_unpack(payload[TURN_GROUP_OPERATION.size:])]
+        if operation == TURN_GROUP_DELETE:
+            self._groups.pop(group_id, None)
+            return
+        if group_id not in self._groups and len(self._groups) >= YourTurnRelay.GROUPS_MAX:
+            self._log.log("groups_max", "Group limit of {} reached!", YourTurnRelay.GROUPS_MAX)
+            return
+        if operation == TURN_GROUP_SET:
+            self._groups[group_id] = set(member_ids)
+        elif operation == TURN_GROUP_ADD:
+            self._groups.setdefault(group_id, set()).update(member_ids)
+        else:
+            self._log.log("invalid_group_control", "Unknown group operation {}", operation)
+
+    def register_peer(self, id: int, registerer_addr: tuple, bundling: bool = False) -> None:
+        # Peers that can receive bundles register twice, first normally, so older Relays still register them
+        peer: YourTurnPeer = self._peer_map.get(id, None)
+        if peer is not None and peer.get_addr() == registerer_addr and (peer.is_bundling() or not bundling):
+            # Re-registration from the same address only renews the lease
+            peer.refresh(TURN_MSG_PREAMBLE_LEN)
+            if self._snapshot is not None:
+                # Renewals are rare, so the snapshot doesn't lag behind the lease of a peer that stayed active
+                self._snapshot.renew(id, time() + YourTurnRelay.LEASE_TIME)
+            peer.send(self._make_registration_echo(peer))
+            return
+
         # Server doesn't need to know about it's own registration
         if id != 1:
             # Notify server of the registered peer
             server: YourTurnPeer = self._peer_map.get(1, None)
             if server is None:
-                print("Server not yet registered!")
+                self._log.log("server_not_registered", "Server not yet registered!")
                 return
-            server.send(make_turn_packet(id))
+            # Server is only told about peers, that it can send bundles to, if it can receive them itself
+            server_bundling: bool = bundling and server.is_bundling()
+            if self._is_server_batching:
+                # Wave of reconnecting peers then costs the Server one packet per tick
+                self._pending_registrations[id] = TURN_REGISTER_BUNDLING if server_bundling else 0
+            else:
+                server.send(make_turn_packet(id, prefix=TURN_MSG_BUNDLE_PREFIX if server_bundling else TURN_MSG_PREFIX))
+        else:
+            # Server from a new address has to ask for batches again
+            self._is_server_batching = False
         
+        keep_alive_period: list = self._keep_alive_periods.get(id, None)
+        if peer is not None and keep_alive_period is not None and peer.get_addr() != registerer_addr:
+            # NAT binding broke after being idle for the period, while the previous period was still fine
+            keep_alive_period[1] = max(YourTurnPeer.STALE_TIME, keep_alive_period[0] / YourTurnRelay.KEEP_ALIVE_BACKOFF)
+            keep_alive_period[0] = keep_alive_period[1]
+            self._metrics.increment("binding_breaks")
+            self._log.log("binding_break", "Peer {} lost its binding, keep-alive period shrinks to {}s", id, keep_alive_period[0])
+
         ip, port = registerer_addr
-        print(f"Peer {id}[{ip}:{port}] {'re-' if is_registered else ''}registered")
-        peer = YourTurnPeer(ip, port, self.transport.write)
-        self._peer_map[id] = peer
+        # Registering on the main port reverts the peer from the data port
+        self._data_port.detach(id)
+        peer = YourTurnPeer(id, ip, port, self.transport.write, self._metrics.get_peer_counters(id), bundling)
+        peer.refresh(TURN_MSG_PREAMBLE_LEN)
+        is_registered: bool = self._peer_map.add(id, peer)
+        self._metrics.increment("re_registrations" if is_registered else "registrations")
+        self._start_timers(id)
+        self._store_snapshot(peer, 0)
+        self._log.log("registration", "Peer {}[{}:{}] {}registered", id, ip, port, "re-" if is_registered else "")
         # Confirm registration by echoing back
         # NOTE: This mostly servers as a connection-confirmation package, as some routers will drop the
         # connection if no data is received back within a given time-frame
-        peer.send(make_turn_packet(id))
+        peer.send(self._make_registration_echo(peer))
+
+    def _adapt_keep_alive(self, peer: YourTurnPeer) -> None:
+        # Period is kept, if the peer asks again, e.g. when renewing its lease, or after its binding broke
+        peer_id: int = peer.get_id()
+        keep_alive_period: list = self._keep_alive_periods.get(peer_id, None)
+        if keep_alive_period is None:
+            keep_alive_period = [YourTurnPeer.STALE_TIME, self._keep_alive_max]
+            self._keep_alive_periods[peer_id] = keep_alive_period
+        # Peer learns the period right away, so it knows when to expect the next keep-alive
+        peer.send(make_turn_keep_alive(peer_id, keep_alive_period[0]))
+        self._keep_alive_timers.schedule(peer_id, keep_alive_period[0])
+
+    def _offer_direct(self, peer: YourTurnPeer) -> None:
+        # Clients ask again with every lease renewal, which also offers them the current address of the Server.
+        # Server is only offered all the Clients, when it asks from a new address.
+        # NOTE: Only peers of this Relay are offered, a cluster node doesn't know the addresses of the remote ones
+        peer_id: int = peer.get_id()
+        self._direct_peers.add(peer_id)
+        server: YourTurnPeer = self._peer_map.get_local(1)
+        if server is None or 1 not in self._direct_peers:
+            return
+        if peer_id != 1:
+            self._send_direct_offer(peer, server)
+            return
+        if server.get_addr() == self._direct_server_addr:
+            return
+        self._direct_server_addr = server.get_addr()
+        for client_id in self._direct_peers:
+            client: YourTurnPeer = self._peer_map.get_local(client_id)
+            if client_id != 1 and client is not None:
+                self._send_direct_offer(client, server)
+
+    def _send_direct_offer(self, client: YourTurnPeer, server: YourTurnPeer) -> None:
+        client.send(make_turn_direct_offer(1, server.get_addr()))
+        server.send(make_turn_direct_offer(client.get_id(), client.get_addr()))
+        self._metrics.increment("direct_offers")
+
+    def _notify_registrations(self) -> None:
+        records: list = [TURN_REGISTER_RECORD.pack(peer_id, flags) for peer_id, flags in self._pending_registrations.items()]
+        self._pending_registrations.clear()
+        server: YourTurnPeer = self._peer_map.get(1, None)
+        if server is None:
+            return
+        for start in range(0, len(records), TURN_REGISTER_BATCH_MAX):
+            batch: bytes = b"".join(records[start:start + TURN_REGISTER_BATCH_MAX])
+            server.send(make_turn_packet(1, batch, prefix=TURN_MSG_REGISTER_BATCH_PREFIX))
+            self._metrics.increment("registration_batches")
+
+    def _make_registration_echo(self, peer: YourTurnPeer) -> bytes:
+        # Echo with the bundle prefix tells the peer, that it can send bundles, which needs the server to split them
+        peer_id: int = peer.get_id()
+        if peer.is_bundling() and (peer_id == 1 or self._is_server_bundling()):
+            return make_turn_packet(peer_id, prefix=TURN_MSG_BUNDLE_PREFIX)
+        return make_turn_packet(peer_id)
+
+    def _is_server_bundling(self) -> bool:
+        server: YourTurnPeer = self._peer_map.get(1, None)
+        return server is not None and server.is_bundling()
     
-    # def unregister_peer(peer_id: int) -> None:
-    #     pass
+    def attach_data_peer(self, registration_packet: bytes, data_addr: tuple) -> None:
+        parsed_packet = parse_turn_packet(registration_packet)
+        if parsed_packet == () or len(parsed_packet[1]) > 0:
+            self._metrics.increment("unknown_peer_drops")
+            self._log.log("unregistered_data_addr", "Data received from an unregistered address {}:{} on data port!", *data_addr)
+            return
+        peer_id, _ = parsed_packet
+        registered_peer: YourTurnPeer = self._peer_map.get_local(peer_id)
+        if peer_id == 1 or registered_peer is None:
+            self._metrics.increment("unknown_peer_drops")
+            self._log.log("unregistered_data_peer", "Peer {} has to be registered before using the data port!", peer_id)
+            return
+
+        ip, port = data_addr
+        self._log.log("data_port_attach", "Peer {}[{}:{}] attached to data port", peer_id, ip, port)
+        # All further traffic to the peer goes out through the data port, so the NAT binding of the peer is reused
+        bundling: bool = registered_peer.is_bundling()
+        peer = YourTurnPeer(peer_id, ip, port, self._data_port.send, self._metrics.get_peer_counters(peer_id), bundling)
+        peer.refresh(TURN_MSG_PREAMBLE_LEN)
+        self._peer_map.add(peer_id, peer)
+        # Peer sends bundles, if its registration echo told it the server can split them
+        self._data_port.attach(peer, bundling=bundling and self._is_server_bundling())
+        self._start_timers(peer_id)
+        self._store_snapshot(peer, SNAPSHOT_PEER_VIA_DATA_PORT)
+        # Confirm attachment by echoing back from the data port
+        peer.send(make_turn_packet(peer_id))
+
+    def unregister_peer(self, peer_id: int) -> None:
+        peer: YourTurnPeer = self._peer_map.remove(peer_id)
+        self._data_port.detach(peer_id)
+        self._keep_alive_timers.cancel(peer_id)
+        self._lease_timers.cancel(peer_id)
+        self._deferred.pop(peer_id, None)
+        self._pending_registrations.pop(peer_id, None)
+        self._keep_alive_periods.pop(peer_id, None)
+        self._direct_peers.discard(peer_id)
+        if peer_id == 1:
+            self._direct_server_addr = None
+        self._metrics.retire_peer(peer_id)
+        if self._snapshot is not None:
+            self._snapshot.remove(peer_id)
+        if peer is None:
+            return
+
+        ip, port = peer.get_addr()
+        self._log.log("unregistration", "Peer {}[{}:{}] unregistered", peer_id, ip, port)
+        # Let the server release its resources for the peer
+        server: YourTurnPeer = self._peer_map.get(1, None)
+        if peer_id != 1 and server is not None:
+            server.send(make_turn_packet(peer_id, prefix=TURN_MSG_UNREGISTER_PREFIX))
+
+    def _store_snapshot(self, peer: YourTurnPeer, flags: int) -> None:
+        if self._snapshot is None:
+            return
+        if peer.is_bundling():
+            flags |= SNAPSHOT_PEER_BUNDLING
+        if not self._snapshot.store(peer.get_id(), peer.get_addr(), flags, time() + YourTurnRelay.LEASE_TIME):
+            self._log.log("snapshot_full", "Peer snapshot is full!")
+
+    def _restore_snapshot(self) -> None:
+        # Peers get a keep-alive on the next tick, which refreshes their NAT bindings before they notice the restart
+        self._is_restored = True
+        now: float = time()
+        data_peers: list = []
+        for peer_id, ip, port, flags, expiry in self._snapshot.read():
+            if expiry <= now:
+                self._snapshot.remove(peer_id)
+                continue
+            send_function: Callable = self._data_port.send if flags & SNAPSHOT_PEER_VIA_DATA_PORT else self.transport.write
+            counters: YourTurnPeerCounters = self._metrics.get_peer_counters(peer_id)
+            peer = YourTurnPeer(peer_id, ip, port, send_function, counters, bool(flags & SNAPSHOT_PEER_BUNDLING))
+            # Peer keeps the rest of its lease, as if it was last heard from when the lease was renewed
+            lease_time: float = min(expiry - now, YourTurnRelay.LEASE_TIME)
+            peer.set_receive_idle_time(YourTurnRelay.LEASE_TIME - lease_time)
+            self._peer_map.add(peer_id, peer)
+            self._start_timers(peer_id, lease_time)
+            self._keep_alive_timers.schedule(peer_id, 0)
+            if flags & SNAPSHOT_PEER_VIA_DATA_PORT:
+                data_peers.append(peer)
+        # Server has to be restored first, as data port senders only send bundles, if it can split them
+        for peer in data_peers:
+            self._data_port.attach(peer, bundling=peer.is_bundling() and self._is_server_bundling())
+        print(f"Restored {len(self._peer_map)} peers from the snapshot")
+
+    def _start_timers(self, peer_id: int, lease_time: float = LEASE_TIME) -> None:
+        keep_alive_period: list = self._keep_alive_periods.get(peer_id, None)
+        self._keep_alive_timers.schedule(peer_id, YourTurnPeer.STALE_TIME if keep_alive_period is None else keep_alive_period[0])
+        self._lease_timers.schedule(peer_id, lease_time)
 
 
 if __name__ == '__main__':
@@ -147,9 +1001,65 @@ if __name__ == '__main__':
         description="Your TURN (Traversal Using Relays around NAT) server"
     )
     arg_parser.add_argument("-p", "--port", type=int, default=YOUR_TURN_PORT)
-    arg_parser.add_argument("-v", "--verbose", action="store_true")
+    arg_parser.add_argument("-d", "--data-port", type=int, default=YOUR_TURN_DATA_PORT, help="Client data port, 0 disables it")
+    arg_parser.add_argument("-w", "--workers", type=int, default=1, help="Number of relay processes sharing the port")
+    arg_parser.add_argument("-b", "--backend", choices=YOUR_TURN_BACKENDS, default="twisted", help="I/O backend")
+    arg_parser.add_argument("-m", "--metrics-port", type=int, default=0, help="Local Prometheus metrics port, 0 disables it")
+    arg_parser.add_argument("--rate-limit-packets", type=float, default=0, help="Packets per second of each client, 0 disables it")
+    arg_parser.add_argument("--rate-limit-bytes", type=float, default=0, help="Bytes per second of each client, 0 disables it")
+    arg_parser.add_argument("--rate-limit-burst", type=float, default=1.0, help="Time the rate limit can be exceeded for [s]")
+    arg_parser.add_argument("--rate-limit-defer", action="store_true", help="Delay packets over the rate limit instead of dropping them")
+    arg_parser.add_argument("-c", "--cluster-port", type=int, default=0, help="Port of the link to the other cluster nodes, 0 disables clustering")
+    arg_parser.add_argument("-n", "--cluster-nodes", nargs="*", default=[], help="host:port links of the other cluster nodes")
+    arg_parser.add_argument("-k", "--keep-alive-max", type=float, default=YourTurnRelay.KEEP_ALIVE_MAX, help="Ceiling of the adaptive keep-alive period [s]")
+    arg_parser.add_argument("-s", "--snapshot", default="", help="File keeping the peer leases across restarts")
+    arg_parser.add_argument("--profile-dir", default=".", help="Directory of the profiles, SIGUSR1 starts & stops profiling")
+    arg_parser.add_argument("--profile-window", type=float, default=YourTurnProfiler.WINDOW, help="Profiling stops on its own after this long [s]")
+    arg_parser.add_argument("-v", "--verbose", action="store_true", help="Trace relayed packets")
+    arg_parser.add_argument("-t", "--trace-sample", type=int, default=YourTurnLogger.TRACE_SAMPLE_PERIOD, help="Trace only every N-th packet")
     args = arg_parser.parse_args()
+    if args.cluster_port > 0 and args.workers > 1:
+        arg_parser.error("Cluster nodes run a single worker")
+    if args.snapshot and args.workers > 1:
+        arg_parser.error("Workers share their peers in memory only, a snapshot needs a single worker")
+    rate_limit = YourTurnRateLimit(args.rate_limit_packets, args.rate_limit_bytes, args.rate_limit_burst, args.rate_limit_defer)
+
+    if args.workers > 1:
+        from your_turn_workers import run_workers
+
+        print(f"Starting {args.workers} TURN server workers on port {args.port}")
+        run_workers(
+            args.workers,
+            args.port,
+            args.data_port,
+            backend=args.backend,
+            metrics_port=args.metrics_port,
+            verbose=args.verbose,
+            trace_sample=args.trace_sample,
+            rate_limit=rate_limit,
+            keep_alive_max=args.keep_alive_max,
+            profile_dir=args.profile_dir,
+            profile_window=args.profile_window
+        )
+        exit()
+
+    snapshot = YourTurnPeerSnapshot(args.snapshot) if args.snapshot else None
+    relay = YourTurnRelay(verbose=args.verbose, trace_sample=args.trace_sample, rate_limit=rate_limit, snapshot=snapshot, keep_alive_max=args.keep_alive_max, profile_dir=args.profile_dir, profile_window=args.profile_window)
+    relay.get_profiler().install_signal()
+    endpoints: list = [(make_udp_socket(args.port), relay)]
+    print(f"Started TURN server on port {args.port} with {args.backend} backend")
+    if args.data_port > 0:
+        endpoints.append((make_udp_socket(args.data_port), relay.get_data_port()))
+        print(f"Accepting client data on port {args.data_port}")
+    ticks: list = [relay.tick]
+    if args.cluster_port > 0:
+        from your_turn_cluster import YourTurnClusterLink, parse_cluster_node
 
-    reactor.listenUDP(args.port, YourTurnRelay(verbose=args.verbose))
-    print(f"Started TURN server on port {args.port}")
-    reactor.run()
+        link = YourTurnClusterLink(relay, [parse_cluster_node(node) for node in args.cluster_nodes])
+        endpoints.append((make_udp_socket(args.cluster_port), link))
+        ticks.append(link.tick)
+        print(f"Linked to {len(args.cluster_nodes)} cluster nodes on port {args.cluster_port}")
+    if args.metrics_port > 0:
+        YourTurnMetricsServer(relay.get_metrics(), args.metrics_port).start()
+        print(f"Serving metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+    run_backend(args.backend, endpoints, lambda: [tick() for tick in ticks], YourTurnRelay.TICK_PERIOD)
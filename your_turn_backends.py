@@ -0,0 +1,274 @@
+import sys
+import errno
+import socket
+import asyncio
+import ctypes
+import selectors
+from time import monotonic
+from types import SimpleNamespace
+from typing import Callable
+
+# I/O backends the Relay can run on. Each of them is given already bound sockets & the Twisted style protocols
+# handling them (with a transport.write(data, addr) & datagramReceived(data, addr)), so the wire protocol is the same.
+YOUR_TURN_BACKENDS: tuple = ("twisted", "asyncio", "batched")
+
+
+def make_udp_socket(port: int, reuse_port: bool = False) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reuse_port:
+        # Every worker binds its own socket to the same port, the kernel then spreads the packets between them
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.setblocking(False)
+    sock.bind(("", port))
+    return sock
+
+
+def run_twisted(endpoints: list, tick: Callable, tick_period: float) -> None:
+    from twisted.internet import reactor
+
+    for sock, protocol in endpoints:
+        reactor.adoptDatagramPort(sock.fileno(), socket.AF_INET, protocol)
+        # Reactor uses its own duplicate of the socket
+        sock.close()
+    # NOTE: Twisted protocols run their own timers once they start listening
+    reactor.run()
+
+
+class YourTurnAsyncioProtocol(asyncio.DatagramProtocol):
+    def __init__(self, protocol) -> None:
+        self._protocol = protocol
+        self.datagram_received = protocol.datagramReceived
+
+    def connection_made(self, transport: asyncio.DatagramTransport) -> None:
+        # asyncio sendto(data, addr) has the same signature as the Twisted write, so it is used directly
+        self._protocol.transport = SimpleNamespace(write=transport.sendto)
+
+    def error_received(self, exc: Exception) -> None:
+        # Unreachable peers are handled by the keep-alive & lease timers
+        pass
+
+
+async def _run_asyncio(endpoints: list, tick: Callable, tick_period: float) -> None:
+    loop = asyncio.get_running_loop()
+    for sock, protocol in endpoints:
+        await loop.create_datagram_endpoint(lambda protocol=protocol: YourTurnAsyncioProtocol(protocol), sock=sock)
+    while True:
+        tick()
+        await asyncio.sleep(tick_period)
+
+
+def run_asyncio(endpoints: list, tick: Callable, tick_period: float) -> None:
+    try:
+        asyncio.run(_run_asyncio(endpoints, tick, tick_period))
+    except KeyboardInterrupt:
+        pass
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+SOCKADDR_IN_LEN: int = 16
+
+
+def _load_mmsg_functions() -> tuple:
+    # recvmmsg & sendmmsg move a whole batch of datagrams with a single syscall, but are only available on Linux
+    if not sys.platform.startswith("linux"):
+        return None, None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return None, None
+    recvmmsg = getattr(libc, "recvmmsg", None)
+    sendmmsg = getattr(libc, "sendmmsg", None)
+    if recvmmsg is None or sendmmsg is None:
+        return None, None
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return recvmmsg, sendmmsg
+
+
+class YourTurnBatchedSocket:
+    # Non-blocking socket, that receives and sends datagrams in batches
+    BATCH_SIZE: int = 64
+    BUFFER_SIZE: int = 2048
+
+    _recvmmsg, _sendmmsg = _load_mmsg_functions()
+
+    def __init__(self, sock: socket.socket, protocol) -> None:
+        self._sock: socket.socket = sock
+        self._fd: int = sock.fileno()
+        self._protocol = protocol
+        self._receive: Callable = protocol.datagramReceived
+        self._send_queue: list = []
+        protocol.transport = self
+
+        # Addresses are converted between Python & C only once per peer
+        self._addrs: dict = {}  # raw sockaddr -> (ip, port)
+        self._sockaddrs: dict = {}  # (ip, port) -> sockaddr buffer
+
+        batch: int = YourTurnBatchedSocket.BATCH_SIZE
+        self._buffers: list = [ctypes.create_string_buffer(YourTurnBatchedSocket.BUFFER_SIZE) for _ in range(batch)]
+        self._names: list = [ctypes.create_string_buffer(SOCKADDR_IN_LEN) for _ in range(batch)]
+        self._recv_iovecs = (_IOVec * batch)()
+        self._recv_msgs = (_MMsgHdr * batch)()
+        self._send_iovecs = (_IOVec * batch)()
+        self._send_msgs = (_MMsgHdr * batch)()
+        for i in range(batch):
+            self._recv_iovecs[i].iov_base = ctypes.addressof(self._buffers[i])
+            self._recv_iovecs[i].iov_len = YourTurnBatchedSocket.BUFFER_SIZE
+            self._recv_msgs[i].msg_hdr.msg_iov = ctypes.pointer(self._recv_iovecs[i])
+            self._recv_msgs[i].msg_hdr.msg_iovlen = 1
+            self._recv_msgs[i].msg_hdr.msg_name = ctypes.addressof(self._names[i])
+            self._send_msgs[i].msg_hdr.msg_iov = ctypes.pointer(self._send_iovecs[i])
+            self._send_msgs[i].msg_hdr.msg_iovlen = 1
+            self._send_msgs[i].msg_hdr.msg_namelen = SOCKADDR_IN_LEN
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def has_pending(self) -> bool:
+        return len(self._send_queue) > 0
+
+    def write(self, data: bytes, addr: tuple = None) -> None:
+        # Sending is deferred & the ctypes conversion needs bytes, so mutable buffers are copied
+        if type(data) is not bytes:
+            data = bytes(data)
+        self._send_queue.append((data, addr))
+
+    def receive_batch(self) -> int:
+        if YourTurnBatchedSocket._recvmmsg is None:
+            return self._receive_batch_fallback()
+
+        for i in range(YourTurnBatchedSocket.BATCH_SIZE):
+            self._recv_msgs[i].msg_hdr.msg_namelen = SOCKADDR_IN_LEN
+        count: int = YourTurnBatchedSocket._recvmmsg(
+            self._fd, self._recv_msgs, YourTurnBatchedSocket.BATCH_SIZE, socket.MSG_DONTWAIT, None
+        )
+        if count < 0:
+            return 0
+
+        receive: Callable = self._receive
+        for i in range(count):
+            name: bytes = self._names[i].raw
+            addr: tuple = self._addrs.get(name, None)
+            if addr is None:
+                addr = (socket.inet_ntoa(name[4:8]), int.from_bytes(name[2:4], "big"))
+                self._addrs[name] = addr
+            receive(ctypes.string_at(self._buffers[i], self._recv_msgs[i].msg_len), addr)
+        return count
+
+    def _receive_batch_fallback(self) -> int:
+        count: int = 0
+        receive: Callable = self._receive
+        recvfrom: Callable = self._sock.recvfrom
+        while count < YourTurnBatchedSocket.BATCH_SIZE:
+            try:
+                data, addr = recvfrom(YourTurnBatchedSocket.BUFFER_SIZE)
+            except (BlockingIOError, ConnectionRefusedError):
+                break
+            receive(data, addr)
+            count += 1
+        return count
+
+    def flush(self) -> None:
+        if YourTurnBatchedSocket._sendmmsg is None:
+            self._flush_fallback()
+            return
+
+        while self._send_queue:
+            batch: list = self._send_queue[:YourTurnBatchedSocket.BATCH_SIZE]
+            for i, (data, addr) in enumerate(batch):
+                # Bytes objects are kept alive by the queue until the syscall returns, so they are not copied
+                self._send_iovecs[i].iov_base = ctypes.cast(ctypes.c_char_p(data), ctypes.c_void_p)
+                self._send_iovecs[i].iov_len = len(data)
+                self._send_msgs[i].msg_hdr.msg_name = ctypes.addressof(self._get_sockaddr(addr))
+            sent: int = YourTurnBatchedSocket._sendmmsg(self._fd, self._send_msgs, len(batch), 0)
+            if sent < 0:
+                if ctypes.get_errno() in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    # Kernel buffer is full, try again on the next loop
+                    return
+                # Datagram can't be sent at all (e.g. unreachable), drop it like a lost packet
+                sent = 1
+            del self._send_queue[:sent]
+
+    def _flush_fallback(self) -> None:
+        sendto: Callable = self._sock.sendto
+        sent: int = 0
+        for data, addr in self._send_queue:
+            try:
+                sendto(data, addr)
+            except BlockingIOError:
+                break
+            except OSError:
+                pass
+            sent += 1
+        del self._send_queue[:sent]
+
+    def _get_sockaddr(self, addr: tuple):
+        sockaddr = self._sockaddrs.get(addr, None)
+        if sockaddr is None:
+            ip, port = addr
+            raw: bytes = socket.AF_INET.to_bytes(2, sys.byteorder) + port.to_bytes(2, "big") + socket.inet_aton(ip)
+            sockaddr = ctypes.create_string_buffer(raw, SOCKADDR_IN_LEN)
+            self._sockaddrs[addr] = sockaddr
+        return sockaddr
+
+
+def run_batched(endpoints: list, tick: Callable, tick_period: float) -> None:
+    # Every wakeup drains up to a batch of datagrams from each ready socket & only then flushes the replies
+    selector = selectors.DefaultSelector()
+    batched_sockets: list = []
+    for sock, protocol in endpoints:
+        batched_socket = YourTurnBatchedSocket(sock, protocol)
+        selector.register(batched_socket, selectors.EVENT_READ, batched_socket)
+        batched_sockets.append(batched_socket)
+
+    next_tick: float = monotonic()
+    try:
+        while True:
+            pending: bool = any(batched_socket.has_pending() for batched_socket in batched_sockets)
+            timeout: float = 0 if pending else max(0.0, next_tick - monotonic())
+            for key, _ in selector.select(timeout):
+                key.data.receive_batch()
+
+            now: float = monotonic()
+            if now >= next_tick:
+                tick()
+                next_tick = max(next_tick + tick_period, now)
+
+            for batched_socket in batched_sockets:
+                batched_socket.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        selector.close()
+
+
+def run_backend(backend: str, endpoints: list, tick: Callable, tick_period: float) -> None:
+    if backend == "twisted":
+        run_twisted(endpoints, tick, tick_period)
+    elif backend == "asyncio":
+        run_asyncio(endpoints, tick, tick_period)
+    elif backend == "batched":
+        run_batched(endpoints, tick, tick_period)
+    else:
+        raise ValueError(f"Unknown backend {backend}!")
@@ -0,0 +1,825 @@
+import argparse
+import os
+import sys
+import json
+import random
+import socket
+import struct
+import timeit
+import subprocess
+import multiprocessing
+from time import perf_counter, perf_counter_ns, sleep
+
+from twisted.internet import reactor, task
+from twisted.internet.protocol import DatagramProtocol
+
+from your_turn import (
+    TURN_MSG_DIRECT_PREFIX,
+    TURN_MSG_PREFIX,
+    TURN_MSG_PREAMBLE_LEN,
+    TURN_PREAMBLE,
+    YourTurnPeer,
+    YourTurnRelay,
+    make_turn_packet,
+    parse_turn_packet,
+    rewrite_turn_packet,
+)
+from your_turn_backends import YOUR_TURN_BACKENDS
+from your_turn_middleman import YourTurnMiddleman, YourTurnMiddlemanRelay
+
+PEER_TABLE_SIZES: tuple = (10, 100, 1000, 10000, 100000)
+PEER_TABLE_PACKETS: int = 100000
+PAYLOAD_SIZE: int = 104
+
+CODEC_ITERATIONS: int = 1000000
+CODEC_PAYLOAD_SIZES: tuple = (8, 104, 1200)
+
+WORKERS_RELAY_PORT: int = 16969
+WORKERS_COUNTS: tuple = (1, 2, 4)
+WORKERS_DURATION: float = 5.0  # [s]
+WORKERS_CLIENTS: int = 64
+WORKERS_STARTUP_TIME: float = 2.0  # [s]
+
+# Load packet payload: sequence number, client index, departure time [ns], followed by padding
+LOAD_PACKET = struct.Struct(">LLQ")
+LOAD_RELAY_PORT: int = 17969
+LOAD_CLIENTS: int = 100
+LOAD_RATE: float = 30.0  # [packets/s] per client
+LOAD_BURST: int = 1
+LOAD_DURATION: float = 10.0  # [s]
+LOAD_WARMUP: float = 3.0  # [s]
+LOAD_DRAIN: float = 1.0  # [s]
+LOAD_SCHEDULER_PERIOD: float = 0.001  # [s]
+LOAD_SERVER_PORT: int = 17942
+LOAD_SERVER_PORT_RANGE_START: int = 20000
+LOAD_CLIENT_PORT_RANGE_START: int = 40000
+
+DIRECT_RELAY_PORT: int = 18969
+DIRECT_RATE: float = 50.0  # [packets/s]
+DIRECT_DURATION: float = 5.0  # [s] of each phase
+DIRECT_UPGRADE_TIMEOUT: float = 10.0  # [s]
+DIRECT_POLL_PERIOD: float = 0.01  # [s]
+DIRECT_CLIENT_ID: int = 2
+
+FEC_RELAY_PORT: int = 19969
+FEC_LOSSES: tuple = (0.0, 0.01, 0.05)
+FEC_GROUPS: tuple = (0, 8, 4, 2)
+FEC_RATE: float = 100.0  # [packets/s]
+FEC_DURATION: float = 5.0  # [s]
+FEC_WARMUP: float = 1.0  # [s]
+
+
+class NullTransport:
+    # Stand-in for the Twisted transport, so only the relays own processing time is measured
+    def write(self, data: bytes, addr: tuple = None) -> None:
+        pass
+
+
+def make_peer_addr(index: int) -> tuple:
+    return f"10.{(index >> 16) & 0xFF}.{(index >> 8) & 0xFF}.{index & 0xFF}", 1024 + (index % 60000)
+
+
+def benchmark_peer_table(packets: int) -> None:
+    # Measure the cost of forwarding Client -> Server packets, depending on the number of registered peers
+    payload: bytes = bytes(PAYLOAD_SIZE)
+    for peer_count in PEER_TABLE_SIZES:
+        relay = YourTurnRelay()
+        relay.transport = NullTransport()
+
+        # Fill the table directly, registering through the relay would print & notify for every peer
+        relay._peer_map.add(1, YourTurnPeer(1, "192.168.0.1", 6969, relay.transport.write))
+        for i in range(peer_count):
+            ip, port = make_peer_addr(i)
+            relay._peer_map.add(i + 2, YourTurnPeer(i + 2, ip, port, relay.transport.write))
+
+        # The last registered peer would be the worst case for a linear lookup
+        sender_addr: tuple = make_peer_addr(peer_count - 1)
+        packet: bytes = make_turn_packet(1, payload)
+        start: float = perf_counter()
+        for _ in range(packets):
+            relay.datagramReceived(packet, sender_addr)
+        elapsed: float = perf_counter() - start
+        print(f"Peers: {peer_count:>7}\t{elapsed / packets * 1e9:10.1f} ns/packet\t{packets / elapsed:12.0f} packets/s")
+
+
+def legacy_parse_turn_packet(turn_packet: bytes) -> tuple:
+    # Original codec, kept as the reference point of the codec benchmark
+    if len(turn_packet) < TURN_MSG_PREAMBLE_LEN:
+        return ()
+    prefix, peer_id = struct.unpack(">HL", turn_packet[:TURN_MSG_PREAMBLE_LEN])
+    if prefix != TURN_MSG_PREFIX:
+        return ()
+    return peer_id, turn_packet[TURN_MSG_PREAMBLE_LEN:]
+
+
+def legacy_make_turn_packet(id: int, payload: bytes = b"") -> bytes:
+    preamble: bytes = struct.pack(">HL", TURN_MSG_PREFIX, id)
+    return preamble + payload
+
+
+def legacy_relay_rewrite(turn_packet: bytes, sender_id: int) -> bytes:
+    _, payload = legacy_parse_turn_packet(turn_packet)
+    return legacy_make_turn_packet(sender_id, payload)
+
+
+def relay_rewrite(turn_packet: bytes, sender_id: int) -> bytearray:
+    # Same as the forwarding path of the Relay, which reads the header in place & rewrites the ID of the packet
+    if len(turn_packet) < TURN_MSG_PREAMBLE_LEN:
+        return None
+    prefix, _ = TURN_PREAMBLE.unpack_from(turn_packet)
+    if prefix != TURN_MSG_PREFIX:
+        return None
+    return rewrite_turn_packet(turn_packet, sender_id)
+
+
+def benchmark_codec(iterations: int) -> None:
+    # Compare the codec against the original functions, for each of the operations done on the forwarding path
+    for payload_size in CODEC_PAYLOAD_SIZES:
+        payload: bytes = bytes(payload_size)
+        packet: bytes = make_turn_packet(1, payload)
+        cases: list = [
+            ("parse", lambda: legacy_parse_turn_packet(packet), lambda: parse_turn_packet(packet)),
+            ("make", lambda: legacy_make_turn_packet(2, payload), lambda: make_turn_packet(2, payload)),
+            ("relay", lambda: legacy_relay_rewrite(packet, 2), lambda: relay_rewrite(packet, 2)),
+        ]
+        for name, legacy, current in cases:
+            legacy_ns: float = timeit.timeit(legacy, number=iterations) / iterations * 1e9
+            current_ns: float = timeit.timeit(current, number=iterations) / iterations * 1e9
+            print(f"Payload: {payload_size:>5} B\t{name:<6}\tLegacy: {legacy_ns:8.1f} ns\tCodec: {current_ns:8.1f} ns\t{legacy_ns / current_ns:5.2f}x")
+
+
+def register_on_relay(sock: socket.socket, peer_id: int, relay_addr: tuple, attempts: int = 20) -> bool:
+    registration: bytes = make_turn_packet(peer_id)
+    sock.settimeout(0.25)
+    for _ in range(attempts):
+        sock.sendto(registration, relay_addr)
+        try:
+            while True:
+                data, _ = sock.recvfrom(2048)
+                if data == registration:
+                    return True
+        except socket.timeout:
+            continue
+    return False
+
+
+def flood_relay(first_id: int, clients: int, relay_addr: tuple, duration: float, results) -> None:
+    # Client side load, every client sends from its own socket, so the kernel spreads them between the workers
+    sockets: list = []
+    for i in range(clients):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if not register_on_relay(sock, first_id + i, relay_addr):
+            print(f"Client {first_id + i} failed to register!")
+        sock.setblocking(False)
+        sockets.append(sock)
+
+    packet: bytes = make_turn_packet(1, bytes(PAYLOAD_SIZE))
+    sent: int = 0
+    end: float = perf_counter() + duration
+    while perf_counter() < end:
+        for sock in sockets:
+            try:
+                sock.sendto(packet, relay_addr)
+                sent += 1
+            except BlockingIOError:
+                pass
+    results.put(sent)
+
+
+def measure_relay_rate(label: str, relay_args: list, clients: int, senders: int, duration: float) -> None:
+    # Measure the Client -> Server packet rate through a local Relay, started with the given arguments
+    relay_addr: tuple = ("127.0.0.1", WORKERS_RELAY_PORT)
+    context = multiprocessing.get_context("spawn")
+    relay = subprocess.Popen(
+        [sys.executable, "your_turn.py", "-p", str(WORKERS_RELAY_PORT), "-d", "0"] + relay_args,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL
+    )
+    try:
+        sleep(WORKERS_STARTUP_TIME)
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        if not register_on_relay(server, 1, relay_addr):
+            print("Server failed to register!")
+            return
+
+        results = context.Queue()
+        clients_per_sender: int = max(1, clients // senders)
+        floods: list = [
+            context.Process(target=flood_relay, args=(2 + i * clients_per_sender, clients_per_sender, relay_addr, duration, results))
+            for i in range(senders)
+        ]
+        for flood in floods:
+            flood.start()
+
+        # Count only the forwarded data, registration notifications & keep-alives are skipped
+        received: int = 0
+        first_packet: float = 0
+        last_packet: float = 0
+        end: float = perf_counter() + WORKERS_STARTUP_TIME + duration + WORKERS_STARTUP_TIME
+        server.settimeout(WORKERS_STARTUP_TIME)
+        try:
+            while perf_counter() < end:
+                data, _ = server.recvfrom(2048)
+                if len(data) <= TURN_MSG_PREAMBLE_LEN:
+                    continue
+                last_packet = perf_counter()
+                if received == 0:
+                    first_packet = last_packet
+                received += 1
+        except socket.timeout:
+            pass
+
+        sent: int = sum(results.get() for _ in floods)
+        for flood in floods:
+            flood.join()
+        server.close()
+        elapsed: float = max(last_packet - first_packet, 1e-9)
+        loss: float = 100 * (1 - received / sent) if sent > 0 else 0
+        print(f"{label}\t{received / elapsed:12.0f} packets/s\tSent: {sent}\tReceived: {received}\tLoss: {loss:.1f} %")
+    finally:
+        relay.terminate()
+        relay.wait()
+
+
+def benchmark_workers(worker_counts: list, clients: int, senders: int, duration: float) -> None:
+    for workers in worker_counts:
+        measure_relay_rate(f"Workers: {workers}", ["-w", str(workers)], clients, senders, duration)
+
+
+def benchmark_backends(backends: list, clients: int, senders: int, duration: float) -> None:
+    for backend in backends:
+        measure_relay_rate(f"Backend: {backend:<8}", ["-b", backend], clients, senders, duration)
+
+
+class LoadStats:
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.sent: int = 0
+        self.sent_bytes: int = 0
+        self.received: int = 0
+        self.received_bytes: int = 0
+        self.rtts: list = []  # [ns]
+
+    def report(self, duration: float) -> dict:
+        rtts: list = sorted(self.rtts)
+
+        def percentile(p: float) -> float:
+            if len(rtts) == 0:
+                return None
+            return rtts[min(len(rtts) - 1, int(p * len(rtts)))] / 1e6
+
+        return {
+            "duration_s": duration,
+            "sent_packets": self.sent,
+            "received_packets": self.received,
+            "sent_bytes": self.sent_bytes,
+            "received_bytes": self.received_bytes,
+            "packets_per_s": self.received / duration,
+            "bytes_per_s": self.received_bytes / duration,
+            "loss": 1 - self.received / self.sent if self.sent > 0 else 0,
+            "rtt_p50_ms": percentile(0.5),
+            "rtt_p99_ms": percentile(0.99),
+            "rtt_p999_ms": percentile(0.999),
+        }
+
+
+class LoadEchoServer(DatagramProtocol):
+    # Game server stand-in, that returns every packet to the client it came from
+    def __init__(self, relay_addr: tuple = ()) -> None:
+        super().__init__()
+        self._relay_addr: tuple = relay_addr
+        self.echoed_bytes: int = 0
+
+    def startProtocol(self) -> None:
+        if self._relay_addr != ():
+            # Direct mode, register as the server on the Relay
+            self.transport.connect(*self._relay_addr)
+            self.transport.write(make_turn_packet(YourTurnMiddleman.SERVER_ID))
+
+    def datagramReceived(self, data: bytes, addr: tuple) -> None:
+        if self._relay_addr == ():
+            self.echoed_bytes += len(data)
+            self.transport.write(data, addr)
+        elif len(data) > TURN_MSG_PREAMBLE_LEN:
+            # Packet from the client carries its ID, which is also the receiver of the echo
+            self.transport.write(data)
+
+
+class LoadClient(DatagramProtocol):
+    # Simulated client, that sends timestamped packets & measures the RTT of their echoes
+    def __init__(self, index: int, client_id: int, send_addr: tuple, payload_size: int, bypass: bool, stats: LoadStats) -> None:
+        super().__init__()
+        self._index: int = index
+        self._id: int = client_id
+        self._send_addr: tuple = send_addr
+        self._padding: bytes = bytes(max(0, payload_size - LOAD_PACKET.size))
+        self._bypass: bool = bypass
+        self._stats: LoadStats = stats
+        self._counter: int = 0
+        self._phases: list = [(0, stats)]  # (sequence number of the first packet, stats) of each phase
+
+    def startProtocol(self) -> None:
+        self.transport.connect(*self._send_addr)
+        if self._bypass:
+            self.transport.write(make_turn_packet(self._id))
+
+    def get_stats(self) -> LoadStats:
+        return self._stats
+
+    def set_stats(self, stats: LoadStats) -> None:
+        # Starts a new phase, echoes of the packets sent before are still counted in the stats they were sent with
+        self._stats = stats
+        self._phases.append((self._counter, stats))
+
+    def send_burst(self, count: int) -> None:
+        stats: LoadStats = self._stats
+        for _ in range(count):
+            payload: bytes = LOAD_PACKET.pack(self._counter, self._index, perf_counter_ns()) + self._padding
+            # Application bytes are counted, without the TURN header, the same way as the received ones
+            stats.sent += 1
+            stats.sent_bytes += len(payload)
+            if self._bypass:
+                payload = make_turn_packet(self._id, payload)
+            try:
+                self.transport.write(payload)
+            except BlockingIOError:
+                pass
+            self._counter += 1
+
+    def datagramReceived(self, data: bytes, addr: tuple) -> None:
+        if self._bypass:
+            if len(data) <= TURN_MSG_PREAMBLE_LEN:
+                # Registration echo & keep-alives
+                return
+            data = data[TURN_MSG_PREAMBLE_LEN:]
+        if len(data) < LOAD_PACKET.size:
+            return
+        counter, _, departure_time = LOAD_PACKET.unpack_from(data)
+        stats: LoadStats = self._stats
+        if counter < self._phases[-1][0]:
+            stats = next(stats for first, stats in reversed(self._phases) if counter >= first)
+        stats.received += 1
+        stats.received_bytes += len(data)
+        stats.rtts.append(perf_counter_ns() - departure_time)
+
+    def connectionRefused(self) -> None:
+        pass
+
+
+class LoadScheduler:
+    # Clients are spread over the slots of one send period, so they don't all send at the same moment
+    def __init__(self, clients: list, rate: float, burst: int) -> None:
+        send_period: float = burst / rate
+        slot_count: int = max(1, round(send_period / LOAD_SCHEDULER_PERIOD))
+        self._slots: list = [clients[i::slot_count] for i in range(slot_count)]
+        self._slot: int = 0
+        self._burst: int = burst
+        self._period: float = send_period / slot_count
+        self._sender = task.LoopingCall(self._send_slot)
+
+    def start(self) -> None:
+        self._sender.start(self._period, now=True)
+
+    def stop(self) -> None:
+        if self._sender.running:
+            self._sender.stop()
+
+    def _send_slot(self) -> None:
+        for client in self._slots[self._slot]:
+            client.send_burst(self._burst)
+        self._slot = (self._slot + 1) % len(self._slots)
+
+
+class NatStandIn:
+    # Stand-in for the NAT in front of a Middleman, as network namespaces aren't available everywhere. Packets only
+    # come in from addresses the Middleman sent to before, like with an address & port dependent filtering NAT.
+    # Blocking drops everything, that isn't to or from the Relay, which breaks the direct paths.
+    # Direct path offers of the Relay can be held back, so the Middlemen talk through the Relay until they're released.
+    def __init__(self, interface: YourTurnMiddlemanRelay) -> None:
+        self._relay_addrs: tuple = interface.get_relay_addrs()
+        self._opened: set = set(self._relay_addrs)
+        self._is_blocked: bool = False
+        self._held_offers: list = []  # (data, addr) of the held back offers
+        self._is_holding: bool = False
+        self.dropped: int = 0
+
+        transport = interface.transport
+        write = transport.write
+        receive = interface.datagramReceived
+
+        def filtered_write(data: bytes, addr: tuple = None) -> None:
+            if addr is None:
+                write(data)
+                return
+            if self._is_blocked and addr not in self._relay_addrs:
+                self.dropped += 1
+                return
+            self._opened.add(addr)
+            write(data, addr)
+
+        def filtered_receive(data: bytes, addr: tuple) -> None:
+            if addr not in self._opened or self._is_blocked and addr not in self._relay_addrs:
+                self.dropped += 1
+                return
+            if self._is_holding and len(data) >= TURN_MSG_PREAMBLE_LEN and TURN_PREAMBLE.unpack_from(data)[0] == TURN_MSG_DIRECT_PREFIX:
+                self._held_offers.append((data, addr))
+                return
+            receive(data, addr)
+
+        self._receive = receive
+        transport.write = filtered_write
+        interface.datagramReceived = filtered_receive
+
+    def block_direct(self) -> None:
+        self._is_blocked = True
+
+    def hold_offers(self) -> None:
+        self._is_holding = True
+
+    def release_offers(self) -> None:
+        self._is_holding = False
+        for data, addr in self._held_offers:
+            self._receive(data, addr)
+        self._held_offers.clear()
+
+
+def benchmark_direct(args: argparse.Namespace) -> None:
+    # Client & Server Middleman talking through a local Relay for a while, then directly, once the direct path opens,
+    # until it's blocked & they fall back to the Relay. RTT & loss is reported for each phase, the transitions (opening
+    # the direct path & detecting it broke) are reported apart from the steady phases.
+    relay: subprocess.Popen = subprocess.Popen(
+        [sys.executable, "your_turn.py", "-p", str(args.relay_port)] + args.relay_args.split(),
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL
+    )
+    sleep(WORKERS_STARTUP_TIME)
+
+    reactor.listenUDP(LOAD_SERVER_PORT, LoadEchoServer(), interface="127.0.0.1")
+    server = YourTurnMiddleman(
+        "127.0.0.1",
+        args.relay_port,
+        True,
+        server_port=LOAD_SERVER_PORT,
+        port_range_start=LOAD_SERVER_PORT_RANGE_START,
+        direct=not args.relay_only
+    )
+    middleman = YourTurnMiddleman(
+        "127.0.0.1",
+        args.relay_port,
+        False,
+        id=DIRECT_CLIENT_ID,
+        port_range_start=LOAD_CLIENT_PORT_RANGE_START,
+        direct=not args.relay_only
+    )
+    nats: list = [NatStandIn(server.get_relay_interface()), NatStandIn(middleman.get_relay_interface())]
+    for nat in nats:
+        nat.hold_offers()
+    client = LoadClient(0, DIRECT_CLIENT_ID, ("127.0.0.1", LOAD_CLIENT_PORT_RANGE_START), args.size, False, LoadStats())
+    reactor.listenUDP(0, client)
+    scheduler = LoadScheduler([client], args.rate, 1)
+
+    report: dict = {"relay_only": args.relay_only, "rate": args.rate, "payload_size": args.size}
+    events: dict = {}
+    phase: list = ["relay", perf_counter()]
+    phases: list = []  # (name, stats, duration) of the finished phases
+
+    def is_direct() -> bool:
+        return middleman.is_direct(YourTurnMiddleman.SERVER_ID) and server.is_direct(DIRECT_CLIENT_ID)
+
+    def end_phase(name: str) -> None:
+        # Phase is reported at the end, so the echoes arriving after it ended are counted in it too
+        now: float = perf_counter()
+        phases.append((phase[0], client.get_stats(), now - phase[1]))
+        client.set_stats(LoadStats())
+        phase[:] = [name, now]
+
+    def stop() -> None:
+        scheduler.stop()
+        poller.stop()
+        reactor.callLater(LOAD_DRAIN, reactor.stop)
+
+    def poll() -> None:
+        now: float = perf_counter()
+        if phase[0] == "relay":
+            if now - phase[1] < args.duration:
+                return
+            if args.relay_only:
+                end_phase("")
+                stop()
+                return
+            end_phase("upgrading")
+            events["released"] = now
+            for nat in nats:
+                nat.release_offers()
+        elif phase[0] == "upgrading":
+            if is_direct():
+                events["upgrade"] = now
+                end_phase("direct")
+            elif now - phase[1] >= DIRECT_UPGRADE_TIMEOUT:
+                end_phase("")
+                stop()
+        elif phase[0] == "direct" and now - phase[1] >= args.duration:
+            end_phase("falling_back")
+            events["blocked"] = now
+            for nat in nats:
+                nat.block_direct()
+        elif phase[0] == "falling_back":
+            if not middleman.is_direct(YourTurnMiddleman.SERVER_ID) and not server.is_direct(DIRECT_CLIENT_ID):
+                events["fallback"] = now
+                end_phase("fallback")
+            elif now - phase[1] >= DIRECT_UPGRADE_TIMEOUT:
+                end_phase("")
+                stop()
+        elif phase[0] == "fallback" and now - phase[1] >= args.duration:
+            end_phase("")
+            stop()
+
+    def start() -> None:
+        phase[1] = perf_counter()
+        scheduler.start()
+        poller.start(DIRECT_POLL_PERIOD)
+
+    poller = task.LoopingCall(poll)
+    # Server has to be registered before the Client sends
+    reactor.callLater(0.5, start)
+    try:
+        reactor.run()
+    finally:
+        relay.terminate()
+        relay.wait()
+
+    for name, stats, duration in phases:
+        report[name] = stats.report(duration)
+    if "released" in events:
+        report["upgrade_time_s"] = events["upgrade"] - events["released"] if "upgrade" in events else None
+    if "blocked" in events:
+        report["fallback_time_s"] = events["fallback"] - events["blocked"] if "fallback" in events else None
+    report["nat_drops"] = sum(nat.dropped for nat in nats)
+    output: str = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+    print(output)
+
+
+class LossStandIn:
+    # Drops packets to & from the Relay at random, like a lossy WAN leg on each side of the Middleman
+    def __init__(self, interface: YourTurnMiddlemanRelay, loss: float, seed: int) -> None:
+        generator = random.Random(seed)
+        transport = interface.transport
+        write = transport.write
+        receive = interface.datagramReceived
+
+        def lossy_write(data: bytes, addr: tuple = None) -> None:
+            if generator.random() < loss:
+                return
+            if addr is None:
+                write(data)
+            else:
+                write(data, addr)
+
+        def lossy_receive(data: bytes, addr: tuple) -> None:
+            if generator.random() >= loss:
+                receive(data, addr)
+
+        transport.write = lossy_write
+        interface.datagramReceived = lossy_receive
+
+
+def measure_fec(loss: float, group: int, client_id: int, rate: float, size: int, duration: float, results) -> None:
+    # Echo of the client packets through Middlemen with FEC, all 4 legs between them & the Relay lose packets
+    stats = LoadStats()
+    echo_server = LoadEchoServer()
+    reactor.listenUDP(LOAD_SERVER_PORT, echo_server, interface="127.0.0.1")
+    middlemen: list = [
+        YourTurnMiddleman("127.0.0.1", FEC_RELAY_PORT, True, server_port=LOAD_SERVER_PORT,
+                          port_range_start=LOAD_SERVER_PORT_RANGE_START, fec_group=group),
+        YourTurnMiddleman("127.0.0.1", FEC_RELAY_PORT, False, id=client_id,
+                          port_range_start=LOAD_CLIENT_PORT_RANGE_START, fec_group=group),
+    ]
+    for seed, middleman in enumerate(middlemen):
+        LossStandIn(middleman.get_relay_interface(), loss, seed)
+    client = LoadClient(0, client_id, ("127.0.0.1", LOAD_CLIENT_PORT_RANGE_START), size, False, stats)
+    reactor.listenUDP(0, client)
+    scheduler = LoadScheduler([client], rate, 1)
+    relay_bytes: list = []  # Sent by the Middlemen to the Relay & by the application to the Middlemen
+
+    def get_relay_bytes() -> int:
+        return sum(middleman.get_relay_interface().get_counters().bytes_out for middleman in middlemen)
+
+    def start_load() -> None:
+        stats.reset()
+        relay_bytes.extend((get_relay_bytes(), echo_server.echoed_bytes))
+        scheduler.start()
+        reactor.callLater(duration, stop_load)
+
+    def stop_load() -> None:
+        scheduler.stop()
+        reactor.callLater(LOAD_DRAIN, reactor.stop)
+
+    reactor.callLater(FEC_WARMUP, start_load)
+    reactor.run()
+
+    report: dict = stats.report(duration)
+    # Wire bytes to the Relay against the application bytes, in both directions
+    application_bytes: int = stats.sent_bytes + echo_server.echoed_bytes - relay_bytes[1]
+    report["overhead"] = (get_relay_bytes() - relay_bytes[0]) / max(1, application_bytes) - 1
+    report["recovered_packets"] = sum(middleman.get_metrics().get_event_count("fec_recovered_packets") for middleman in middlemen)
+    report.update({"leg_loss": loss, "fec_group": group})
+    results.put(report)
+
+
+def benchmark_fec(args: argparse.Namespace) -> None:
+    # Every combination of loss & FEC group runs in a fresh process, as the Twisted reactor can't be restarted
+    context = multiprocessing.get_context("spawn")
+    relay = subprocess.Popen(
+        [sys.executable, "your_turn.py", "-p", str(FEC_RELAY_PORT), "-d", "0"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL
+    )
+    reports: list = []
+    try:
+        sleep(WORKERS_STARTUP_TIME)
+        for loss in args.losses:
+            for group in args.groups:
+                results = context.Queue()
+                # Each run registers a new client, so the Relay doesn't mix it up with the one of the previous run
+                case = context.Process(
+                    target=measure_fec,
+                    args=(loss, group, 2 + len(reports), args.rate, args.size, args.duration, results)
+                )
+                case.start()
+                report: dict = results.get()
+                case.join()
+                reports.append(report)
+                print(
+                    f"Leg loss: {100 * loss:4.1f} %\tFEC group: {group if group > 0 else '-':>2}"
+                    f"\tEffective loss: {100 * report['loss']:5.2f} %\tRecovered: {report['recovered_packets']:5}"
+                    f"\tRTT p99: {report['rtt_p99_ms']:6.2f} ms\tp99.9: {report['rtt_p999_ms']:6.2f} ms"
+                    f"\tOverhead: {100 * report['overhead']:5.1f} %"
+                )
+    finally:
+        relay.terminate()
+        relay.wait()
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(json.dumps(reports, indent=2))
+
+
+def benchmark_load(args: argparse.Namespace) -> None:
+    # End-to-end load through a local Relay, either directly with TURN framing, or through Middlemen
+    relay_addr: tuple = (args.relay_ip, args.relay_port)
+    relay: subprocess.Popen = None
+    if not args.external_relay:
+        relay = subprocess.Popen(
+            [sys.executable, "your_turn.py", "-p", str(args.relay_port)] + args.relay_args.split(),
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.DEVNULL
+        )
+        sleep(WORKERS_STARTUP_TIME)
+
+    stats = LoadStats()
+    clients: list = []
+    middlemen: list = []
+    if args.middleman:
+        reactor.listenUDP(LOAD_SERVER_PORT, LoadEchoServer(), interface="127.0.0.1")
+        middlemen.append(YourTurnMiddleman(
+            args.relay_ip,
+            args.relay_port,
+            True,
+            server_port=LOAD_SERVER_PORT,
+            port_range_start=LOAD_SERVER_PORT_RANGE_START,
+            bundle_window=args.bundle_window
+        ))
+    else:
+        reactor.listenUDP(0, LoadEchoServer(relay_addr))
+
+    def start_clients() -> None:
+        for i in range(args.clients):
+            client_id: int = 2 + i
+            if args.middleman:
+                client_port: int = LOAD_CLIENT_PORT_RANGE_START + i
+                middlemen.append(YourTurnMiddleman(
+                    args.relay_ip,
+                    args.relay_port,
+                    False,
+                    id=client_id,
+                    port_range_start=client_port,
+                    bundle_window=args.bundle_window
+                ))
+                client = LoadClient(i, client_id, ("127.0.0.1", client_port), args.size, False, stats)
+            else:
+                client = LoadClient(i, client_id, relay_addr, args.size, True, stats)
+            reactor.listenUDP(0, client)
+            clients.append(client)
+
+    scheduler: LoadScheduler = None
+    start_time: list = []
+
+    def start_load() -> None:
+        nonlocal scheduler
+        stats.reset()
+        scheduler = LoadScheduler(clients, args.rate, args.burst)
+        scheduler.start()
+        start_time.append(perf_counter())
+        reactor.callLater(args.duration, stop_load)
+
+    def stop_load() -> None:
+        scheduler.stop()
+        start_time.append(perf_counter())
+        reactor.callLater(LOAD_DRAIN, reactor.stop)
+
+    # Server has to be registered before the clients
+    reactor.callLater(0.5, start_clients)
+    reactor.callLater(0.5 + args.warmup, start_load)
+    try:
+        reactor.run()
+    finally:
+        if relay is not None:
+            relay.terminate()
+            relay.wait()
+
+    report: dict = stats.report(start_time[1] - start_time[0])
+    report.update({
+        "mode": "middleman" if args.middleman else "direct",
+        "clients": args.clients,
+        "rate_per_client": args.rate,
+        "burst": args.burst,
+        "payload_size": args.size,
+        "bundle_window": args.bundle_window,
+    })
+    output: str = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(
+        prog="Your TURN benchmark",
+        description="Your TURN server - Benchmarks"
+    )
+    sub_parsers = arg_parser.add_subparsers(dest="benchmark", required=True)
+    peer_table_parser = sub_parsers.add_parser("peer-table", help="Relay forwarding cost against the number of peers")
+    peer_table_parser.add_argument("-n", "--packets", type=int, default=PEER_TABLE_PACKETS)
+    codec_parser = sub_parsers.add_parser("codec", help="TURN codec against the original parse & make functions")
+    codec_parser.add_argument("-n", "--iterations", type=int, default=CODEC_ITERATIONS)
+    workers_parser = sub_parsers.add_parser("workers", help="Relay packet rate against the number of worker processes")
+    workers_parser.add_argument("-w", "--workers", type=int, nargs="+", default=WORKERS_COUNTS)
+    workers_parser.add_argument("-c", "--clients", type=int, default=WORKERS_CLIENTS)
+    workers_parser.add_argument("-s", "--senders", type=int, default=os.cpu_count(), help="Number of load generating processes")
+    workers_parser.add_argument("-d", "--duration", type=float, default=WORKERS_DURATION)
+    backends_parser = sub_parsers.add_parser("backends", help="Relay packet rate of each I/O backend")
+    backends_parser.add_argument("-b", "--backends", nargs="+", choices=YOUR_TURN_BACKENDS, default=YOUR_TURN_BACKENDS)
+    backends_parser.add_argument("-c", "--clients", type=int, default=WORKERS_CLIENTS)
+    backends_parser.add_argument("-s", "--senders", type=int, default=os.cpu_count(), help="Number of load generating processes")
+    backends_parser.add_argument("-d", "--duration", type=float, default=WORKERS_DURATION)
+    load_parser = sub_parsers.add_parser("load", help="End-to-end load of many simulated clients, reported as JSON")
+    load_parser.add_argument("-c", "--clients", type=int, default=LOAD_CLIENTS)
+    load_parser.add_argument("-f", "--rate", type=float, default=LOAD_RATE, help="Packets per second of each client")
+    load_parser.add_argument("-b", "--burst", type=int, default=LOAD_BURST, help="Packets sent back to back on each send")
+    load_parser.add_argument("-s", "--size", type=int, default=PAYLOAD_SIZE, help="Application payload size [B]")
+    load_parser.add_argument("-d", "--duration", type=float, default=LOAD_DURATION)
+    load_parser.add_argument("-w", "--warmup", type=float, default=LOAD_WARMUP, help="Time given to registrations [s]")
+    load_parser.add_argument("-m", "--middleman", action="store_true", help="Go through Middlemen instead of TURN framing")
+    load_parser.add_argument("-B", "--bundle-window", type=float, default=0, help="Bundle window of the Middlemen [s]")
+    load_parser.add_argument("-r", "--relay-ip", default="127.0.0.1")
+    load_parser.add_argument("-p", "--relay-port", type=int, default=LOAD_RELAY_PORT)
+    load_parser.add_argument("-a", "--relay-args", default="", help="Extra arguments of the spawned Relay")
+    load_parser.add_argument("-x", "--external-relay", action="store_true", help="Use an already running Relay")
+    load_parser.add_argument("-o", "--output", default="", help="File to write the JSON report to")
+    direct_parser = sub_parsers.add_parser("direct", help="RTT & loss through the Relay, the direct path & after it breaks, reported as JSON")
+    direct_parser.add_argument("-f", "--rate", type=float, default=DIRECT_RATE, help="Packets per second of the client")
+    direct_parser.add_argument("-s", "--size", type=int, default=PAYLOAD_SIZE, help="Application payload size [B]")
+    direct_parser.add_argument("-d", "--duration", type=float, default=DIRECT_DURATION, help="Length of each phase [s]")
+    direct_parser.add_argument("-p", "--relay-port", type=int, default=DIRECT_RELAY_PORT)
+    direct_parser.add_argument("-a", "--relay-args", default="", help="Extra arguments of the spawned Relay")
+    direct_parser.add_argument("-R", "--relay-only", action="store_true", help="Middlemen without direct paths, as a baseline")
+    direct_parser.add_argument("-o", "--output", default="", help="File to write the JSON report to")
+    fec_parser = sub_parsers.add_parser("fec", help="Effective loss, RTT & overhead of Middleman FEC against injected loss")
+    fec_parser.add_argument("-l", "--losses", type=float, nargs="+", default=FEC_LOSSES, help="Loss of each leg to & from the Relay")
+    fec_parser.add_argument("-g", "--groups", type=int, nargs="+", default=FEC_GROUPS, help="Packets per parity packet, 0 disables FEC")
+    fec_parser.add_argument("-f", "--rate", type=float, default=FEC_RATE, help="Packets per second of the client")
+    fec_parser.add_argument("-s", "--size", type=int, default=PAYLOAD_SIZE, help="Application payload size [B]")
+    fec_parser.add_argument("-d", "--duration", type=float, default=FEC_DURATION)
+    fec_parser.add_argument("-o", "--output", default="", help="File to write the JSON reports to")
+    args = arg_parser.parse_args()
+
+    if args.benchmark == "peer-table":
+        benchmark_peer_table(args.packets)
+    elif args.benchmark == "codec":
+        benchmark_codec(args.iterations)
+    elif args.benchmark == "workers":
+        benchmark_workers(args.workers, args.clients, args.senders, args.duration)
+    elif args.benchmark == "backends":
+        benchmark_backends(args.backends, args.clients, args.senders, args.duration)
+    elif args.benchmark == "load":
+        benchmark_load(args)
+    elif args.benchmark == "direct":
+        benchmark_direct(args)
+    elif args.benchmark == "fec":
+        benchmark_fec(args)
@@ -0,0 +1,221 @@
+import math
+import socket
+import struct
+from typing import Callable
+
+from twisted.internet import task
+from twisted.internet.protocol import DatagramProtocol
+
+from your_turn import TURN_MSG_PREAMBLE_LEN, TURN_PREAMBLE, YourTurnPeer, YourTurnPeerTable, YourTurnRelay, make_turn_packet
+
+# Link packets between the nodes reuse the TURN preamble: UDP<prefix: uint16, peer id: uint32, Payload>
+# Packet for the peer with the ID, which is owned by the receiving node, Payload is the packet to send to the peer
+CLUSTER_MSG_FORWARD: int = 0x01
+# Peers owned by the sending node, Payload are the peer records, the ID is unused
+CLUSTER_MSG_ANNOUNCE: int = 0x02
+# Peers no longer owned by the sending node, Payload are the peer IDs (uint32), the ID is unused
+CLUSTER_MSG_WITHDRAW: int = 0x03
+# Asks the receiving node to announce all its peers, sent by a node when it starts
+CLUSTER_MSG_SYNC: int = 0x04
+
+# Announced peer record: peer ID, flags
+CLUSTER_PEER_RECORD = struct.Struct(">LB")
+CLUSTER_PEER_ID = struct.Struct(">L")
+CLUSTER_PEER_BUNDLING: int = 0x01
+# Peer just registered on the sending node, so it takes the peer over from any other node
+CLUSTER_PEER_REGISTERED: int = 0x02
+CLUSTER_RECORDS_MAX: int = 200  # Records per packet, so announcements fit into a single datagram
+
+
+def parse_cluster_node(node: str) -> tuple:
+    # host:port of a node link, resolved once, as link packets are matched by the address they come from
+    host, _, port = node.rpartition(":")
+    return socket.gethostbyname(host), int(port)
+
+
+class YourTurnClusterPeerTable(YourTurnPeerTable):
+    # Peer table of a cluster node. Peers owned by the other nodes are kept apart, as they aren't reached by their
+    # own address, but through the link to their node, which also means they are never looked up by address.
+    def __init__(self, relay: YourTurnRelay, link: "YourTurnClusterLink") -> None:
+        super().__init__()
+
+        self._relay: YourTurnRelay = relay
+        self._link: YourTurnClusterLink = link
+
+        self._remote_peers: dict = {}  # peer ID -> YourTurnPeer forwarding to its node
+        self._remote_nodes: dict = {}  # peer ID -> (link address of the owner node, when it was last announced)
+
+    def __contains__(self, peer_id: int) -> bool:
+        return peer_id in self._peers or peer_id in self._remote_peers
+
+    def get(self, peer_id: int, default: YourTurnPeer = None) -> YourTurnPeer:
+        peer: YourTurnPeer = self._peers.get(peer_id, None)
+        if peer is None:
+            return self._remote_peers.get(peer_id, default)
+        return peer
+
+    def get_local(self, peer_id: int) -> YourTurnPeer:
+        return self._peers.get(peer_id, None)
+
+    def get_remote_count(self) -> int:
+        return len(self._remote_peers)
+
+    def add(self, peer_id: int, peer: YourTurnPeer) -> bool:
+        is_registered: bool = super().add(peer_id, peer)
+        if peer_id in self._remote_peers:
+            # Peer moved over from another node
+            self._forget_remote(peer_id, retire=False)
+            is_registered = True
+        self._link.announce([peer_id], registered=True)
+        return is_registered
+
+    def remove(self, peer_id: int) -> YourTurnPeer:
+        peer: YourTurnPeer = super().remove(peer_id)
+        if peer is not None:
+            self._link.withdraw([peer_id])
+        return peer
+
+    def add_remote(self, peer_id: int, node: tuple, flags: int) -> None:
+        if peer_id in self._peers:
+            if not flags & CLUSTER_PEER_REGISTERED:
+                # Periodic announcement of a node, that didn't hear about the peer moving here yet
+                return
+            # Peer registered on the other node, so its NAT binding to this node isn't used anymore
+            super().remove(peer_id)
+            self._relay.get_data_port().detach(peer_id)
+
+        bundling: bool = bool(flags & CLUSTER_PEER_BUNDLING)
+        peer: YourTurnPeer = self._remote_peers.get(peer_id, None)
+        if peer is None or peer.get_addr() != node or peer.is_bundling() != bundling:
+            counters = self._relay.get_metrics().get_peer_counters(peer_id)
+            ip, port = node
+            peer = YourTurnPeer(peer_id, ip, port, self._link.make_forward(peer_id), counters, bundling)
+            self._remote_peers[peer_id] = peer
+        self._remote_nodes[peer_id] = (node, YourTurnPeer.now)
+
+    def remove_remote(self, peer_id: int, node: tuple) -> None:
+        # Withdrawals only count from the node, that owns the peer now
+        remote: tuple = self._remote_nodes.get(peer_id, None)
+        if remote is not None and remote[0] == node:
+            self._forget_remote(peer_id)
+
+    def forget_stale(self, announced_before: float) -> None:
+        # Peers of nodes that went down are forgotten, once they are no longer announced
+        for peer_id in [peer_id for peer_id, (_, announced) in self._remote_nodes.items() if announced < announced_before]:
+            self._forget_remote(peer_id)
+
+    def _forget_remote(self, peer_id: int, retire: bool = True) -> None:
+        del self._remote_peers[peer_id]
+        del self._remote_nodes[peer_id]
+        if retire:
+            self._relay.get_metrics().retire_peer(peer_id)
+
+
+class YourTurnClusterLink(DatagramProtocol):
+    # Link between the Relay nodes of a cluster. Every node owns the peers, that registered on it, as only it can
+    # reach them through their NAT. Registrations are announced to all the nodes, so packets for a peer owned by
+    # another node are forwarded to it, which then sends them to the peer as if they were relayed by it.
+    ANNOUNCE_PERIOD: float = 10.0  # [s] Owned peers are announced again, in case some announcements were lost
+    STALE_TIME: float = 3 * ANNOUNCE_PERIOD  # [s] Remote peers, that weren't announced for this long, are forgotten
+
+    def __init__(self, relay: YourTurnRelay, nodes: list) -> None:
+        super().__init__()
+
+        self._relay: YourTurnRelay = relay
+        self._log = relay.get_logger()
+        self._nodes: list = nodes  # (ip, port) link addresses of the other nodes
+        self._node_set: set = set(nodes)
+        self._announced: float = -math.inf  # [s] When were all the owned peers last announced
+
+        self._peer_map = YourTurnClusterPeerTable(relay, self)
+        relay.set_peer_map(self._peer_map)
+        relay.get_metrics().add_gauge("remote_peers", "Peers owned by the other cluster nodes", self._peer_map.get_remote_count)
+        self._ticker = task.LoopingCall(self.tick)
+
+    def get_peer_map(self) -> YourTurnClusterPeerTable:
+        return self._peer_map
+
+    def startProtocol(self) -> None:
+        self._ticker.start(YourTurnRelay.TICK_PERIOD, now=True)
+
+    def stopProtocol(self) -> None:
+        if self._ticker.running:
+            self._ticker.stop()
+
+    def tick(self) -> None:
+        # Drives the announcements, when the link isn't run by the Twisted reactor
+        now: float = YourTurnPeer.now
+        if now - self._announced < YourTurnClusterLink.ANNOUNCE_PERIOD:
+            return
+        if self._announced == -math.inf:
+            # Nodes that started earlier announce their peers right away, instead of in the next period
+            for node in self._nodes:
+                self.transport.write(make_turn_packet(0, prefix=CLUSTER_MSG_SYNC), node)
+        self._announced = now
+        self._peer_map.forget_stale(now - YourTurnClusterLink.STALE_TIME)
+        self.announce(list(self._peer_map))
+
+    def make_forward(self, peer_id: int) -> Callable:
+        # Send function of a remote peer, its address is the link address of its node
+        header: bytes = make_turn_packet(peer_id, prefix=CLUSTER_MSG_FORWARD)
+
+        def forward(data: bytes, node: tuple) -> None:
+            self.transport.write(header + data, node)
+        return forward
+
+    def announce(self, peer_ids: list, node: tuple = None, registered: bool = False) -> None:
+        records: list = []
+        for peer_id in peer_ids:
+            peer: YourTurnPeer = self._peer_map.get_local(peer_id)
+            if peer is None:
+                continue
+            flags: int = CLUSTER_PEER_REGISTERED if registered else 0
+            if peer.is_bundling():
+                flags |= CLUSTER_PEER_BUNDLING
+            records.append(CLUSTER_PEER_RECORD.pack(peer_id, flags))
+        self._send_records(CLUSTER_MSG_ANNOUNCE, records, node)
+
+    def withdraw(self, peer_ids: list) -> None:
+        self._send_records(CLUSTER_MSG_WITHDRAW, [CLUSTER_PEER_ID.pack(peer_id) for peer_id in peer_ids])
+
+    def _send_records(self, prefix: int, records: list, node: tuple = None) -> None:
+        nodes: list = self._nodes if node is None else [node]
+        for start in range(0, len(records), CLUSTER_RECORDS_MAX):
+            packet: bytes = make_turn_packet(0, b"".join(records[start:start + CLUSTER_RECORDS_MAX]), prefix=prefix)
+            for node in nodes:
+                self.transport.write(packet, node)
+
+    def datagramReceived(self, data: bytes, addr: tuple) -> None:
+        if addr not in self._node_set or len(data) < TURN_MSG_PREAMBLE_LEN:
+            self._relay.get_metrics().increment("invalid_packets")
+            self._log.log("invalid_cluster_packet", "Invalid cluster packet received from {}:{}!", *addr)
+            return
+
+        prefix, peer_id = TURN_PREAMBLE.unpack_from(data)
+        payload_size: int = len(data) - TURN_MSG_PREAMBLE_LEN
+        if (
+            prefix == CLUSTER_MSG_ANNOUNCE and payload_size % CLUSTER_PEER_RECORD.size != 0
+            or prefix == CLUSTER_MSG_WITHDRAW and payload_size % CLUSTER_PEER_ID.size != 0
+        ):
+            prefix = -1
+
+        if prefix == CLUSTER_MSG_FORWARD:
+            # Only owned peers are sent to, so a packet is never forwarded twice
+            peer: YourTurnPeer = self._peer_map.get_local(peer_id)
+            if peer is None:
+                self._relay.get_metrics().increment("unknown_peer_drops")
+                self._log.log("unknown_cluster_peer", "Peer {} forwarded by {}:{} isn't registered here", peer_id, *addr)
+                return
+            peer.send(data[TURN_MSG_PREAMBLE_LEN:])
+        elif prefix == CLUSTER_MSG_ANNOUNCE:
+            for announced_id, flags in CLUSTER_PEER_RECORD.iter_unpack(data[TURN_MSG_PREAMBLE_LEN:]):
+                self._peer_map.add_remote(announced_id, addr, flags)
+        elif prefix == CLUSTER_MSG_WITHDRAW:
+            for (withdrawn_id,) in CLUSTER_PEER_ID.iter_unpack(data[TURN_MSG_PREAMBLE_LEN:]):
+                self._peer_map.remove_remote(withdrawn_id, addr)
+        elif prefix == CLUSTER_MSG_SYNC:
+            self._log.log("cluster_sync", "Cluster node {}:{} started", *addr)
+            self.announce(list(self._peer_map), node=addr)
+        else:
+            self._relay.get_metrics().increment("invalid_packets")
+            self._log.log("invalid_cluster_packet", "Invalid cluster packet received from {}:{}!", *addr)
@@ -0,0 +1,137 @@
+import zlib
+from time import perf_counter_ns
+from typing import Callable
+
+from your_turn import TURN_DICTIONARY_ID
+from your_turn_metrics import YourTurnCompressionCounters
+
+# Raw deflate with a small window & memory, so copying the stream primed with the dictionary for every packet is cheap
+COMPRESSION_LEVEL: int = 6
+COMPRESSION_WBITS: int = 11
+COMPRESSION_MEM_LEVEL: int = 4
+COMPRESSION_PAYLOAD_MAX: int = 65507  # [B] Largest UDP payload, a decompressed one can't be larger
+
+
+def train_dictionary(samples: list, size: int) -> bytes:
+    # Deflate reaches the end of the dictionary cheapest, so the most frequent payloads go last, each of them once
+    counts: dict = {}
+    for sample in samples:
+        counts[sample] = counts.get(sample, 0) + 1
+    return b"".join(sorted(counts, key=counts.get))[-size:]
+
+
+class YourTurnCompressor:
+    # Compresses the packets for a single receiver. Payloads are sampled first, the dictionary trained from them is
+    # offered to the receiver & packets are compressed only once it accepts it. Receiver, that can't decompress them,
+    # never accepts, so it keeps getting the packets as they are.
+    SAMPLE_PERIOD: int = 4  # Every N-th payload is sampled
+    SAMPLES: int = 32
+    DICTIONARY_SIZE: int = 1024  # [B] Offer has to fit into a single datagram
+    OFFER_PERIOD: float = 1.0  # [s]
+    OFFERS_MAX: int = 5
+
+    def __init__(self, counters: YourTurnCompressionCounters, offer_function: Callable) -> None:
+        self._counters: YourTurnCompressionCounters = counters
+        self._offer: Callable = offer_function  # Sends the Payload of the dictionary offer to the receiver
+        self._samples: list = []
+        self._sample_countdown: int = 1
+        self._dictionary_id: int = 0
+        self._offer_payload: bytes = b""
+        self._offers: int = 0
+        self._template = None  # Compression stream primed with the accepted dictionary
+        self._header: bytes = b""
+
+    def is_active(self) -> bool:
+        return self._template is not None
+
+    def compress(self, payload: bytes) -> bytes:
+        # Payload of the compressed packet, empty if the payload should be sent as it is
+        if self._template is None:
+            if self._offer_payload == b"":
+                self._sample(payload)
+            return b""
+        counters: YourTurnCompressionCounters = self._counters
+        counters.bytes_in += len(payload)
+        start: int = perf_counter_ns()
+        stream = self._template.copy()
+        compressed: bytes = self._header + stream.compress(payload) + stream.flush()
+        counters.compress_ns += perf_counter_ns() - start
+        if len(compressed) >= len(payload):
+            counters.packets_skipped += 1
+            counters.bytes_out += len(payload)
+            return b""
+        counters.bytes_out += len(compressed)
+        return compressed
+
+    def tick(self) -> bool:
+        # Offers the dictionary again, until the receiver accepts it, returns True when it's given up
+        if self._template is not None or self._offer_payload == b"" or self._offers > YourTurnCompressor.OFFERS_MAX:
+            return False
+        self._offers += 1
+        if self._offers > YourTurnCompressor.OFFERS_MAX:
+            return True
+        self._offer(self._offer_payload)
+        return False
+
+    def accept(self, dictionary_id: int) -> bool:
+        # Receiver accepted the dictionary, returns False if it isn't the offered one
+        if self._template is not None or self._offer_payload == b"" or dictionary_id != self._dictionary_id:
+            return False
+        self._template = zlib.compressobj(
+            COMPRESSION_LEVEL,
+            zlib.DEFLATED,
+            -COMPRESSION_WBITS,
+            COMPRESSION_MEM_LEVEL,
+            zlib.Z_DEFAULT_STRATEGY,
+            self._offer_payload[TURN_DICTIONARY_ID.size:]
+        )
+        self._header = TURN_DICTIONARY_ID.pack(dictionary_id)
+        return True
+
+    def _sample(self, payload: bytes) -> None:
+        self._sample_countdown -= 1
+        if self._sample_countdown > 0:
+            return
+        self._sample_countdown = YourTurnCompressor.SAMPLE_PERIOD
+        self._samples.append(bytes(payload))
+        if len(self._samples) < YourTurnCompressor.SAMPLES:
+            return
+        dictionary: bytes = train_dictionary(self._samples, YourTurnCompressor.DICTIONARY_SIZE)
+        self._samples = []
+        self._offer_payload = TURN_DICTIONARY_ID.pack(self._dictionary_id) + dictionary
+        self._offers = 1
+        self._offer(self._offer_payload)
+
+
+class YourTurnDecompressor:
+    # Decompresses the packets from a single sender, with the dictionaries it offered
+    def __init__(self, counters: YourTurnCompressionCounters) -> None:
+        self._counters: YourTurnCompressionCounters = counters
+        self._templates: dict = {}  # dictionary ID -> decompression stream primed with the dictionary
+
+    def add_dictionary(self, offer: bytes) -> int:
+        # Returns the ID of the offered dictionary, -1 if the offer isn't valid
+        if len(offer) <= TURN_DICTIONARY_ID.size:
+            return -1
+        dictionary_id: int = TURN_DICTIONARY_ID.unpack_from(offer)[0]
+        self._templates[dictionary_id] = zlib.decompressobj(-COMPRESSION_WBITS, zdict=offer[TURN_DICTIONARY_ID.size:])
+        return dictionary_id
+
+    def decompress(self, compressed: bytes) -> bytes:
+        # Original payload, None if it can't be decompressed
+        if len(compressed) <= TURN_DICTIONARY_ID.size:
+            return None
+        template = self._templates.get(compressed[0], None)
+        if template is None:
+            return None
+        start: int = perf_counter_ns()
+        stream = template.copy()
+        try:
+            payload: bytes = stream.decompress(compressed[TURN_DICTIONARY_ID.size:], COMPRESSION_PAYLOAD_MAX)
+        except zlib.error:
+            return None
+        finally:
+            self._counters.decompress_ns += perf_counter_ns() - start
+        if not stream.eof or stream.unconsumed_tail:
+            return None
+        return payload
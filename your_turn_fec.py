@@ -0,0 +1,133 @@
+import random
+import struct
+from typing import Callable
+
+from your_turn import TURN_FEC_HEADER, TURN_FEC_PARITY
+from your_turn_metrics import YourTurnMetrics
+
+# Every data packet goes into the parity with its length in front, so the length of a rebuilt packet is known too
+FEC_LENGTH = struct.Struct(">H")
+FEC_GROUP_SIZE_MAX: int = TURN_FEC_PARITY - 1
+
+
+def xor_fec_block(parity: int, parity_size: int, block: bytes) -> tuple:
+    # Blocks are aligned to the start, shorter ones are padded with zeros. Python integers XOR a whole block at once,
+    # which is much faster than going byte by byte.
+    if len(block) > parity_size:
+        parity <<= 8 * (len(block) - parity_size)
+        parity_size = len(block)
+    return parity ^ (int.from_bytes(block, "big") << 8 * (parity_size - len(block))), parity_size
+
+
+class YourTurnFecEncoder:
+    # Sends a parity packet after every group of data packets, the XOR of all of them, so the receiver can rebuild any
+    # single packet of the group, that got lost. Data packets are sent right away, so they aren't delayed at all.
+    # Group that didn't fill up gets its parity, once no packet was added for a whole flush period.
+    FLUSH_PERIOD: float = 0.05  # [s]
+
+    def __init__(self, group_size: int, send_function: Callable, metrics: YourTurnMetrics) -> None:
+        self._group_size: int = min(group_size, FEC_GROUP_SIZE_MAX)
+        self._send: Callable = send_function  # Takes the Payload of the FEC packet
+        self._metrics: YourTurnMetrics = metrics
+        # Random first group, so the receiver doesn't take the groups of a restarted sender for ones it already has
+        self._group: int = random.getrandbits(16)
+        self._count: int = 0  # Data packets in the current group
+        self._parity: int = 0
+        self._parity_size: int = 0
+        self._is_idle: bool = True
+
+    def add(self, payload: bytes) -> None:
+        self._send(TURN_FEC_HEADER.pack(self._group, self._count) + payload)
+        self._parity, self._parity_size = xor_fec_block(self._parity, self._parity_size, FEC_LENGTH.pack(len(payload)) + payload)
+        self._count += 1
+        self._is_idle = False
+        if self._count >= self._group_size:
+            self._send_parity()
+
+    def tick(self) -> None:
+        if self._count > 0 and self._is_idle:
+            self._send_parity()
+        self._is_idle = True
+
+    def _send_parity(self) -> None:
+        self._metrics.increment("fec_parity_packets")
+        self._send(TURN_FEC_HEADER.pack(self._group, TURN_FEC_PARITY | self._count) + self._parity.to_bytes(self._parity_size, "big"))
+        self._group = (self._group + 1) & 0xFFFF
+        self._count = 0
+        self._parity = 0
+        self._parity_size = 0
+
+
+class YourTurnFecDecoder:
+    # Passes the data packets on as they come, and keeps the last few groups, so a packet missing from one of them is
+    # rebuilt from the parity & the rest of the group. Rebuilt packet comes late, but a game would rather have it late
+    # than never, as it can't wait for a retransmission.
+    WINDOW: int = 16  # Groups kept
+
+    def __init__(self, metrics: YourTurnMetrics) -> None:
+        self._metrics: YourTurnMetrics = metrics
+        self._groups: dict = {}  # group sequence -> [index -> payload, parity, number of data packets]
+
+    def receive(self, payload: bytes) -> list:
+        # Payloads to pass on, None if the FEC packet isn't valid
+        if len(payload) < TURN_FEC_HEADER.size:
+            return None
+        sequence, index = TURN_FEC_HEADER.unpack_from(payload)
+        payload = payload[TURN_FEC_HEADER.size:]
+        group: list = self._groups.get(sequence, None)
+        if group is None:
+            group = [{}, None, 0]
+            self._groups[sequence] = group
+            if len(self._groups) > YourTurnFecDecoder.WINDOW:
+                self._retire(next(iter(self._groups)))
+
+        received: dict = group[0]
+        payloads: list = []
+        if index & TURN_FEC_PARITY:
+            if index == TURN_FEC_PARITY or len(payload) < FEC_LENGTH.size:
+                return None
+            if group[1] is not None:
+                return []
+            group[1] = payload
+            group[2] = index & ~TURN_FEC_PARITY
+        elif index in received:
+            # Duplicate, or the packet was rebuilt already
+            return []
+        else:
+            received[index] = payload
+            payloads.append(payload)
+
+        if group[1] is None:
+            return payloads
+        missing: list = [index for index in range(group[2]) if index not in received]
+        if len(missing) == 1:
+            rebuilt: bytes = self._rebuild(group)
+            if rebuilt is None:
+                return None
+            received[missing[0]] = rebuilt
+            payloads.append(rebuilt)
+            self._metrics.increment("fec_recovered_packets")
+        return payloads
+
+    def _rebuild(self, group: list) -> bytes:
+        received, parity, count = group
+        value: int = int.from_bytes(parity, "big")
+        for index in range(count):
+            payload: bytes = received.get(index, None)
+            if payload is None:
+                continue
+            block: bytes = FEC_LENGTH.pack(len(payload)) + payload
+            if len(block) > len(parity):
+                return None
+            value, _ = xor_fec_block(value, len(parity), block)
+        block = value.to_bytes(len(parity), "big")
+        size: int = FEC_LENGTH.unpack_from(block)[0]
+        if size > len(block) - FEC_LENGTH.size:
+            return None
+        return block[FEC_LENGTH.size:FEC_LENGTH.size + size]
+
+    def _retire(self, sequence: int) -> None:
+        received, parity, count = self._groups.pop(sequence)
+        if parity is not None and any(index not in received for index in range(count)):
+            # Parity only rebuilds a single packet
+            self._metrics.increment("fec_unrecoverable_groups")
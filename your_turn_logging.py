@@ -0,0 +1,58 @@
+from time import monotonic
+
+
+class YourTurnLogger:
+    # Messages are rate limited per key, so a flood of bad packets doesn't turn into a flood of blocking prints.
+    # Messages are only formatted when they are printed, suppressed ones are counted & reported by flush().
+    RATE_LIMIT_PERIOD: float = 1.0  # [s]
+    RATE_LIMIT_MESSAGES: int = 10  # Messages of the same key printed per period
+    # Verbose packet tracing prints only every N-th packet, so it can stay enabled under load
+    TRACE_SAMPLE_PERIOD: int = 100
+
+    def __init__(self, trace_sample_period: int = 0) -> None:
+        self._trace_period: int = trace_sample_period  # 0 disables tracing
+        self._trace_countdown: int = 1
+
+        self._windows: dict = {}  # key -> [start of the rate limit window, messages printed in it]
+        self._suppressed: dict = {}  # key -> messages suppressed since the last report
+
+    def log(self, key: str, message: str, *args) -> None:
+        now: float = monotonic()
+        window: list = self._windows.get(key, None)
+        if window is None or now - window[0] >= YourTurnLogger.RATE_LIMIT_PERIOD:
+            self._report_suppressed(key)
+            window = [now, 0]
+            self._windows[key] = window
+        if window[1] >= YourTurnLogger.RATE_LIMIT_MESSAGES:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return
+        window[1] += 1
+        print(message.format(*args) if args else message)
+
+    def flush(self) -> None:
+        # Reports suppressed messages of keys, whose rate limit window is over, even if they don't occur anymore
+        if not self._suppressed:
+            return
+        now: float = monotonic()
+        for key in list(self._suppressed):
+            if now - self._windows[key][0] >= YourTurnLogger.RATE_LIMIT_PERIOD:
+                self._report_suppressed(key)
+                del self._windows[key]
+
+    def sample_trace(self) -> bool:
+        # Whether the current packet should be traced
+        if self._trace_period <= 0:
+            return False
+        self._trace_countdown -= 1
+        if self._trace_countdown > 0:
+            return False
+        self._trace_countdown = self._trace_period
+        return True
+
+    def trace(self, message: str) -> None:
+        print(message)
+
+    def _report_suppressed(self, key: str) -> None:
+        suppressed: int = self._suppressed.pop(key, 0)
+        if suppressed > 0:
+            print(f"{suppressed} messages like '{key}' suppressed")
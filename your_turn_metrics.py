@@ -0,0 +1,339 @@
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROMETHEUS_CONTENT_TYPE: str = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class YourTurnPeerCounters:
+    # Traffic of a single peer, incremented on the packet path, so it's kept as plain attributes
+    __slots__ = ("packets_in", "bytes_in", "packets_out", "bytes_out", "packets_dropped", "bytes_dropped", "packets_deferred")
+
+    def __init__(self) -> None:
+        self.packets_in: int = 0
+        self.bytes_in: int = 0
+        self.packets_out: int = 0
+        self.bytes_out: int = 0
+        # Packets from the peer over its rate limit
+        self.packets_dropped: int = 0
+        self.bytes_dropped: int = 0
+        self.packets_deferred: int = 0
+
+    def add(self, counters: "YourTurnPeerCounters") -> None:
+        for counter in YourTurnPeerCounters.__slots__:
+            setattr(self, counter, getattr(self, counter) + getattr(counters, counter))
+
+
+class YourTurnLatencyHistogram:
+    # Forwarding latency histogram, only every SAMPLE_PERIOD-th packet reads the clock
+    BUCKETS: tuple = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2)  # [s]
+    SAMPLE_PERIOD: int = 64
+
+    def __init__(self, buckets: tuple = BUCKETS) -> None:
+        self._buckets: tuple = buckets
+        self._counts: list = [0] * (len(buckets) + 1)
+        self._sum: float = 0.0
+        self._countdown: int = YourTurnLatencyHistogram.SAMPLE_PERIOD
+
+    def start(self) -> float:
+        # Returns the start time of a sampled packet, 0 if the packet isn't sampled
+        self._countdown -= 1
+        if self._countdown > 0:
+            return 0.0
+        self._countdown = YourTurnLatencyHistogram.SAMPLE_PERIOD
+        return perf_counter()
+
+    def stop(self, start: float) -> None:
+        if start:
+            self.observe(perf_counter() - start)
+
+    def observe(self, latency: float) -> None:
+        self._counts[bisect_left(self._buckets, latency)] += 1
+        self._sum += latency
+
+    def render(self, name: str, help: str) -> list:
+        return [f"# HELP {name} {help}", f"# TYPE {name} histogram"] + self.render_samples(name)
+
+    def render_samples(self, name: str, labels: str = "") -> list:
+        # Sample lines only, so histograms with different labels can share the HELP & TYPE lines
+        bucket_labels: str = labels + "," if labels else ""
+        lines: list = []
+        count: int = 0
+        for bound, bucket_count in zip(self._buckets, self._counts):
+            count += bucket_count
+            lines.append(f'{name}_bucket{{{bucket_labels}le="{bound}"}} {count}')
+        count += self._counts[-1]
+        lines.append(f'{name}_bucket{{{bucket_labels}le="+Inf"}} {count}')
+        labels = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{labels} {self._sum}")
+        lines.append(f"{name}_count{labels} {count}")
+        return lines
+
+
+class YourTurnHopTraces:
+    # Collects the stamps of the traced packets, that reached their last Middleman, into the time spent on each hop
+    # & on the legs between them, and tracks their sequence numbers per sender for loss & reordering.
+    # NOTE: Stamps are taken by the monotonic clock of each host, so legs between hosts are offset by the difference
+    # of their clocks. They are exact only on a single host, otherwise they show how the leg changes over time.
+    BUCKETS: tuple = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0)  # [s]
+    # Sequence numbers this far behind the highest one mean the sender started over
+    REORDER_WINDOW: int = 1024
+
+    def __init__(self, hop_names: dict) -> None:
+        self._hop_names: dict = hop_names  # hop -> name of the hops in between the Middlemen
+        self._hops: dict = {}  # hop name -> YourTurnLatencyHistogram of the time spent on it
+        self._legs: dict = {}  # "hop->next hop" -> YourTurnLatencyHistogram of the time between them
+        self._streams: dict = {}  # sender -> [first sequence number, highest sequence number, packets received]
+        self._packets: int = 0
+        self._reordered: int = 0
+        self._retired_lost: int = 0  # Lost packets of the forgotten senders
+
+    def observe(self, sender, sequence: int, stamps: list) -> None:
+        # Stamps are (hop, ingress [ns], egress [ns]) in the order of the path, the first hop is the sending Middleman
+        self._packets += 1
+        stream: list = self._streams.get(sender, None)
+        if stream is None or sequence + YourTurnHopTraces.REORDER_WINDOW < stream[1]:
+            if stream is not None:
+                self._retired_lost += self._get_lost(stream)
+            self._streams[sender] = [sequence, sequence, 1]
+        else:
+            stream[2] += 1
+            if sequence > stream[1]:
+                stream[1] = sequence
+            else:
+                self._reordered += 1
+                stream[0] = min(stream[0], sequence)
+
+        previous: str = ""
+        previous_egress: int = 0
+        for index, (hop, ingress, egress) in enumerate(stamps):
+            if index == 0:
+                name: str = "sender"
+            elif index == len(stamps) - 1:
+                name = "receiver"
+            else:
+                name = self._hop_names.get(hop, f"hop{hop}")
+            self._get_histogram(self._hops, name).observe((egress - ingress) / 1e9)
+            if previous:
+                self._get_histogram(self._legs, f"{previous}->{name}").observe((ingress - previous_egress) / 1e9)
+            previous, previous_egress = name, egress
+
+    def forget(self, sender) -> None:
+        stream: list = self._streams.pop(sender, None)
+        if stream is not None:
+            self._retired_lost += self._get_lost(stream)
+
+    def get_lost(self) -> int:
+        return self._retired_lost + sum(self._get_lost(stream) for stream in list(self._streams.values()))
+
+    def render(self, namespace: str) -> list:
+        # Nothing until the first traced packet arrives, as tracing is opt-in
+        if self._packets == 0:
+            return []
+        name: str = f"{namespace}_trace_packets_total"
+        lines: list = [f"# HELP {name} Traced packets received", f"# TYPE {name} counter", f"{name} {self._packets}"]
+        name = f"{namespace}_trace_reordered_total"
+        lines += [f"# HELP {name} Traced packets received after a later one", f"# TYPE {name} counter", f"{name} {self._reordered}"]
+        name = f"{namespace}_trace_lost_packets"
+        lines += [f"# HELP {name} Traced packets missing, late ones are subtracted once they arrive", f"# TYPE {name} gauge", f"{name} {self.get_lost()}"]
+        for histograms, label, help in (
+            (self._hops, "hop", "Time traced packets spent on the hop"),
+            (self._legs, "leg", "Time traced packets spent between the hops"),
+        ):
+            name = f"{namespace}_trace_{label}_seconds"
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+            for key, histogram in list(histograms.items()):
+                lines += histogram.render_samples(name, f'{label}="{key}"')
+        return lines
+
+    def _get_histogram(self, histograms: dict, key: str) -> YourTurnLatencyHistogram:
+        histogram: YourTurnLatencyHistogram = histograms.get(key, None)
+        if histogram is None:
+            histogram = YourTurnLatencyHistogram(YourTurnHopTraces.BUCKETS)
+            histograms[key] = histogram
+        return histogram
+
+    @staticmethod
+    def _get_lost(stream: list) -> int:
+        first, highest, received = stream
+        return max(0, highest - first + 1 - received)
+
+
+class YourTurnCompressionCounters:
+    # Compression of the packets for a single peer & decompression of the ones from it, incremented on the packet path
+    __slots__ = ("bytes_in", "bytes_out", "packets_skipped", "compress_ns", "decompress_ns")
+
+    def __init__(self) -> None:
+        self.bytes_in: int = 0  # Payloads handed to the compressor
+        self.bytes_out: int = 0  # Payloads sent for them, compressed or not
+        self.packets_skipped: int = 0  # Payloads sent as they are, as they didn't shrink
+        # Time spent in zlib, which doesn't block, so it's the CPU cost
+        self.compress_ns: int = 0
+        self.decompress_ns: int = 0
+
+
+class YourTurnCompressionStats:
+    # Per peer compression ratio & CPU cost of the compressed sessions
+    COUNTERS: tuple = (
+        ("bytes_in", "compression_input_bytes_total", "Payload bytes for the peer handed to the compressor"),
+        ("bytes_out", "compression_output_bytes_total", "Payload bytes sent to the peer for them"),
+        ("packets_skipped", "compression_skipped_packets_total", "Payloads for the peer, that didn't shrink"),
+    )
+
+    def __init__(self) -> None:
+        self._peers: dict = {}  # peer -> YourTurnCompressionCounters
+
+    def get_counters(self, peer) -> YourTurnCompressionCounters:
+        counters: YourTurnCompressionCounters = self._peers.get(peer, None)
+        if counters is None:
+            counters = YourTurnCompressionCounters()
+            self._peers[peer] = counters
+        return counters
+
+    def forget(self, peer) -> None:
+        self._peers.pop(peer, None)
+
+    def render(self, namespace: str) -> list:
+        # Nothing until a session is compressed, as compression is opt-in
+        peers: list = list(self._peers.items())
+        if len(peers) == 0:
+            return []
+        lines: list = []
+        for counter, suffix, help in YourTurnCompressionStats.COUNTERS:
+            name: str = f"{namespace}_{suffix}"
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{peer="{peer}"}} {getattr(counters, counter)}' for peer, counters in peers]
+        name = f"{namespace}_compression_ratio"
+        lines += [f"# HELP {name} Payload bytes for the peer against the bytes sent for them", f"# TYPE {name} gauge"]
+        lines += [f'{name}{{peer="{peer}"}} {counters.bytes_in / counters.bytes_out}' for peer, counters in peers if counters.bytes_out > 0]
+        for counter, suffix, help in (
+            ("compress_ns", "compression_seconds_total", "compressing the packets for"),
+            ("decompress_ns", "decompression_seconds_total", "decompressing the packets from"),
+        ):
+            name = f"{namespace}_{suffix}"
+            lines += [f"# HELP {name} CPU time spent {help} the peer", f"# TYPE {name} counter"]
+            lines += [f'{name}{{peer="{peer}"}} {getattr(counters, counter) / 1e9}' for peer, counters in peers]
+        return lines
+
+
+class YourTurnMetrics:
+    # Counters of a Relay or Middleman, rendered in the Prometheus text format only when scraped.
+    # Totals are summed up from the peer counters at scrape time, so the packet path only touches its own peer.
+    PEER_COUNTERS: tuple = (
+        ("packets_in", "Packets received from the peer"),
+        ("bytes_in", "Bytes received from the peer"),
+        ("packets_out", "Packets sent to the peer"),
+        ("bytes_out", "Bytes sent to the peer"),
+    )
+
+    RATE_LIMIT_COUNTERS: tuple = (
+        ("packets_dropped", "Packets from the peer dropped by its rate limit"),
+        ("bytes_dropped", "Bytes from the peer dropped by its rate limit"),
+        ("packets_deferred", "Packets from the peer delayed by its rate limit"),
+    )
+
+    def __init__(self, namespace: str, events: dict, peer_counters: tuple = PEER_COUNTERS) -> None:
+        self._namespace: str = namespace
+        self._peer_counters: tuple = peer_counters  # (counter, description) of the rendered peer counters
+        self._event_help: dict = events  # event name -> description
+        self._events: dict = dict.fromkeys(events, 0)
+        self._peers: dict = {}  # peer key -> YourTurnPeerCounters
+        self._retired = YourTurnPeerCounters()  # Traffic of the peers, that are gone
+        self._gauges: list = []  # (name, description, function returning the value)
+        self._collectors: list = []  # Objects rendering their own lines, e.g. YourTurnHopTraces
+        self.latency = YourTurnLatencyHistogram()
+
+    def get_peer_counters(self, peer_key) -> YourTurnPeerCounters:
+        # Counters are kept per peer key, so they survive re-registrations of the peer
+        counters: YourTurnPeerCounters = self._peers.get(peer_key, None)
+        if counters is None:
+            counters = YourTurnPeerCounters()
+            self._peers[peer_key] = counters
+        return counters
+
+    def retire_peer(self, peer_key) -> None:
+        counters: YourTurnPeerCounters = self._peers.pop(peer_key, None)
+        if counters is not None:
+            self._retired.add(counters)
+
+    def increment(self, event: str) -> None:
+        self._events[event] += 1
+
+    def get_event_count(self, event: str) -> int:
+        return self._events[event]
+
+    def get_total(self, counter: str) -> int:
+        # Sum of the peer counter over all the peers, also the ones that are gone
+        return getattr(self._retired, counter) + sum(getattr(counters, counter) for counters in list(self._peers.values()))
+
+    def add_gauge(self, name: str, help: str, function: Callable) -> None:
+        self._gauges.append((name, help, function))
+
+    def add_collector(self, collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        # NOTE: Called from the endpoint thread, peers are copied first, as they can change in the meantime
+        peers: list = list(self._peers.items())
+        totals = YourTurnPeerCounters()
+        totals.add(self._retired)
+        for _, counters in peers:
+            totals.add(counters)
+
+        lines: list = []
+        for counter, help in self._peer_counters:
+            name: str = f"{self._namespace}_{counter}_total"
+            lines += [f"# HELP {name} {help}, in total", f"# TYPE {name} counter", f"{name} {getattr(totals, counter)}"]
+            name = f"{self._namespace}_peer_{counter}_total"
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{peer="{peer_key}"}} {getattr(counters, counter)}' for peer_key, counters in peers]
+
+        for event, count in list(self._events.items()):
+            name: str = f"{self._namespace}_{event}_total"
+            lines += [f"# HELP {name} {self._event_help[event]}", f"# TYPE {name} counter", f"{name} {count}"]
+
+        for gauge, help, function in self._gauges:
+            name: str = f"{self._namespace}_{gauge}"
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {function()}"]
+
+        lines += self.latency.render(f"{self._namespace}_forward_latency_seconds", "Sampled packet forwarding latency")
+        for collector in self._collectors:
+            lines += collector.render(self._namespace)
+        return "\n".join(lines) + "\n"
+
+
+class YourTurnMetricsServer:
+    # Local HTTP endpoint serving the metrics to Prometheus.
+    # It runs on its own thread, so it works with any I/O backend & costs nothing until scraped.
+    def __init__(self, metrics: YourTurnMetrics, port: int, host: str = "127.0.0.1") -> None:
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body: bytes = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                # Scrapes are not worth a print each
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def get_port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -1,20 +1,60 @@
 import argparse
+import math
 from typing import Callable
 from collections import deque
 from zlib import adler32
 import uuid
 import re
+from time import monotonic, monotonic_ns
 
-from twisted.internet import reactor
+from twisted.internet import reactor, task
 from twisted.internet.protocol import DatagramProtocol
 from twisted.internet.error import CannotListenError
-from twisted.internet.defer import Deferred
+from twisted.internet.defer import Deferred, fail, succeed
 
 from your_turn import (
     YOUR_TURN_PORT,
+    YOUR_TURN_DATA_PORT,
+    TURN_MSG_PREFIX,
+    TURN_MSG_PREAMBLE_LEN,
+    TURN_MSG_UNREGISTER_PREFIX,
+    TURN_MSG_BUNDLE_PREFIX,
+    TURN_BUNDLE_FRAME,
+    TURN_MSG_GROUP_PREFIX,
+    TURN_MSG_PROBE_PREFIX,
+    TURN_MSG_REGISTER_BATCH_PREFIX,
+    TURN_REGISTER_RECORD,
+    TURN_REGISTER_BUNDLING,
+    TURN_MSG_TRACE_PREFIX,
+    TURN_TRACE_HOP_MIDDLEMAN,
+    TURN_TRACE_HOP_RELAY,
+    TURN_MSG_KEEP_ALIVE_PREFIX,
+    TURN_KEEP_ALIVE_PERIOD,
+    TURN_MSG_DIRECT_PREFIX,
+    TURN_MSG_DIRECT_PROBE_PREFIX,
+    TURN_DIRECT_PROBE,
+    TURN_MSG_FEC_PREFIX,
+    TURN_MSG_COMPRESSED_PREFIX,
+    TURN_MSG_DICTIONARY_PREFIX,
+    TURN_DICTIONARY_ID,
+    TURN_GROUP_SET,
+    TURN_GROUP_ADD,
+    TURN_GROUP_DELETE,
+    YourTurnRelay,
     parse_turn_packet,
+    parse_turn_message,
     make_turn_packet,
+    make_turn_group_control,
+    make_turn_trace_packet,
+    parse_turn_trace,
+    parse_turn_direct_addr,
+    split_turn_bundle,
 )
+from your_turn_compression import YourTurnCompressor, YourTurnDecompressor
+from your_turn_fec import YourTurnFecDecoder, YourTurnFecEncoder
+from your_turn_metrics import YourTurnCompressionStats, YourTurnHopTraces, YourTurnMetrics, YourTurnMetricsServer, YourTurnPeerCounters
+from your_turn_logging import YourTurnLogger
+from your_turn_profiling import YourTurnProfiler
 
 YOUR_TURN_IP: str = "127.0.0.1"
 
@@ -22,8 +62,80 @@ VALID_IP_ADDR_REGEX: str = "^(([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.
 VALID_HOSTNAME_REGEX: str = "^(([a-zA-Z0-9]|[a-zA-Z0-9][a-zA-Z0-9\-]*[a-zA-Z0-9])\.)*([A-Za-z0-9]|[A-Za-z0-9][A-Za-z0-9\-]*[A-Za-z0-9])$"
 
 
+SEND_QUEUE_DROP_OLDEST: str = "drop-oldest"
+SEND_QUEUE_DROP_NEWEST: str = "drop-newest"
+SEND_QUEUE_POLICIES: tuple = (SEND_QUEUE_DROP_OLDEST, SEND_QUEUE_DROP_NEWEST)
+
+
+class YourTurnSendQueue:
+    # Bounded queue of datagrams waiting to be sent, it drops packets according to its policy instead of growing
+    MAX_PACKETS: int = 1024
+    MAX_BYTES: int = 1 << 20
+
+    def __init__(self, max_packets: int = MAX_PACKETS, max_bytes: int = MAX_BYTES, policy: str = SEND_QUEUE_DROP_OLDEST) -> None:
+        if policy not in SEND_QUEUE_POLICIES:
+            raise ValueError(f"Send queue policy has to be one of {SEND_QUEUE_POLICIES}!")
+        self._max_packets: int = max_packets
+        self._max_bytes: int = max_bytes
+        self._policy: str = policy
+
+        self._packets = deque()
+        self._bytes: int = 0
+        self._dropped_packets: int = 0
+        self._dropped_bytes: int = 0
+
+    def __len__(self) -> int:
+        return len(self._packets)
+
+    def get_bytes(self) -> int:
+        return self._bytes
+
+    def get_dropped_packets(self) -> int:
+        return self._dropped_packets
+
+    def get_dropped_bytes(self) -> int:
+        return self._dropped_bytes
+
+    def push(self, data: bytes) -> bool:
+        # Returns False if the packet was dropped
+        # Mutable buffers are copied, as the queued packet could outlive their contents
+        if type(data) is not bytes:
+            data = bytes(data)
+        size: int = len(data)
+        if self._max_packets <= 0 or size > self._max_bytes:
+            self._drop(size)
+            return False
+
+        is_full: bool = len(self._packets) >= self._max_packets or self._bytes + size > self._max_bytes
+        if is_full and self._policy == SEND_QUEUE_DROP_NEWEST:
+            self._drop(size)
+            return False
+        while len(self._packets) >= self._max_packets or self._bytes + size > self._max_bytes:
+            self._drop(len(self.pop()))
+
+        self._packets.append(data)
+        self._bytes += size
+        return True
+
+    def peek(self) -> bytes:
+        return self._packets[0]
+
+    def pop(self) -> bytes:
+        data: bytes = self._packets.popleft()
+        self._bytes -= len(data)
+        return data
+
+    def _drop(self, size: int) -> None:
+        self._dropped_packets += 1
+        self._dropped_bytes += size
+
+
 class YourTurnMiddlemanInterface(DatagramProtocol):
-    def __init__(self, id: int, recv_callback: Callable, recv_port: int = 0, send_port: int = 0, send_ip: str = "") -> None:
+    # Socket that can't take any more is retried after a while, instead of waiting for it to become writable, since
+    # a second descriptor on the fd of the port would take its place in the reactor and the port would stop reading
+    FLUSH_RETRY_PERIOD: float = 0.001  # [s]
+
+    def __init__(self, id: int, recv_callback: Callable, recv_port: int = 0, send_port: int = 0, send_ip: str = "", send_queue: YourTurnSendQueue = None, counters: YourTurnPeerCounters = None) -> None:
         self._id: int = id
         self._recv_port: int = recv_port
         self._send_ip: str = send_ip
@@ -31,7 +143,10 @@ class YourTurnMiddlemanInterface(DatagramProtocol):
         self._recv_callback: Callable = recv_callback
 
         self.__running: bool = False
-        self.__send_buffer = deque()
+        # Holds packets sent before the interface is ready, or while the socket can't take any more
+        self._send_queue: YourTurnSendQueue = YourTurnSendQueue() if send_queue is None else send_queue
+        self.__flush_retry = None  # Delayed call, that retries sending the queue
+        self._counters: YourTurnPeerCounters = YourTurnPeerCounters() if counters is None else counters
     
     def is_running(self) -> bool:
         return self.__running
@@ -54,44 +169,246 @@ class YourTurnMiddlemanInterface(DatagramProtocol):
     def has_valid_send_addr(self) -> bool:
         return self._send_port > 1024 and self._send_ip != ""
 
+    def get_send_queue(self) -> YourTurnSendQueue:
+        return self._send_queue
+
+    def get_counters(self) -> YourTurnPeerCounters:
+        return self._counters
+
     def startProtocol(self) -> None:
         self.__running = True
-    	# Clear out send buffer
-        # TODO: Try using self.transport.writeSequence(data) to write the entire buffer in one go
-        while True:
-            try:
-                data: bytes = self.__send_buffer.popleft()
-                self.transport.write(data, addr=self.get_send_addr())
-            except IndexError:
-                break
+        self.flush()
     
     def stopProtocol(self) -> None:
         self.__running = False
+        if self.__flush_retry is not None:
+            if self.__flush_retry.active():
+                self.__flush_retry.cancel()
+            self.__flush_retry = None
 
     def datagramReceived(self, data: bytes, addr: tuple) -> None:
+        counters: YourTurnPeerCounters = self._counters
+        counters.packets_in += 1
+        counters.bytes_in += len(data)
         self._recv_callback(self._id, data, addr)
+
+    def close(self) -> None:
+        if self.__running:
+            self.transport.stopListening()
     
     def connectionRefused(self):
         # TODO: Implement handling of failed connections
         pass
     
     def send_data(self, data: bytes) -> None:
-        if self.__running:
+        # Counted when handed over, packets dropped by the send queue are counted by it
+        counters: YourTurnPeerCounters = self._counters
+        counters.packets_out += 1
+        counters.bytes_out += len(data)
+        # Keep the order of packets, by queueing behind the ones already waiting
+        if not self.__running or len(self._send_queue) > 0 or not self.has_valid_send_addr():
+            self._send_queue.push(data)
+            return
+        try:
+            self.transport.write(data, addr=self.get_send_addr())
+        except BlockingIOError:
+            self._send_queue.push(data)
+            self._retry_flush()
+
+    def flush(self) -> None:
+        # Send out as much of the queue as the socket takes in one go
+        # NOTE: UDP ports don't support writeSequence, so each datagram is still written on its own
+        if not self.__running or not self.has_valid_send_addr():
+            return
+        send_addr: tuple = self.get_send_addr()
+        while len(self._send_queue) > 0:
             try:
-                self.transport.write(data, addr=self.get_send_addr())
-            except BlockingIOError as e:
-                print(e)
-        else:
-            self.__send_buffer.append(data)
+                self.transport.write(self._send_queue.peek(), addr=send_addr)
+            except BlockingIOError:
+                self._retry_flush()
+                return
+            self._send_queue.pop()
+
+    def _retry_flush(self) -> None:
+        if self.__flush_retry is None or not self.__flush_retry.active():
+            self.__flush_retry = reactor.callLater(YourTurnMiddlemanInterface.FLUSH_RETRY_PERIOD, self.flush)
 
 
 class YourTurnMiddlemanRelay(YourTurnMiddlemanInterface):
+    DATA_PORT_PROBE_PERIOD: float = 0.5  # [s]
+    DATA_PORT_PROBE_ATTEMPTS: int = 6
+    # Registration is renewed well within the Relay lease time, so it doesn't expire while the session is idle
+    LEASE_RENEW_PERIOD: float = YourTurnRelay.LEASE_TIME / 3  # [s]
+    # Registration is repeated until the Relay echoes it, e.g. Relay ignores Clients while the Server isn't registered
+    REGISTRATION_RETRY_PERIOD: float = 1.0  # [s]
+    # Relay is expected to send something within its keep-alive period, a longer silence means the NAT binding broke.
+    # Registering again then opens a new binding, which the Relay takes as a sign to send keep-alives more often.
+    BINDING_CHECK_PERIOD: float = 1.0  # [s]
+    BINDING_GRACE: float = 2.0  # [s] Added to the keep-alive period, for the ticks of the Relay & the network
+
+    def __init__(self, id: int, recv_callback: Callable, recv_port: int = 0, send_port: int = 0, send_ip: str = "", send_queue: YourTurnSendQueue = None, counters: YourTurnPeerCounters = None, data_port: int = 0, bundling: bool = False, refused_callback: Callable = None, batching: bool = False, direct_callback: Callable = None) -> None:
+        super().__init__(id, recv_callback, recv_port=recv_port, send_port=send_port, send_ip=send_ip, send_queue=send_queue, counters=counters)
+        self._data_port: int = data_port
+        self._turn_port: int = send_port  # Relay main port, the send port switches over to the data port
+        self._bundling: bool = bundling
+        self._batching: bool = batching  # Server takes registration notifications in batches
+        self._refused_callback: Callable = refused_callback  # Called when the Relay port turns out to be closed
+        # Takes the packets, that don't come from the Relay, i.e. from the direct paths to other Middlemen
+        self._direct_callback: Callable = direct_callback
+        self._relay_addrs: tuple = ((send_ip, send_port), (send_ip, data_port))
+        # Connected socket only talks to the Relay main port, which lets it notice the port being closed
+        self._is_connected: bool = data_port <= 0 and direct_callback is None
+        self._data_port_active: bool = False
+        self._data_port_probe_attempts: int = 0
+        self._data_port_prober = task.LoopingCall(self._probe_data_port)
+        self._lease_renewer = task.LoopingCall(self._renew_lease)
+        self._registered: bool = False
+        self._registration_retrier = task.LoopingCall(self._register)
+        self._keep_alive_period: float = 0  # [s] Period of the Relay keep-alives, 0 until the Relay confirms it
+        self._activity: tuple = (0, 0.0)  # (packets received from the Relay, when that count last changed)
+        self._binding_checker = task.LoopingCall(self._check_binding)
+        self._binding_breaks: int = 0
+
+    def is_registered(self) -> bool:
+        return self._registered
+
+    def is_data_port_active(self) -> bool:
+        return self._data_port_active
+
+    def get_keep_alive_period(self) -> float:
+        return self._keep_alive_period
+
+    def get_relay_addrs(self) -> tuple:
+        # Main & data port address of the Relay, anything else is a direct path
+        return self._relay_addrs
+
+    def get_binding_breaks(self) -> int:
+        return self._binding_breaks
+
     def startProtocol(self) -> None:
-        self.transport.connect(*self.get_send_addr())
+        if self._is_connected:
+            self.transport.connect(*self.get_send_addr())
         # Register interface on TURN server
-        self.transport.write(make_turn_packet(self._id))
+        # NOTE: Socket is left unconnected with a data port, so it can be switched over to it, and with direct paths
+        self._registration_retrier.start(YourTurnMiddlemanRelay.REGISTRATION_RETRY_PERIOD, now=True)
+        if self._data_port > 0:
+            self._data_port_prober.start(YourTurnMiddlemanRelay.DATA_PORT_PROBE_PERIOD, now=False)
+        self._lease_renewer.start(YourTurnMiddlemanRelay.LEASE_RENEW_PERIOD, now=False)
+        self._binding_checker.start(YourTurnMiddlemanRelay.BINDING_CHECK_PERIOD, now=False)
         super().startProtocol()
 
+    def stopProtocol(self) -> None:
+        if self._data_port_prober.running:
+            self._data_port_prober.stop()
+        if self._lease_renewer.running:
+            self._lease_renewer.stop()
+        if self._registration_retrier.running:
+            self._registration_retrier.stop()
+        if self._binding_checker.running:
+            self._binding_checker.stop()
+        super().stopProtocol()
+
+    def connectionRefused(self) -> None:
+        # NOTE: Only reported while the socket is connected, i.e. without a data port
+        if self._refused_callback is not None:
+            self._refused_callback()
+
+    def send_encapsulated(self, data: bytes) -> None:
+        # TURN packets, which the data port would take for Client data, are sent to the main port
+        if not self._data_port_active:
+            self.send_data(data)
+            return
+        counters: YourTurnPeerCounters = self._counters
+        counters.packets_out += 1
+        counters.bytes_out += len(data)
+        try:
+            self.transport.write(data, (self._send_ip, self._turn_port))
+        except BlockingIOError:
+            # Only sampled packets take this way, so one is rather dropped than queued out of order
+            pass
+
+    def _renew_lease(self) -> None:
+        # Re-registering from the same address only renews the lease on the Relay
+        self._register()
+
+    def _register(self) -> None:
+        registrations: list = [make_turn_packet(self._id)]
+        # Bundling registration follows the normal one, so Relays without bundle support still register the interface.
+        # Data port only takes the normal registration, anything else is forwarded as data.
+        if self._bundling and not self._data_port_active:
+            registrations.append(make_turn_packet(self._id, prefix=TURN_MSG_BUNDLE_PREFIX))
+        if self._batching and not self._data_port_active:
+            registrations.append(make_turn_packet(self._id, prefix=TURN_MSG_REGISTER_BATCH_PREFIX))
+        if not self._data_port_active:
+            registrations.append(make_turn_packet(self._id, prefix=TURN_MSG_KEEP_ALIVE_PREFIX))
+        for registration in registrations:
+            if self._is_connected:
+                self.transport.write(registration)
+            else:
+                self.transport.write(registration, self.get_send_addr())
+        if self._direct_callback is not None:
+            # Always sent to the main port, as the data port would take it for data
+            self.transport.write(make_turn_packet(self._id, prefix=TURN_MSG_DIRECT_PREFIX), (self._send_ip, self._turn_port))
+
+    def send_direct(self, data: bytes, addr: tuple) -> None:
+        # Sent from the registered socket, so the NAT binding the Relay told the other side about is used
+        try:
+            self.transport.write(data, addr)
+        except BlockingIOError:
+            # Direct path has no send queue, like the network it's lost on the way
+            pass
+
+    def _set_registered(self) -> None:
+        self._registered = True
+        if self._registration_retrier.running:
+            self._registration_retrier.stop()
+
+    def _check_binding(self) -> None:
+        # Activity is read from the counters, so the packet path doesn't have to record any times
+        now: float = monotonic()
+        packets_in: int = self._counters.packets_in
+        if packets_in != self._activity[0]:
+            self._activity = (packets_in, now)
+            return
+        if self._keep_alive_period <= 0 or now - self._activity[1] < self._keep_alive_period + YourTurnMiddlemanRelay.BINDING_GRACE:
+            return
+        print(f"No keep-alive from the Relay for {now - self._activity[1]:.1f}s, registering again")
+        self._binding_breaks += 1
+        self._activity = (packets_in, now)
+        self._register()
+
+    def _probe_data_port(self) -> None:
+        # Relay confirms the data port by echoing the registration back from it
+        if self._data_port_probe_attempts >= YourTurnMiddlemanRelay.DATA_PORT_PROBE_ATTEMPTS:
+            print("Relay doesn't offer a data port, falling back to TURN encapsulation")
+            self._data_port_prober.stop()
+            return
+        self._data_port_probe_attempts += 1
+        self.transport.write(make_turn_packet(self._id), (self._send_ip, self._data_port))
+
+    def datagramReceived(self, data: bytes, addr: tuple) -> None:
+        if self._direct_callback is not None and addr not in self._relay_addrs:
+            self._direct_callback(data, addr)
+            return
+        if len(data) == TURN_MSG_PREAMBLE_LEN + TURN_KEEP_ALIVE_PERIOD.size and parse_turn_packet(data, TURN_MSG_KEEP_ALIVE_PREFIX)[:1] == (self._id,):
+            # Keep-alive is only counted as activity, there is nothing in it for the Middleman
+            counters: YourTurnPeerCounters = self._counters
+            counters.packets_in += 1
+            counters.bytes_in += len(data)
+            self._keep_alive_period = TURN_KEEP_ALIVE_PERIOD.unpack_from(data, TURN_MSG_PREAMBLE_LEN)[0] / 1000
+            self._set_registered()
+            return
+        if not self._registered and data[TURN_MSG_PREAMBLE_LEN:] == b"" and parse_turn_message(data)[1:2] == (self._id,):
+            # Registration echo, or a keep-alive, which the Relay only sends to registered peers
+            self._set_registered()
+        if not self._data_port_active and addr == (self._send_ip, self._data_port):
+            self._data_port_active = True
+            if self._data_port_prober.running:
+                self._data_port_prober.stop()
+            self.set_send_port(self._data_port)
+            print(f"Sending data through the Relay data port {self._data_port}")
+        super().datagramReceived(data, addr)
+
 
 class YourTurnMiddlemanPeer(YourTurnMiddlemanInterface):
     def startProtocol(self) -> None:
@@ -105,6 +422,329 @@ class YourTurnMiddlemanPeer(YourTurnMiddlemanInterface):
         super().set_send_port(send_port)
         if self.is_running() and send_port > 1024:
             self.transport.connect(self._send_ip, send_port)
+            # Deliver whatever was received for the client before it was known
+            self.flush()
+
+
+class YourTurnSession:
+    # In-process endpoint of a peer, for applications running in the same process as the Middleman.
+    # Payloads are handed over by calls instead of through a loopback socket, while the Middleman still takes care
+    # of the registration & keep-alives. Received payloads go to the callback if set, otherwise they are buffered
+    # for the async iterator, e.g. `async for payload in session:` in a coroutine run by Twisted.
+    def __init__(self, id: int, send_callback: Callable, recv_callback: Callable = None, buffer: YourTurnSendQueue = None, counters: YourTurnPeerCounters = None) -> None:
+        self._id: int = id
+        self._send_callback: Callable = send_callback  # Middleman function taking (peer ID, payload, address)
+        self._recv_callback: Callable = recv_callback  # Application function taking the payload
+        self._buffer: YourTurnSendQueue = YourTurnSendQueue() if buffer is None else buffer
+        self._counters: YourTurnPeerCounters = YourTurnPeerCounters() if counters is None else counters
+        self._waiter: Deferred = None  # Fired with the next payload, while the async iterator waits for one
+        self._closed: bool = False
+
+    def get_id(self) -> int:
+        return self._id
+
+    def get_recv_port(self) -> int:
+        return 0
+
+    def get_send_queue(self) -> YourTurnSendQueue:
+        return self._buffer
+
+    def get_counters(self) -> YourTurnPeerCounters:
+        return self._counters
+
+    def is_send_port_set(self) -> bool:
+        return True
+
+    def is_closed(self) -> bool:
+        return self._closed
+
+    def set_recv_callback(self, recv_callback: Callable) -> None:
+        self._recv_callback = recv_callback
+        # Deliver whatever was received before the callback was set
+        while recv_callback is not None and len(self._buffer) > 0:
+            recv_callback(self._buffer.pop())
+
+    def send(self, payload: bytes) -> bool:
+        # Returns False if the session is already closed
+        if self._closed:
+            return False
+        counters: YourTurnPeerCounters = self._counters
+        counters.packets_in += 1
+        counters.bytes_in += len(payload)
+        self._send_callback(self._id, payload, ())
+        return True
+
+    def send_data(self, data: bytes) -> None:
+        # Called by the Middleman with the payloads for the application
+        counters: YourTurnPeerCounters = self._counters
+        counters.packets_out += 1
+        counters.bytes_out += len(data)
+        if self._recv_callback is not None:
+            self._recv_callback(data)
+        elif self._waiter is not None:
+            waiter, self._waiter = self._waiter, None
+            waiter.callback(data)
+        else:
+            self._buffer.push(data)
+
+    def close(self) -> None:
+        self._closed = True
+        if self._waiter is not None:
+            waiter, self._waiter = self._waiter, None
+            waiter.errback(StopAsyncIteration())
+
+    def __aiter__(self) -> "YourTurnSession":
+        return self
+
+    def __anext__(self) -> Deferred:
+        if len(self._buffer) > 0:
+            return succeed(self._buffer.pop())
+        if self._closed:
+            return fail(StopAsyncIteration())
+        self._waiter = Deferred()
+        return self._waiter
+
+
+class YourTurnBundler:
+    # Collects the datagrams for one receiver over a short window & sends them as one bundle.
+    # The bundle is sent early, if the next datagram wouldn't fit into the size budget.
+    def __init__(self, send_function: Callable, window: float, max_size: int) -> None:
+        self._send: Callable = send_function
+        self._window: float = window
+        self._max_size: int = max_size
+
+        self._frames: list = []
+        self._size: int = 0
+        self._flusher = None  # Delayed call, that sends the bundle once the window is over
+
+    def add(self, datagram: bytes) -> None:
+        frame_size: int = TURN_BUNDLE_FRAME.size + len(datagram)
+        if self._size + frame_size > self._max_size:
+            self.flush()
+        self._frames.append(TURN_BUNDLE_FRAME.pack(len(datagram)))
+        self._frames.append(datagram)
+        self._size += frame_size
+        if self._flusher is None:
+            self._flusher = reactor.callLater(self._window, self.flush)
+
+    def flush(self) -> None:
+        if self._flusher is not None:
+            if self._flusher.active():
+                self._flusher.cancel()
+            self._flusher = None
+        if len(self._frames) == 0:
+            return
+        bundle: bytes = b"".join(self._frames)
+        self._frames.clear()
+        self._size = 0
+        self._send(bundle)
+
+
+class YourTurnDirectPath:
+    # Direct path to the other side, opened by both Middlemen sending probes to the public address of each other, that
+    # the Relay told them. NAT of each side lets the probes of the other side in, once it let its own probes out.
+    # Path is used once the other side confirms it got the probes, and dropped, when the other side goes silent.
+    PUNCH_PERIOD: float = 0.1  # [s] Probes while the path is being opened
+    PUNCH_TIME: float = 5.0  # [s] Opening the path is given up after this long
+    PROBE_PERIOD: float = 0.5  # [s] Probes keeping the open path & its NAT bindings alive
+    TIMEOUT: float = 2.0  # [s] Nothing received for this long means the path stopped working
+    RETRY_TIME: float = 60.0  # [s] Path that couldn't be opened isn't tried again for this long
+
+    def __init__(self, peer_id: int, addr: tuple, probe_id: int, send_function: Callable) -> None:
+        self._peer_id: int = peer_id
+        self._addr: tuple = addr  # Public address of the other side
+        self._probe_id: int = probe_id  # ID of this side, carried by the probes
+        self._send: Callable = send_function
+        self._started: float = monotonic()  # [s] When opening the path started
+        self._failed: float = -math.inf  # [s] When opening the path was given up
+        self._probed: float = -math.inf  # [s] When was the last probe sent
+        self._is_heard: bool = False  # Something came from the other side
+        self._is_active: bool = False  # Other side got our probes too
+        self._packets_in: int = 0  # Counted on the packet path, so it doesn't have to read the clock
+        self._activity: tuple = (0, self._started)  # (packets received, when that count last changed)
+
+    def get_peer_id(self) -> int:
+        return self._peer_id
+
+    def get_addr(self) -> tuple:
+        return self._addr
+
+    def is_active(self) -> bool:
+        return self._is_active
+
+    def can_retry(self) -> bool:
+        return monotonic() - self._failed >= YourTurnDirectPath.RETRY_TIME
+
+    def send(self, data: bytes) -> None:
+        self._send(data, self._addr)
+
+    def received_probe(self, is_heard: bool) -> None:
+        self._packets_in += 1
+        self._is_heard = True
+        if is_heard:
+            self._is_active = True
+
+    def received_data(self) -> None:
+        # Other side only sends directly, once it knows we got its probes, so the path works both ways
+        self._packets_in += 1
+        self._is_heard = True
+        self._is_active = True
+
+    def tick(self, now: float) -> None:
+        if self._failed > -math.inf:
+            return
+        if self._packets_in != self._activity[0]:
+            self._activity = (self._packets_in, now)
+        if self._is_active and now - self._activity[1] > YourTurnDirectPath.TIMEOUT:
+            # Opened again, in case only a NAT binding changed
+            self._is_active = False
+            self._is_heard = False
+            self._started = now
+        if not self._is_active and now - self._started > YourTurnDirectPath.PUNCH_TIME:
+            self._failed = now
+            return
+        period: float = YourTurnDirectPath.PROBE_PERIOD if self._is_active else YourTurnDirectPath.PUNCH_PERIOD
+        if now - self._probed >= period:
+            self._probed = now
+            probe: bytes = TURN_DIRECT_PROBE.pack(1 if self._is_heard else 0)
+            self._send(make_turn_packet(self._probe_id, probe, prefix=TURN_MSG_DIRECT_PROBE_PREFIX), self._addr)
+
+
+class YourTurnPortPool:
+    # Ports of the peer interfaces, freed ports are handed out again after the ones that were never used
+    def __init__(self, start: int, size: int) -> None:
+        self._ports = range(start, start + size)
+        self._free_ports = deque(self._ports)
+
+    def __len__(self) -> int:
+        return len(self._free_ports)
+
+    def acquire(self) -> int:
+        # Returns -1 if all ports are taken
+        if len(self._free_ports) == 0:
+            return -1
+        return self._free_ports.popleft()
+
+    def release(self, port: int) -> None:
+        # Ports outside of the range weren't taken from the pool
+        if port in self._ports:
+            self._free_ports.append(port)
+
+
+class YourTurnResolver:
+    # Caches resolved Relay hostnames for a while, so switching between Relays doesn't wait for a lookup each time
+    TTL: float = 300.0  # [s]
+
+    def __init__(self, ttl: float = TTL) -> None:
+        self._ttl: float = ttl
+        self._cache: dict = {}  # hostname -> (IP, when it was resolved)
+
+    def resolve(self, host: str) -> Deferred:
+        if re.match(VALID_IP_ADDR_REGEX, host):
+            return succeed(host)
+        if not re.match(VALID_HOSTNAME_REGEX, host):
+            return fail(ValueError("Relay IP is invalid!"))
+        cached: tuple = self._cache.get(host, None)
+        if cached is not None and monotonic() - cached[1] < self._ttl:
+            return succeed(cached[0])
+        resolving: Deferred = reactor.resolve(host)
+        resolving.addCallbacks(self._resolved, self._failed, callbackArgs=(host,), errbackArgs=(host,))
+        return resolving
+
+    def _resolved(self, ip: str, host: str) -> str:
+        self._cache[host] = (ip, monotonic())
+        return ip
+
+    def _failed(self, failure, host: str):
+        # Expired IP is still better than none, while the name server can't be reached
+        cached: tuple = self._cache.get(host, None)
+        if cached is None:
+            return failure
+        return cached[0]
+
+
+class YourTurnRelayProber(DatagramProtocol):
+    # Measures the RTT to each of the Relays with probes, that they echo back. Probes are sent from a socket of
+    # their own, so they don't register anything & don't mix with the traffic of the Relay interface.
+    PROBE_PERIOD: float = 1.0  # [s]
+    RELAY_TIMEOUT: float = 3 * PROBE_PERIOD  # [s] Relay, that didn't echo anything for this long, is considered down
+    RTT_WEIGHT: float = 0.25  # Weight of a new sample in the smoothed RTT
+
+    def __init__(self, relays: list, resolver: YourTurnResolver, log: YourTurnLogger) -> None:
+        super().__init__()
+
+        self._relays: list = relays  # (hostname or IP, port)
+        self._resolver: YourTurnResolver = resolver
+        self._log: YourTurnLogger = log
+
+        self._addrs: list = [None] * len(relays)  # Last resolved (IP, port) of each of the Relays
+        self._rtts: list = [math.inf] * len(relays)  # [s] Smoothed RTT of each of the Relays
+        self._echoed: list = [-math.inf] * len(relays)  # [s] When was the last echo received from each of the Relays
+        self._probes: dict = {}  # probe sequence -> (Relay index, when it was sent)
+        self._seq: int = 0
+        self._prober = task.LoopingCall(self._probe)
+
+    def startProtocol(self) -> None:
+        self._prober.start(YourTurnRelayProber.PROBE_PERIOD, now=True)
+
+    def stopProtocol(self) -> None:
+        if self._prober.running:
+            self._prober.stop()
+
+    def get_addr(self, index: int) -> tuple:
+        # None until the Relay is resolved
+        return self._addrs[index]
+
+    def get_rtt(self, index: int) -> float:
+        return self._rtts[index]
+
+    def is_alive(self, index: int) -> bool:
+        return monotonic() - self._echoed[index] < YourTurnRelayProber.RELAY_TIMEOUT
+
+    def mark_dead(self, index: int) -> None:
+        self._echoed[index] = -math.inf
+
+    def get_fastest(self) -> int:
+        # Index of the Relay with the lowest RTT, that is alive, -1 if there is none
+        alive: list = [index for index in range(len(self._relays)) if self.is_alive(index)]
+        return min(alive, key=lambda index: self._rtts[index], default=-1)
+
+    def _probe(self) -> None:
+        now: float = monotonic()
+        # Probes, that weren't echoed within the timeout, are lost
+        for seq in [seq for seq, (_, sent) in self._probes.items() if now - sent > YourTurnRelayProber.RELAY_TIMEOUT]:
+            del self._probes[seq]
+        for index, (host, port) in enumerate(self._relays):
+            resolving: Deferred = self._resolver.resolve(host)
+            resolving.addCallbacks(self._send_probe, self._resolve_failed, callbackArgs=(index, port), errbackArgs=(host,))
+
+    def _send_probe(self, ip: str, index: int, port: int) -> None:
+        self._addrs[index] = (ip, port)
+        self._seq = (self._seq + 1) & 0xFFFFFFFF
+        self._probes[self._seq] = (index, monotonic())
+        try:
+            self.transport.write(make_turn_packet(self._seq, prefix=TURN_MSG_PROBE_PREFIX), (ip, port))
+        except OSError as e:
+            self._log.log("probe_failed", "Failed to probe Relay {}:{}: {}", ip, port, e)
+
+    def _resolve_failed(self, failure, host: str) -> None:
+        self._log.log("resolve_failed", "Failed to resolve Relay {}: {}", host, failure.getErrorMessage())
+
+    def datagramReceived(self, data: bytes, addr: tuple) -> None:
+        parsed_packet: tuple = parse_turn_packet(data, TURN_MSG_PROBE_PREFIX)
+        if parsed_packet == ():
+            return
+        probe: tuple = self._probes.pop(parsed_packet[0], None)
+        if probe is None or self._addrs[probe[0]] != addr:
+            return
+        index, sent = probe
+        now: float = monotonic()
+        rtt: float = now - sent
+        if self._rtts[index] == math.inf:
+            self._rtts[index] = rtt
+        else:
+            self._rtts[index] += YourTurnRelayProber.RTT_WEIGHT * (rtt - self._rtts[index])
+        self._echoed[index] = now
 
 
 class YourTurnMiddleman:
@@ -112,8 +752,39 @@ class YourTurnMiddleman:
     SERVER_ID: int = 1
     SERVER_DEFAULT_PORT: int = 6942
     PORT_RANGE_START: int = 6970
-    # TODO: Implement peer limit
-    # PEERS_MAX: int = 12
+    PORT_RANGE_SIZE: int = 1024
+    PEERS_MAX: int = 256
+    # Server tears down peer interfaces, that didn't pass any packets for this long, 0 disables it
+    PEER_IDLE_TIMEOUT: float = 2 * YourTurnRelay.LEASE_TIME  # [s]
+    PEER_IDLE_CHECK_PERIOD: float = 5.0  # [s]
+    BUNDLE_WINDOW: float = 0.002  # [s]
+    # Budget of the bundled frames, so the bundle with all headers still fits into a common MTU
+    BUNDLE_MAX_SIZE: int = 1200
+    # Group that contains every peer, when the Server is started with a broadcast port
+    BROADCAST_GROUP_ID: int = 0
+    # Relay keeps groups in memory only, so they are sent again periodically, in case they were lost
+    GROUP_SYNC_PERIOD: float = YourTurnMiddlemanRelay.LEASE_RENEW_PERIOD  # [s]
+    GROUP_SYNC_CHUNK: int = 256  # Member IDs per group control packet
+    # With more Relays, they are probed for this long first, so the fastest one is used from the start.
+    # Afterwards the Relay is switched within RELAY_TIMEOUT + PROBE_PERIOD, once it stops echoing the probes.
+    RELAY_SELECT_TIME: float = 0.5  # [s]
+    PROFILER_TICK_PERIOD: float = 0.1  # [s] Loop lag is measured by how late this tick comes
+    METRICS_EVENTS: dict = {
+        "invalid_packets": "Packets from the Relay, that aren't valid TURN packets",
+        "unknown_peer_drops": "Packets from the Relay for a peer, that isn't registered",
+        "registrations": "Peer registrations",
+        "re_registrations": "Repeated registration notifications of an already registered peer",
+        "unregistrations": "Peers unregistered after their Relay lease expired",
+        "idle_teardowns": "Peers torn down after passing no packets for the idle timeout",
+        "relay_switches": "Switches to another Relay, after the used one stopped answering",
+        "direct_upgrades": "Peers switched over to a direct path",
+        "direct_fallbacks": "Direct paths, that stopped working, so the packets went through the Relay again",
+        "direct_drops": "Packets from addresses, that are neither the Relay, nor a direct path",
+        "fec_parity_packets": "FEC parity packets sent",
+        "fec_recovered_packets": "Lost packets rebuilt from the FEC parity",
+        "fec_unrecoverable_groups": "FEC groups, that lost more packets than the parity can rebuild",
+        "compression_errors": "Compressed packets, that couldn't be decompressed",
+    }
 
     def __init__(self,
                 relay_ip: str,
@@ -123,15 +794,52 @@ class YourTurnMiddleman:
                 server_port: int = SERVER_DEFAULT_PORT,
                 verbose: bool = False,
                 on_ip_resolved: Callable = None,
-                on_peer_registered: Callable = None) -> None:
+                on_peer_registered: Callable = None,
+                relay_data_port: int = YOUR_TURN_DATA_PORT,
+                send_queue_packets: int = YourTurnSendQueue.MAX_PACKETS,
+                send_queue_bytes: int = YourTurnSendQueue.MAX_BYTES,
+                send_queue_policy: str = SEND_QUEUE_DROP_OLDEST,
+                port_range_start: int = None,
+                metrics_port: int = 0,
+                peers_max: int = PEERS_MAX,
+                peer_idle_timeout: float = PEER_IDLE_TIMEOUT,
+                trace_sample: int = YourTurnLogger.TRACE_SAMPLE_PERIOD,
+                bundle_window: float = 0,
+                bundle_max_size: int = BUNDLE_MAX_SIZE,
+                broadcast_port: int = 0,
+                relays: list = (),
+                in_process: bool = False,
+                hop_trace_period: int = 0,
+                direct: bool = False,
+                fec_group: int = 0,
+                compress: bool = False,
+                profile_dir: str = ".",
+                profile_window: float = YourTurnProfiler.WINDOW) -> None:
         
         self._relay_ip: str = relay_ip
         self._relay_port: int = relay_port
+        # Other Relays, (hostname or IP, port), that can be used instead
+        self._relays: list = [(relay_ip, relay_port)] + list(relays)
+        self._relay_index: int = 0
+        self._resolver = YourTurnResolver()
+        self._prober: YourTurnRelayProber = None
+        self._relay_checker = task.LoopingCall(self._check_relay)
+        # Server has to address each of the packets, so only clients can use the Relay data port.
+        # FEC & compressed packets need the TURN framing too, which the data port would take for data.
+        self._relay_data_port: int = 0 if is_server or fec_group > 0 or compress else relay_data_port
         self._is_server: bool = is_server
         self._server_port: int = server_port
         self._verbose: bool = verbose
+        # Verbose mode traces only every trace_sample-th packet
+        self._log = YourTurnLogger(trace_sample if verbose else 0)
+        self._log_flusher = task.LoopingCall(self._log.flush)
         self._on_ip_resolved: Callable = on_ip_resolved
         self._on_peer_registered: Callable = on_peer_registered
+        self._send_queue_packets: int = send_queue_packets
+        self._send_queue_bytes: int = send_queue_bytes
+        self._send_queue_policy: str = send_queue_policy
+        if send_queue_policy not in SEND_QUEUE_POLICIES:
+            raise ValueError(f"Send queue policy has to be one of {SEND_QUEUE_POLICIES}!")
         if is_server:
             if id != YourTurnMiddleman.SERVER_ID:
                 raise ValueError("Server ID is always 1!")
@@ -142,36 +850,175 @@ class YourTurnMiddleman:
                 id = adler32(unique_id.bytes)
 
         self._id: int = id
+        self._relay: YourTurnMiddlemanRelay = None
         self._peers: dict = {}
-        self._next_peer_port: int = YourTurnMiddleman.PORT_RANGE_START
-
-        # Figure out if the Relay address is an IP or a hostname
-        is_ip_addr: bool = bool(re.match(VALID_IP_ADDR_REGEX, relay_ip))
-        is_hostname: bool = bool(re.match(VALID_HOSTNAME_REGEX, relay_ip))
-        if is_ip_addr:
-            self.run()
-        elif is_hostname:
-            ip_resolver: Deferred  = reactor.resolve(relay_ip)
-            ip_resolver.addCallback(self._hostname_resolved)
+        # Peers are YourTurnSession objects of the application instead of loopback interfaces
+        self._in_process: bool = in_process
+        self._peers_max: int = peers_max
+        self._port_pool = YourTurnPortPool(
+            YourTurnMiddleman.PORT_RANGE_START if port_range_start is None else port_range_start,
+            max(peers_max, YourTurnMiddleman.PORT_RANGE_SIZE)
+        )
+        self._peer_idle_timeout: float = peer_idle_timeout
+        self._peer_activity: dict = {}  # peer ID -> (packets passed by the peer, when that count last changed)
+        self._idle_peer_reaper = task.LoopingCall(self._teardown_idle_peers)
+        # Bundling is offered to the Relay, if the window is set, and used for receivers that can split bundles
+        self._bundle_window: float = bundle_window
+        self._bundle_max_size: int = bundle_max_size
+        self._bundlers: dict = {}  # receiver ID -> YourTurnBundler
+        self._broadcast_port: int = broadcast_port
+        self._groups: dict = {}  # group ID -> IDs of the members
+        self._group_interfaces: dict = {}  # group ID -> interface, through which the Server sends to the group
+        self._group_syncer = task.LoopingCall(self._sync_groups)
+        # Every hop_trace_period-th packet from the application is traced, 0 disables it
+        self._hop_trace_period: int = hop_trace_period
+        self._hop_trace_countdown: int = 1
+        self._hop_trace_sequences: dict = {}  # receiver ID -> sequence number of its next traced packet
+        # Peers are talked to directly, once the Relay told both sides their addresses & the path opened
+        self._direct: bool = direct
+        self._direct_paths: dict = {}  # peer ID -> YourTurnDirectPath
+        self._direct_paths_by_addr: dict = {}  # (ip, port) -> YourTurnDirectPath
+        self._direct_ticker = task.LoopingCall(self._tick_direct_paths)
+        # Parity packet is sent after every fec_group packets for the Relay, 0 disables it. FEC packets from the other
+        # side are always decoded, so only the sending side has to enable it.
+        self._fec_group: int = fec_group
+        self._fec_encoders: dict = {}  # receiver ID -> YourTurnFecEncoder
+        self._fec_decoders: dict = {}  # sender ID -> YourTurnFecDecoder
+        self._fec_flusher = task.LoopingCall(self._flush_fec)
+        # Packets for the Relay are compressed, once the other side accepts the dictionary trained from them.
+        # Compressed packets from the other side are always decompressed, so only the sending side has to enable it.
+        self._compress: bool = compress
+        self._compressors: dict = {}  # receiver ID -> YourTurnCompressor
+        self._decompressors: dict = {}  # sender ID -> YourTurnDecompressor
+        self._compression_stats = YourTurnCompressionStats()
+        self._compression_ticker = task.LoopingCall(self._tick_compressors)
+        self._hop_traces = YourTurnHopTraces({TURN_TRACE_HOP_RELAY: "relay", TURN_TRACE_HOP_MIDDLEMAN: "middleman"})
+
+        self._metrics = YourTurnMetrics("your_turn_middleman", YourTurnMiddleman.METRICS_EVENTS)
+        self._metrics.add_gauge("peers", "Registered peers", lambda: len(self._peers))
+        self._metrics.add_gauge("send_queue_dropped_packets", "Packets dropped by the send queues", self.get_dropped_packets)
+        self._metrics.add_gauge("relay_rtt_seconds", "Smoothed RTT to the used Relay, if there are more", self.get_relay_rtt)
+        self._metrics.add_gauge("direct_paths", "Peers talked to directly", lambda: sum(path.is_active() for path in list(self._direct_paths.values())))
+        self._metrics.add_gauge("compressed_sessions", "Peers, whose packets are compressed", lambda: sum(compressor.is_active() for compressor in list(self._compressors.values())))
+        self._metrics.add_gauge("keep_alive_period_seconds", "Period of the keep-alives from the used Relay", self.get_keep_alive_period)
+        self._metrics.add_gauge(
+            "relay_binding_breaks",
+            "Silences of the used Relay longer than its keep-alive period, after which the Middleman registered again",
+            lambda: 0 if self._relay is None else self._relay.get_binding_breaks()
+        )
+        # Traced packets are collected, even if this Middleman doesn't trace its own
+        self._metrics.add_collector(self._hop_traces)
+        self._metrics.add_collector(self._compression_stats)
+        # Hot callbacks are timed, before any interface takes a reference to them
+        self._profiler = YourTurnProfiler("your_turn_middleman", YourTurnMiddleman.PROFILER_TICK_PERIOD, profile_dir, profile_window)
+        self._profiler_ticker = task.LoopingCall(self._profiler.tick)
+        self._metrics.add_collector(self._profiler)
+        self._received_from_relay = self._profiler.wrap("_received_from_relay", self._received_from_relay)
+        self._received_from_peer = self._profiler.wrap("_received_from_peer", self._received_from_peer)
+        if metrics_port > 0:
+            YourTurnMetricsServer(self._metrics, metrics_port).start()
+            print(f"Serving metrics on http://127.0.0.1:{metrics_port}/metrics")
+
+        # Figure out if the Relay addresses are IPs or hostnames
+        for host, _ in self._relays:
+            if not re.match(VALID_IP_ADDR_REGEX, host) and not re.match(VALID_HOSTNAME_REGEX, host):
+                raise ValueError("Relay IP is invalid!")
+        if len(self._relays) == 1:
+            # IP is passed on right away
+            self._resolver.resolve(relay_ip).addCallback(self._hostname_resolved)
         else:
-            raise ValueError("Relay IP is invalid!")
+            self._prober = YourTurnRelayProber(self._relays, self._resolver, self._log)
+            reactor.listenUDP(0, self._prober)
+            reactor.callLater(YourTurnMiddleman.RELAY_SELECT_TIME, self._select_relay)
 
     def _hostname_resolved(self, ip: str) -> None:
         self._relay_ip = ip
         self.run()
 
-    def run(self) -> None:
-        # Start Relay interface
+    def _select_relay(self) -> None:
+        index: int = self._prober.get_fastest()
+        if index < 0:
+            # None of the Relays answered yet, so the first resolved one is tried, until a better one shows up
+            index = next((index for index in range(len(self._relays)) if self._prober.get_addr(index) is not None), -1)
+        if index < 0:
+            self._log.log("relay_unresolved", "None of the Relays is resolved yet!")
+            reactor.callLater(YourTurnMiddleman.RELAY_SELECT_TIME, self._select_relay)
+            return
+        self._relay_index = index
+        self._relay_ip, self._relay_port = self._prober.get_addr(index)
+        self.run()
+        self._relay_checker.start(YourTurnRelayProber.PROBE_PERIOD, now=False)
+
+    def _check_relay(self) -> None:
+        if self._prober.is_alive(self._relay_index):
+            return
+        index: int = self._prober.get_fastest()
+        if index < 0 or index == self._relay_index:
+            return
+        self._switch_relay(index)
+
+    def _relay_refused(self) -> None:
+        # Closed Relay port doesn't have to time out first
+        if self._prober is not None:
+            self._prober.mark_dead(self._relay_index)
+            self._check_relay()
+
+    def _switch_relay(self, index: int) -> None:
+        ip, port = self._prober.get_addr(index)
+        self._log.log("relay_switch", "Relay {}:{} stopped answering, switching to {}:{}", self._relay_ip, self._relay_port, ip, port)
+        self._metrics.increment("relay_switches")
+        self._relay.close()
+        # Direct paths were opened from the socket of the old Relay interface
+        for peer_id in list(self._direct_paths):
+            self._remove_direct_path(peer_id)
+        self._relay_index = index
+        self._relay_ip, self._relay_port = ip, port
+        # New Relay interface registers right away, bundling resumes once the new Relay confirms it
+        self._connect_relay()
+        for receiver_id in list(self._bundlers):
+            self._stop_bundling(receiver_id)
+        # Relay keeps groups in memory only, so the new one doesn't know them
+        self._sync_groups()
+        if not self._on_ip_resolved is None:
+            self._on_ip_resolved(self._relay_ip, self._relay_port)
+        print(f"Switched to Relay on address {self._relay_ip}:{self._relay_port}")
+
+    def _connect_relay(self) -> None:
         self._relay = YourTurnMiddlemanRelay(
             self._id,
             self._received_from_relay,
             send_ip=self._relay_ip,
-            send_port=self._relay_port
+            send_port=self._relay_port,
+            send_queue=self._make_send_queue(),
+            counters=self._metrics.get_peer_counters("relay"),
+            data_port=self._relay_data_port,
+            bundling=self._bundle_window > 0,
+            refused_callback=self._relay_refused,
+            batching=self._is_server,
+            direct_callback=self._received_direct if self._direct else None
         )
         reactor.listenUDP(0, self._relay)
+
+    def run(self) -> None:
+        # Start Relay interface
+        self._connect_relay()
+        self._log_flusher.start(YourTurnLogger.RATE_LIMIT_PERIOD, now=False)
+        self._profiler_ticker.start(YourTurnMiddleman.PROFILER_TICK_PERIOD, now=False)
+        if self._direct:
+            self._direct_ticker.start(YourTurnDirectPath.PUNCH_PERIOD, now=False)
+        if self._fec_group > 0:
+            self._fec_flusher.start(YourTurnFecEncoder.FLUSH_PERIOD, now=False)
+        if self._compress:
+            self._compression_ticker.start(YourTurnCompressor.OFFER_PERIOD, now=False)
         # Pre-register a peer on clients
         if not self._is_server:
             self.register_peer(self._id)
+        else:
+            if self._peer_idle_timeout > 0:
+                self._idle_peer_reaper.start(YourTurnMiddleman.PEER_IDLE_CHECK_PERIOD, now=False)
+            self._group_syncer.start(YourTurnMiddleman.GROUP_SYNC_PERIOD, now=False)
+            if self._broadcast_port > 0:
+                self.create_group(YourTurnMiddleman.BROADCAST_GROUP_ID, self._peers.keys(), port=self._broadcast_port)
         
         if not self._on_ip_resolved is None:
             self._on_ip_resolved(self._relay_ip, self._relay_port)
@@ -179,6 +1026,46 @@ class YourTurnMiddleman:
         print(f"Started Your TURN Middleman in {'Server' if self._is_server else 'Client'} mode!")
         print(f"Connected to Relay on address {self._relay_ip}:{self._relay_port}")
 
+    def _make_send_queue(self) -> YourTurnSendQueue:
+        return YourTurnSendQueue(self._send_queue_packets, self._send_queue_bytes, self._send_queue_policy)
+
+    def get_metrics(self) -> YourTurnMetrics:
+        return self._metrics
+
+    def get_relay_rtt(self) -> float:
+        if self._prober is None:
+            return 0.0
+        return self._prober.get_rtt(self._relay_index)
+
+    def get_keep_alive_period(self) -> float:
+        return 0.0 if self._relay is None else self._relay.get_keep_alive_period()
+
+    def get_dropped_packets(self) -> int:
+        # Packets dropped by all send queues, either because they were full, or the packet was too big
+        interfaces: list = list(self._peers.values())
+        if self._relay is not None:
+            interfaces.append(self._relay)
+        return sum(interface.get_send_queue().get_dropped_packets() for interface in interfaces)
+
+    def get_id(self) -> int:
+        return self._id
+
+    def is_direct(self, peer_id: int) -> bool:
+        # Whether the packets for the peer skip the Relay
+        path: YourTurnDirectPath = self._direct_paths.get(peer_id, None)
+        return path is not None and path.is_active()
+
+    def get_session(self, peer_id: int) -> YourTurnSession:
+        # Session of a registered peer, None if there is none, or the Middleman doesn't run in-process
+        peer = self._peers.get(peer_id, None)
+        return peer if isinstance(peer, YourTurnSession) else None
+
+    def get_profiler(self) -> YourTurnProfiler:
+        return self._profiler
+
+    def get_relay_interface(self) -> YourTurnMiddlemanRelay:
+        return self._relay
+
     def get_client_interface_addr(self) -> tuple:
         client_interface: YourTurnMiddlemanPeer = self._peers.get(self._id, None)
         if client_interface is None:
@@ -186,84 +1073,494 @@ class YourTurnMiddleman:
         return "127.0.0.1", client_interface.get_recv_port()
 
     def _received_from_relay(self, peer_id: int, turn_packet: bytes, addr: tuple) -> None:
-        if self._verbose:
-            print(f"received {turn_packet.hex()} from {addr}")
+        if self._verbose and self._log.sample_trace():
+            self._log.trace(f"received {turn_packet.hex()} from {addr}")
         
-        parsed_turn_packet = parse_turn_packet(turn_packet)
+        parsed_turn_packet = parse_turn_message(turn_packet)
         if parsed_turn_packet == ():
-            print("Failed to parse TURN packet")
+            self._metrics.increment("invalid_packets")
+            self._log.log("invalid_packet", "Failed to parse TURN packet")
             return
+        prefix: int
         receiver_id: int
         payload: bytes
-        receiver_id, payload = parsed_turn_packet
+        prefix, receiver_id, payload = parsed_turn_packet
+
+        if prefix == TURN_MSG_DIRECT_PREFIX and self._direct:
+            self._direct_offered(receiver_id, payload)
+            return
+
+        if prefix == TURN_MSG_DICTIONARY_PREFIX:
+            self._received_dictionary(receiver_id, payload)
+            return
+
+        if prefix == TURN_MSG_REGISTER_BATCH_PREFIX and self._is_server:
+            for peer_id, flags in TURN_REGISTER_RECORD.iter_unpack(payload[:len(payload) - len(payload) % TURN_REGISTER_RECORD.size]):
+                self._peer_notified(peer_id, bool(flags & TURN_REGISTER_BUNDLING))
+            return
+
+        if prefix not in (TURN_MSG_PREFIX, TURN_MSG_BUNDLE_PREFIX, TURN_MSG_UNREGISTER_PREFIX, TURN_MSG_TRACE_PREFIX, TURN_MSG_FEC_PREFIX, TURN_MSG_COMPRESSED_PREFIX):
+            self._metrics.increment("invalid_packets")
+            self._log.log("invalid_packet", "Unexpected TURN packet prefix {}", prefix)
+            return
+
+        # Received notification about an expired peer
+        if prefix == TURN_MSG_UNREGISTER_PREFIX:
+            if self._is_server:
+                self._metrics.increment("unregistrations")
+                self.unregister_peer(receiver_id)
+            return
         
         # Received notification about a newly registered peer
         if len(payload) == 0:
-            # Skip, this is a keep-alive echo message
             if receiver_id == self._id:
+                # Keep-alive or registration echo, the bundle prefix confirms the server can split bundles
+                if prefix == TURN_MSG_BUNDLE_PREFIX and not self._is_server:
+                    self._start_bundling(YourTurnMiddleman.SERVER_ID)
                 return
             if self._is_server:
-                # Attempt to Register peer on the first available port 
-                while True:
-                    try:
-                        peer = self.register_peer(receiver_id)
-                        if peer is None:
-                            print("Failed to register peer!")
-                            return
-                    except CannotListenError as e:
-                        print(e)
-                    else:
-                        break
+                self._peer_notified(receiver_id, prefix == TURN_MSG_BUNDLE_PREFIX)
             return
         
         peer: YourTurnMiddlemanPeer = self._peers.get(receiver_id, None)
+        if peer is None and self._is_server:
+            # Peer was torn down while idle, but it is still registered on the Relay
+            peer = self.register_peer(receiver_id)
         if peer is None:
-            print("Invalid client peer ID received!")
+            self._metrics.increment("unknown_peer_drops")
+            self._log.log("invalid_peer_id", "Invalid client peer ID {} received!", receiver_id)
             return
         
         # Forward received data to peer
+        latency = self._metrics.latency
+        start: float = latency.start()
+        if prefix == TURN_MSG_BUNDLE_PREFIX:
+            for datagram in split_turn_bundle(payload):
+                peer.send_data(datagram)
+        elif prefix == TURN_MSG_TRACE_PREFIX:
+            self._received_traced(peer, receiver_id, payload)
+        elif prefix == TURN_MSG_FEC_PREFIX:
+            self._received_fec(peer, receiver_id, payload)
+        elif prefix == TURN_MSG_COMPRESSED_PREFIX:
+            self._received_compressed(peer, receiver_id, payload)
+        else:
+            peer.send_data(payload)
+        latency.stop(start)
+
+    def _received_traced(self, peer: YourTurnMiddlemanPeer, receiver_id: int, payload: bytes) -> None:
+        ingress: int = monotonic_ns()
+        trace: tuple = parse_turn_trace(payload)
+        if trace == ():
+            self._metrics.increment("invalid_packets")
+            self._log.log("invalid_trace", "Invalid trace for peer [{}]", receiver_id)
+            return
+        sequence: int
+        stamps: list
+        sequence, stamps, payload = trace
         peer.send_data(payload)
+        stamps.append((TURN_TRACE_HOP_MIDDLEMAN, ingress, monotonic_ns()))
+        # Relay replaced the receiver ID with the sender ID on its way to the Server
+        self._hop_traces.observe(receiver_id if self._is_server else YourTurnMiddleman.SERVER_ID, sequence, stamps)
     
+    def _received_fec(self, peer: YourTurnMiddlemanPeer, receiver_id: int, payload: bytes) -> None:
+        # Relay replaced the receiver ID with the sender ID on its way to the Server
+        sender_id: int = receiver_id if self._is_server else YourTurnMiddleman.SERVER_ID
+        decoder: YourTurnFecDecoder = self._fec_decoders.get(sender_id, None)
+        if decoder is None:
+            decoder = YourTurnFecDecoder(self._metrics)
+            self._fec_decoders[sender_id] = decoder
+        payloads: list = decoder.receive(payload)
+        if payloads is None:
+            self._metrics.increment("invalid_packets")
+            self._log.log("invalid_fec", "Invalid FEC packet for peer [{}]", receiver_id)
+            return
+        for payload in payloads:
+            peer.send_data(payload)
+
+    def _received_compressed(self, peer: YourTurnMiddlemanPeer, receiver_id: int, payload: bytes) -> None:
+        sender_id: int = receiver_id if self._is_server else YourTurnMiddleman.SERVER_ID
+        decompressor: YourTurnDecompressor = self._decompressors.get(sender_id, None)
+        payload = None if decompressor is None else decompressor.decompress(payload)
+        if payload is None:
+            self._metrics.increment("compression_errors")
+            self._log.log("compression_error", "Failed to decompress a packet from peer [{}]", sender_id)
+            return
+        peer.send_data(payload)
+
+    def _received_dictionary(self, receiver_id: int, payload: bytes) -> None:
+        # Relay replaced the receiver ID with the sender ID on its way to the Server
+        sender_id: int = receiver_id if self._is_server else YourTurnMiddleman.SERVER_ID
+        if len(payload) == TURN_DICTIONARY_ID.size:
+            # Other side accepted the dictionary of our packets
+            compressor: YourTurnCompressor = self._compressors.get(sender_id, None)
+            if compressor is not None and compressor.accept(TURN_DICTIONARY_ID.unpack(payload)[0]):
+                self._log.log("compression", "Compressing packets for peer [{}]", sender_id)
+            return
+        decompressor: YourTurnDecompressor = self._decompressors.get(sender_id, None)
+        if decompressor is None:
+            decompressor = YourTurnDecompressor(self._compression_stats.get_counters(sender_id))
+            self._decompressors[sender_id] = decompressor
+        dictionary_id: int = decompressor.add_dictionary(payload)
+        if dictionary_id < 0:
+            self._metrics.increment("invalid_packets")
+            self._log.log("invalid_dictionary", "Invalid compression dictionary from peer [{}]", sender_id)
+            return
+        # Addressed the same way as the data for the sender, even if this side doesn't compress
+        self._relay.send_encapsulated(make_turn_packet(sender_id, TURN_DICTIONARY_ID.pack(dictionary_id), prefix=TURN_MSG_DICTIONARY_PREFIX))
+
+    def _direct_offered(self, peer_id: int, payload: bytes) -> None:
+        addr: tuple = parse_turn_direct_addr(payload)
+        # Server may hear of the offer before the (coalesced) registration of the Client
+        if addr == () or peer_id == self._id or not self._is_server and peer_id != YourTurnMiddleman.SERVER_ID:
+            self._metrics.increment("invalid_packets")
+            self._log.log("invalid_direct_offer", "Invalid direct path offer for peer [{}]", peer_id)
+            return
+        # Offers are repeated with every lease renewal, a path is only replaced, if the address changed
+        path: YourTurnDirectPath = self._direct_paths.get(peer_id, None)
+        if path is not None and path.get_addr() == addr and not path.can_retry():
+            return
+        self._remove_direct_path(peer_id)
+        path = YourTurnDirectPath(peer_id, addr, self._id, lambda data, addr: self._relay.send_direct(data, addr))
+        self._direct_paths[peer_id] = path
+        self._direct_paths_by_addr[addr] = path
+        self._log.log("direct_offer", "Opening a direct path to peer [{}] at {}:{}", peer_id, *addr)
+
+    def _remove_direct_path(self, peer_id: int) -> None:
+        path: YourTurnDirectPath = self._direct_paths.pop(peer_id, None)
+        if path is not None and self._direct_paths_by_addr.get(path.get_addr(), None) is path:
+            del self._direct_paths_by_addr[path.get_addr()]
+
+    def _tick_direct_paths(self) -> None:
+        now: float = monotonic()
+        for path in list(self._direct_paths.values()):
+            was_active: bool = path.is_active()
+            path.tick(now)
+            if was_active and not path.is_active():
+                self._metrics.increment("direct_fallbacks")
+                self._log.log("direct_fallback", "Direct path to peer [{}] stopped working, using the Relay", path.get_peer_id())
+
+    def _received_direct(self, data: bytes, addr: tuple) -> None:
+        path: YourTurnDirectPath = self._direct_paths_by_addr.get(addr, None)
+        parsed_turn_packet = parse_turn_message(data)
+        if path is None or parsed_turn_packet == ():
+            self._metrics.increment("direct_drops")
+            self._log.log("direct_drop", "Packet from {}:{}, which is neither the Relay, nor a direct path", *addr)
+            return
+        prefix, peer_id, payload = parsed_turn_packet
+        was_active: bool = path.is_active()
+        if prefix == TURN_MSG_DIRECT_PROBE_PREFIX and peer_id == path.get_peer_id() and len(payload) == TURN_DIRECT_PROBE.size:
+            path.received_probe(bool(TURN_DIRECT_PROBE.unpack(payload)[0]))
+        elif prefix == TURN_MSG_PREFIX and len(payload) > 0 and peer_id == (path.get_peer_id() if self._is_server else self._id):
+            # Packets carry the same ID, as if they came through the Relay
+            path.received_data()
+            self._received_from_relay(self._id, data, addr)
+        else:
+            self._metrics.increment("direct_drops")
+            self._log.log("direct_drop", "Unexpected packet on the direct path to peer [{}]", path.get_peer_id())
+            return
+        if not was_active and path.is_active():
+            self._metrics.increment("direct_upgrades")
+            self._log.log("direct_upgrade", "Talking to peer [{}] directly at {}:{}", path.get_peer_id(), *addr)
+
+    def _peer_notified(self, peer_id: int, bundling: bool) -> None:
+        if peer_id in self._peers:
+            # Relay notifies about peers registering again from a new address
+            self._metrics.increment("re_registrations")
+        elif self.register_peer(peer_id) is None:
+            self._log.log("registration_failed", "Failed to register peer {}!", peer_id)
+            return
+        if bundling:
+            self._start_bundling(peer_id)
+        else:
+            self._stop_bundling(peer_id)
+
     def _received_from_peer(self, peer_id: int, payload: bytes, addr: tuple) -> None:
-        if self._verbose:
-            print(f"received {payload.hex()} from {addr}")
+        if self._verbose and self._log.sample_trace():
+            self._log.trace(f"received {payload.hex()} from {addr}")
         
         # Sending port has to be set in case of a client, as we don't know the clients port until it sends something
-        ip, port = addr
         peer: YourTurnMiddlemanPeer = self._peers[peer_id]
         if not self._is_server and not peer.is_send_port_set():
-            peer.set_send_port(port)
+            peer.set_send_port(addr[1])
         
+        ingress: int = self._sample_hop_trace() if self._hop_trace_period > 0 else 0
+        latency = self._metrics.latency
+        start: float = latency.start()
         receiver_id: int = peer_id if self._is_server else YourTurnMiddleman.SERVER_ID
-        turn_packet: bytes = make_turn_packet(receiver_id, payload)
-        # Forward received data to relay server
-        self._relay.send_data(turn_packet)
+        bundler: YourTurnBundler = self._bundlers.get(receiver_id, None)
+        direct: YourTurnDirectPath = self._direct_paths.get(receiver_id, None)
+        if direct is not None and direct.is_active():
+            # Same packet the Relay would deliver, the Server sees the ID of the Client in both directions
+            direct.send(make_turn_packet(peer_id, payload))
+        elif ingress:
+            if bundler is not None:
+                # Traced packet isn't bundled, so it mustn't overtake the bundled ones
+                bundler.flush()
+            self._send_traced(receiver_id, payload, ingress)
+        elif self._fec_group > 0:
+            # Parity covers single datagrams, so FEC takes the place of bundling
+            self._send_fec(receiver_id, payload)
+        elif self._compress and self._send_compressed(receiver_id, payload, bundler):
+            # Payload went out compressed, otherwise it's sent as it is
+            pass
+        elif bundler is not None:
+            bundler.add(payload)
+        elif self._relay.is_data_port_active():
+            # Relay identifies the sender by its address, so the payload is forwarded as is
+            self._relay.send_data(payload)
+        else:
+            turn_packet: bytes = make_turn_packet(receiver_id, payload)
+            # Forward received data to relay server
+            self._relay.send_data(turn_packet)
+        latency.stop(start)
+
+    def _sample_hop_trace(self) -> int:
+        # Ingress time of the packet, if it's traced, 0 otherwise
+        self._hop_trace_countdown -= 1
+        if self._hop_trace_countdown > 0:
+            return 0
+        self._hop_trace_countdown = self._hop_trace_period
+        return monotonic_ns()
+
+    def _send_traced(self, receiver_id: int, payload: bytes, ingress: int) -> None:
+        sequence: int = self._hop_trace_sequences.get(receiver_id, 0)
+        self._hop_trace_sequences[receiver_id] = sequence + 1
+        stamp: tuple = (TURN_TRACE_HOP_MIDDLEMAN, ingress, monotonic_ns())
+        self._relay.send_encapsulated(make_turn_trace_packet(receiver_id, sequence, [stamp], payload))
+
+    def _send_fec(self, receiver_id: int, payload: bytes) -> None:
+        encoder: YourTurnFecEncoder = self._fec_encoders.get(receiver_id, None)
+        if encoder is None:
+            encoder = YourTurnFecEncoder(
+                self._fec_group,
+                lambda fec_payload: self._relay.send_data(make_turn_packet(receiver_id, fec_payload, prefix=TURN_MSG_FEC_PREFIX)),
+                self._metrics
+            )
+            self._fec_encoders[receiver_id] = encoder
+        encoder.add(payload)
+
+    def _send_compressed(self, receiver_id: int, payload: bytes, bundler: YourTurnBundler) -> bool:
+        compressor: YourTurnCompressor = self._compressors.get(receiver_id, None)
+        if compressor is None:
+            compressor = YourTurnCompressor(
+                self._compression_stats.get_counters(receiver_id),
+                lambda offer: self._relay.send_data(make_turn_packet(receiver_id, offer, prefix=TURN_MSG_DICTIONARY_PREFIX))
+            )
+            self._compressors[receiver_id] = compressor
+        compressed: bytes = compressor.compress(payload)
+        if compressed == b"":
+            return False
+        if bundler is not None:
+            # Compressed packet isn't bundled, so it mustn't overtake the bundled ones
+            bundler.flush()
+        self._relay.send_data(make_turn_packet(receiver_id, compressed, prefix=TURN_MSG_COMPRESSED_PREFIX))
+        return True
+
+    def _tick_compressors(self) -> None:
+        for receiver_id, compressor in list(self._compressors.items()):
+            if compressor.tick():
+                self._log.log("compression_refused", "Peer [{}] didn't accept the dictionary, its packets aren't compressed", receiver_id)
+
+    def _flush_fec(self) -> None:
+        for encoder in list(self._fec_encoders.values()):
+            encoder.tick()
+
+    def _send_bundle(self, receiver_id: int, bundle: bytes) -> None:
+        if self._relay.is_data_port_active():
+            # Relay adds the bundle header of the sender
+            self._relay.send_data(bundle)
+        else:
+            self._relay.send_data(make_turn_packet(receiver_id, bundle, prefix=TURN_MSG_BUNDLE_PREFIX))
+
+    def _start_bundling(self, receiver_id: int) -> None:
+        if self._bundle_window <= 0 or receiver_id in self._bundlers:
+            return
+        self._bundlers[receiver_id] = YourTurnBundler(
+            lambda bundle: self._send_bundle(receiver_id, bundle),
+            self._bundle_window,
+            self._bundle_max_size
+        )
+        self._log.log("bundling", "Bundling packets for peer [{}]", receiver_id)
+
+    def _stop_bundling(self, receiver_id: int) -> None:
+        bundler: YourTurnBundler = self._bundlers.pop(receiver_id, None)
+        if bundler is not None:
+            bundler.flush()
     
     def register_peer(self, peer_id: int) -> YourTurnMiddlemanPeer:
         if peer_id <= 0 or peer_id in self._peers:
             return None
+        if len(self._peers) >= self._peers_max:
+            self._log.log("peer_limit", "Peer limit of {} reached!", self._peers_max)
+            return None
 
-        peer_port: int = self._next_peer_port
-        self._next_peer_port += 1
-        
-        peer = YourTurnMiddlemanPeer(peer_id, self._received_from_peer, recv_port=peer_port, send_ip="127.0.0.1")
-        if self._is_server:
-            peer.set_send_port(self._server_port)
+        def create_peer(peer_port: int) -> YourTurnMiddlemanPeer:
+            peer = YourTurnMiddlemanPeer(
+                peer_id,
+                self._received_from_peer,
+                recv_port=peer_port,
+                send_ip="127.0.0.1",
+                send_queue=self._make_send_queue(),
+                counters=self._metrics.get_peer_counters(peer_id)
+            )
+            if self._is_server:
+                peer.set_send_port(self._server_port)
+            return peer
 
-        # Try to open a port & store the peer if it succeeds
-        reactor.listenUDP(peer_port, peer)
+        if self._in_process:
+            peer = YourTurnSession(
+                peer_id,
+                self._received_from_peer,
+                buffer=self._make_send_queue(),
+                counters=self._metrics.get_peer_counters(peer_id)
+            )
+        else:
+            peer = self._listen_on_pool_port(create_peer)
+        if peer is None:
+            return None
+        peer_port: int = peer.get_recv_port()
         self._peers[peer_id] = peer
+        self._metrics.increment("registrations")
+        if self._broadcast_port > 0:
+            self.add_to_group(YourTurnMiddleman.BROADCAST_GROUP_ID, [peer_id])
 
         if not self._on_peer_registered is None:
             self._on_peer_registered(peer_id, peer_port)
         
-        print(f"Peer [{peer_id}] registered on port {peer_port}")
+        self._log.log("registration", "Peer [{}] registered on port {}", peer_id, peer_port)
         return peer
     
-    # def unregister_peer(self, peer_id: int) -> None:
-    #     # TODO: Implement
-    #     # TODO: Handle starting/stopping listeners
-    #     pass
+    def unregister_peer(self, peer_id: int) -> None:
+        peer: YourTurnMiddlemanPeer = self._peers.pop(peer_id, None)
+        if peer is None:
+            return
+        self._metrics.retire_peer(peer_id)
+        self._peer_activity.pop(peer_id, None)
+        self._hop_trace_sequences.pop(peer_id, None)
+        self._hop_traces.forget(peer_id)
+        self._remove_direct_path(peer_id)
+        self._fec_encoders.pop(peer_id, None)
+        self._fec_decoders.pop(peer_id, None)
+        self._compressors.pop(peer_id, None)
+        self._decompressors.pop(peer_id, None)
+        self._compression_stats.forget(peer_id)
+        self._stop_bundling(peer_id)
+        peer.close()
+        self._port_pool.release(peer.get_recv_port())
+        if self._broadcast_port > 0:
+            self.remove_from_group(YourTurnMiddleman.BROADCAST_GROUP_ID, [peer_id])
+        self._log.log("unregistration", "Peer [{}] unregistered", peer_id)
+
+    def _listen_on_pool_port(self, create_interface: Callable) -> YourTurnMiddlemanInterface:
+        # Ports taken by other programs are skipped & put back to the end of the pool, each is tried only once
+        for _ in range(len(self._port_pool)):
+            port: int = self._port_pool.acquire()
+            interface: YourTurnMiddlemanInterface = create_interface(port)
+            # Try to open a port & return the interface if it succeeds
+            try:
+                reactor.listenUDP(port, interface)
+            except CannotListenError as e:
+                self._log.log("listen_failed", "{}", e)
+                self._port_pool.release(port)
+                continue
+            return interface
+        self._log.log("no_free_port", "No free port for the interface!")
+        return None
+
+    def create_group(self, group_id: int, member_ids: list = (), port: int = 0) -> int:
+        # Server application sends the packets for the group to the returned local port, -1 if it couldn't be opened.
+        # Relay then sends them to every member, so the Server uplink doesn't scale with the number of members.
+        if not self._is_server:
+            raise ValueError("Only the Server can manage groups!")
+        interface: YourTurnMiddlemanPeer = self._group_interfaces.get(group_id, None)
+        if interface is not None:
+            return interface.get_recv_port()
+
+        def create_interface(group_port: int) -> YourTurnMiddlemanPeer:
+            return YourTurnMiddlemanPeer(group_id, self._received_from_group, recv_port=group_port)
+
+        if port > 0:
+            interface = create_interface(port)
+            try:
+                reactor.listenUDP(port, interface)
+            except CannotListenError as e:
+                self._log.log("listen_failed", "{}", e)
+                return -1
+        else:
+            interface = self._listen_on_pool_port(create_interface)
+            if interface is None:
+                return -1
+        self._group_interfaces[group_id] = interface
+        self._groups[group_id] = set(member_ids)
+        self._sync_group(group_id)
+        self._log.log("group", "Group [{}] created on port {}", group_id, interface.get_recv_port())
+        return interface.get_recv_port()
+
+    def delete_group(self, group_id: int) -> None:
+        interface: YourTurnMiddlemanPeer = self._group_interfaces.pop(group_id, None)
+        if interface is None:
+            return
+        del self._groups[group_id]
+        interface.close()
+        self._port_pool.release(interface.get_recv_port())
+        self._send_group_control(make_turn_group_control(group_id, TURN_GROUP_DELETE))
+
+    def add_to_group(self, group_id: int, member_ids: list) -> None:
+        members: set = self._groups.get(group_id, None)
+        if members is None:
+            return
+        member_ids = [member_id for member_id in member_ids if member_id not in members]
+        members.update(member_ids)
+        for i in range(0, len(member_ids), YourTurnMiddleman.GROUP_SYNC_CHUNK):
+            chunk: list = member_ids[i:i + YourTurnMiddleman.GROUP_SYNC_CHUNK]
+            self._send_group_control(make_turn_group_control(group_id, TURN_GROUP_ADD, chunk))
+
+    def remove_from_group(self, group_id: int, member_ids: list) -> None:
+        members: set = self._groups.get(group_id, None)
+        if members is None:
+            return
+        members.difference_update(member_ids)
+        self._sync_group(group_id)
+
+    def get_group_members(self, group_id: int) -> set:
+        return self._groups.get(group_id, set())
+
+    def send_to_group(self, group_id: int, payload: bytes) -> None:
+        self._relay.send_data(make_turn_packet(group_id, payload, prefix=TURN_MSG_GROUP_PREFIX))
+
+    def _received_from_group(self, group_id: int, payload: bytes, addr: tuple) -> None:
+        self.send_to_group(group_id, payload)
+
+    def _sync_group(self, group_id: int) -> None:
+        # Whole membership is sent, so repeating it is harmless
+        member_ids: list = sorted(self._groups[group_id])
+        self._send_group_control(make_turn_group_control(group_id, TURN_GROUP_SET, member_ids[:YourTurnMiddleman.GROUP_SYNC_CHUNK]))
+        for i in range(YourTurnMiddleman.GROUP_SYNC_CHUNK, len(member_ids), YourTurnMiddleman.GROUP_SYNC_CHUNK):
+            chunk: list = member_ids[i:i + YourTurnMiddleman.GROUP_SYNC_CHUNK]
+            self._send_group_control(make_turn_group_control(group_id, TURN_GROUP_ADD, chunk))
+
+    def _sync_groups(self) -> None:
+        for group_id in list(self._groups):
+            self._sync_group(group_id)
+
+    def _send_group_control(self, packet: bytes) -> None:
+        # Groups created before the Relay is resolved are sent by the periodic sync
+        if self._relay is not None:
+            self._relay.send_data(packet)
+
+    def _teardown_idle_peers(self) -> None:
+        # Activity is read from the peer counters, so the packet path doesn't have to record any times
+        now: float = monotonic()
+        for peer_id, peer in list(self._peers.items()):
+            counters: YourTurnPeerCounters = peer.get_counters()
+            activity: int = counters.packets_in + counters.packets_out
+            last_activity: tuple = self._peer_activity.get(peer_id, None)
+            if last_activity is None or last_activity[0] != activity:
+                self._peer_activity[peer_id] = (activity, now)
+            elif now - last_activity[1] >= self._peer_idle_timeout:
+                self._log.log("idle_peer", "Peer [{}] is idle", peer_id)
+                self._metrics.increment("idle_teardowns")
+                self.unregister_peer(peer_id)
 
 
 if __name__ == '__main__':
@@ -274,17 +1571,56 @@ if __name__ == '__main__':
     arg_parser.add_argument("-s", "--server", action="store_true")
     arg_parser.add_argument("-i", "--id", type=int, default=1)
     arg_parser.add_argument("-l", "--listen-port", type=int, default=YourTurnMiddleman.SERVER_DEFAULT_PORT)
-    arg_parser.add_argument("-v", "--verbose", action="store_true")
+    arg_parser.add_argument("-v", "--verbose", action="store_true", help="Trace forwarded packets")
+    arg_parser.add_argument("-t", "--trace-sample", type=int, default=YourTurnLogger.TRACE_SAMPLE_PERIOD, help="Trace only every N-th packet")
+    arg_parser.add_argument("--profile-dir", default=".", help="Directory of the profiles, SIGUSR1 starts & stops profiling")
+    arg_parser.add_argument("--profile-window", type=float, default=YourTurnProfiler.WINDOW, help="Profiling stops on its own after this long [s]")
+    arg_parser.add_argument("--compress", action="store_true", help="Compress the packets for the Relay, once the other side accepts the dictionary")
+    arg_parser.add_argument("--fec-group", type=int, default=0, help="Send a FEC parity packet after every N packets for the Relay, 0 disables it")
+    arg_parser.add_argument("--direct", action="store_true", help="Talk to the other side directly, when the NATs let it, both sides need it")
+    arg_parser.add_argument("--hop-trace-period", type=int, default=0, help="Stamp every N-th packet on each hop for the per-hop latency metrics, 0 disables it")
     arg_parser.add_argument("-r", "--relay-ip", default=YOUR_TURN_IP)
     arg_parser.add_argument("-p", "--relay-port", type=int, default=YOUR_TURN_PORT)
+    arg_parser.add_argument("--relays", nargs="*", default=[], help="host:port of other Relays, the fastest answering one is used")
+    arg_parser.add_argument("-d", "--relay-data-port", type=int, default=YOUR_TURN_DATA_PORT, help="Relay client data port, 0 disables it")
+    arg_parser.add_argument("--port-range-start", type=int, default=YourTurnMiddleman.PORT_RANGE_START, help="First port of peer interfaces")
+    arg_parser.add_argument("--send-queue-packets", type=int, default=YourTurnSendQueue.MAX_PACKETS)
+    arg_parser.add_argument("--send-queue-bytes", type=int, default=YourTurnSendQueue.MAX_BYTES)
+    arg_parser.add_argument("--send-queue-policy", choices=SEND_QUEUE_POLICIES, default=SEND_QUEUE_DROP_OLDEST)
+    arg_parser.add_argument("-m", "--metrics-port", type=int, default=0, help="Local Prometheus metrics port, 0 disables it")
+    arg_parser.add_argument("--peers-max", type=int, default=YourTurnMiddleman.PEERS_MAX)
+    arg_parser.add_argument("--bundle-window", type=float, default=0, help=f"Bundle packets for the Relay sent within this time [s], e.g. {YourTurnMiddleman.BUNDLE_WINDOW}, 0 disables it")
+    arg_parser.add_argument("--bundle-size", type=int, default=YourTurnMiddleman.BUNDLE_MAX_SIZE, help="Size budget of a bundle [B]")
+    arg_parser.add_argument("--broadcast-port", type=int, default=0, help="Server port, where packets for all Clients are sent to, 0 disables it")
+    arg_parser.add_argument("--peer-idle-timeout", type=float, default=YourTurnMiddleman.PEER_IDLE_TIMEOUT, help="Time after which idle peers are torn down [s], 0 disables it")
     args = arg_parser.parse_args()
 
     middleman = YourTurnMiddleman(
         args.relay_ip,
         args.relay_port,
         args.server,
+        relay_data_port=args.relay_data_port,
+        send_queue_packets=args.send_queue_packets,
+        send_queue_bytes=args.send_queue_bytes,
+        send_queue_policy=args.send_queue_policy,
+        port_range_start=args.port_range_start,
+        metrics_port=args.metrics_port,
+        peers_max=args.peers_max,
+        peer_idle_timeout=args.peer_idle_timeout,
         id=args.id,
         server_port=args.listen_port,
-        verbose=args.verbose
+        verbose=args.verbose,
+        trace_sample=args.trace_sample,
+        bundle_window=args.bundle_window,
+        bundle_max_size=args.bundle_size,
+        broadcast_port=args.broadcast_port,
+        relays=[(host, int(port)) for host, _, port in (relay.rpartition(":") for relay in args.relays)],
+        hop_trace_period=args.hop_trace_period,
+        direct=args.direct,
+        fec_group=args.fec_group,
+        compress=args.compress,
+        profile_dir=args.profile_dir,
+        profile_window=args.profile_window
     )
+    middleman.get_profiler().install_signal()
     reactor.run()
@@ -0,0 +1,97 @@
+import os
+import signal
+import cProfile
+from time import monotonic, strftime
+from typing import Callable
+
+from your_turn_metrics import YourTurnLatencyHistogram
+
+
+class YourTurnProfiler:
+    # Always-on timers of the hot callbacks, which time only some of the calls, and the lag of the loop, seen as how
+    # much later than planned the periodic tick comes. cProfile slows everything down, so it only runs on
+    # request, e.g. by SIGUSR1, for a fixed window, after which its stats are dumped into a file.
+    WINDOW: float = 10.0  # [s]
+    LAG_BUCKETS: tuple = (1e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0)  # [s]
+    CALLBACK_BUCKETS: tuple = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3, 1e-2)  # [s]
+
+    def __init__(self, name: str, tick_period: float, directory: str = ".", window: float = WINDOW) -> None:
+        self._name: str = name  # Start of the dump file names
+        self._tick_period: float = tick_period
+        self._directory: str = directory
+        self._window: float = window
+        self._callbacks: dict = {}  # callback name -> YourTurnLatencyHistogram
+        self._lag = YourTurnLatencyHistogram(YourTurnProfiler.LAG_BUCKETS)
+        self._ticked: float = None  # [s] When was the last tick
+        # Set by the signal handler, which can interrupt anything, so the profile is started & stopped by the tick
+        self._is_requested: bool = False
+        self._profile: cProfile.Profile = None
+        self._profile_end: float = 0.0  # [s]
+
+    def wrap(self, name: str, function: Callable) -> Callable:
+        # Same function, with every YourTurnLatencyHistogram.SAMPLE_PERIOD-th call timed
+        histogram = YourTurnLatencyHistogram(YourTurnProfiler.CALLBACK_BUCKETS)
+        self._callbacks[name] = histogram
+
+        def timed(*args):
+            start: float = histogram.start()
+            try:
+                return function(*args)
+            finally:
+                histogram.stop(start)
+        return timed
+
+    def install_signal(self) -> bool:
+        # SIGUSR1 starts the profile, or stops it before the window is over, returns False if there is no SIGUSR1
+        if not hasattr(signal, "SIGUSR1"):
+            return False
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.request())
+        return True
+
+    def request(self) -> None:
+        self._is_requested = True
+
+    def is_profiling(self) -> bool:
+        return self._profile is not None
+
+    def tick(self) -> None:
+        now: float = monotonic()
+        if self._ticked is not None:
+            self._lag.observe(max(0.0, now - self._ticked - self._tick_period))
+        self._ticked = now
+        if self._is_requested:
+            self._is_requested = False
+            if self._profile is None:
+                self._start(now)
+            else:
+                self._stop()
+        elif self._profile is not None and now >= self._profile_end:
+            self._stop()
+
+    def render(self, namespace: str) -> list:
+        name: str = f"{namespace}_loop_lag_seconds"
+        lines: list = [f"# HELP {name} How much later than planned the periodic tick ran", f"# TYPE {name} histogram"]
+        lines += self._lag.render_samples(name)
+        name = f"{namespace}_callback_seconds"
+        lines += [f"# HELP {name} Time spent in the sampled calls of the callback", f"# TYPE {name} histogram"]
+        for callback, histogram in list(self._callbacks.items()):
+            lines += histogram.render_samples(name, f'callback="{callback}"')
+        name = f"{namespace}_profiling"
+        lines += [f"# HELP {name} Whether cProfile is running", f"# TYPE {name} gauge", f"{name} {int(self.is_profiling())}"]
+        return lines
+
+    def _start(self, now: float) -> None:
+        self._profile = cProfile.Profile()
+        self._profile_end = now + self._window
+        print(f"Profiling for {self._window} s")
+        self._profile.enable()
+
+    def _stop(self) -> None:
+        self._profile.disable()
+        path: str = os.path.join(self._directory, f"{self._name}-{os.getpid()}-{strftime('%Y%m%d-%H%M%S')}.prof")
+        try:
+            self._profile.dump_stats(path)
+            print(f"Profile written to {path}, see it with: python -m pstats {path}")
+        except OSError as e:
+            print(f"Failed to write the profile to {path}: {e}")
+        self._profile = None
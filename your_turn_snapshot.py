@@ -0,0 +1,87 @@
+import os
+import mmap
+import socket
+import struct
+
+# Snapshot record: peer ID, IPv4 address, port, flags, lease expiry (wall clock, as monotonic time doesn't survive
+# a restart)
+SNAPSHOT_PEER_RECORD = struct.Struct("<L4sHBxd")
+SNAPSHOT_PEER_EXPIRY = struct.Struct("<d")
+SNAPSHOT_PEER_EXPIRY_OFFSET: int = 12
+SNAPSHOT_EMPTY_ID: int = 0
+SNAPSHOT_PEER_VIA_DATA_PORT: int = 0x01
+SNAPSHOT_PEER_BUNDLING: int = 0x02
+
+
+class YourTurnPeerSnapshot:
+    # Leases of the registered peers in a memory-mapped file, so a restarted Relay can carry on with the peers of
+    # the previous one. Records are written in place, only on registrations & lease renewals, and the OS writes
+    # them out lazily, so it survives the Relay process, not the host.
+    DEFAULT_CAPACITY: int = 1 << 16
+
+    def __init__(self, path: str, capacity: int = DEFAULT_CAPACITY) -> None:
+        size: int = capacity * SNAPSHOT_PEER_RECORD.size
+        fd: int = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size != size:
+                # Records of a different capacity are kept as far as they fit
+                os.ftruncate(fd, size)
+            self._buffer = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self._capacity: int = capacity
+
+        self._slots: dict = {}  # peer ID -> slot of its record
+        self._free_slots: list = []
+        for slot in reversed(range(capacity)):
+            peer_id: int = SNAPSHOT_PEER_RECORD.unpack_from(self._buffer, slot * SNAPSHOT_PEER_RECORD.size)[0]
+            if peer_id == SNAPSHOT_EMPTY_ID or peer_id in self._slots:
+                self._free_slots.append(slot)
+            else:
+                self._slots[peer_id] = slot
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def read(self) -> list:
+        # (peer ID, IP, port, flags, lease expiry) of all the stored peers
+        records: list = []
+        for slot in self._slots.values():
+            peer_id, ip, port, flags, expiry = SNAPSHOT_PEER_RECORD.unpack_from(self._buffer, slot * SNAPSHOT_PEER_RECORD.size)
+            records.append((peer_id, socket.inet_ntoa(ip), port, flags, expiry))
+        return records
+
+    def store(self, peer_id: int, addr: tuple, flags: int, expiry: float) -> bool:
+        # Returns False if the snapshot is full
+        slot: int = self._slots.get(peer_id, -1)
+        if slot < 0:
+            if len(self._free_slots) == 0:
+                return False
+            slot = self._free_slots.pop()
+            self._slots[peer_id] = slot
+        ip, port = addr
+        SNAPSHOT_PEER_RECORD.pack_into(
+            self._buffer,
+            slot * SNAPSHOT_PEER_RECORD.size,
+            peer_id,
+            socket.inet_aton(ip),
+            port,
+            flags,
+            expiry
+        )
+        return True
+
+    def renew(self, peer_id: int, expiry: float) -> None:
+        slot: int = self._slots.get(peer_id, -1)
+        if slot >= 0:
+            SNAPSHOT_PEER_EXPIRY.pack_into(self._buffer, slot * SNAPSHOT_PEER_RECORD.size + SNAPSHOT_PEER_EXPIRY_OFFSET, expiry)
+
+    def remove(self, peer_id: int) -> None:
+        slot: int = self._slots.pop(peer_id, -1)
+        if slot >= 0:
+            SNAPSHOT_PEER_RECORD.pack_into(self._buffer, slot * SNAPSHOT_PEER_RECORD.size, SNAPSHOT_EMPTY_ID, bytes(4), 0, 0, 0.0)
+            self._free_slots.append(slot)
+
+    def close(self) -> None:
+        self._buffer.flush()
+        self._buffer.close()
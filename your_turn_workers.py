@@ -0,0 +1,365 @@
+import os
+import signal
+import socket
+import struct
+import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
+from time import sleep
+
+from your_turn import YourTurnPeer, YourTurnPeerTable, YourTurnRateLimit, YourTurnRelay
+from your_turn_backends import make_udp_socket, run_backend
+from your_turn_metrics import YourTurnMetricsServer
+from your_turn_logging import YourTurnLogger
+from your_turn_profiling import YourTurnProfiler
+
+# Shared registry record: sequence (odd while being written), peer ID, IPv4 address, port, flags, owner worker
+SHARED_PEER_RECORD = struct.Struct("<LL4sHBB")
+SHARED_PEER_SEQ = struct.Struct("<L")
+# Generation of the whole registry in front of the records, odd while records are being moved
+SHARED_REGISTRY_GENERATION = struct.Struct("<L")
+SHARED_PEER_EMPTY_ID: int = 0
+SHARED_PEER_VIA_DATA_PORT: int = 0x01
+SHARED_PEER_BUNDLING: int = 0x02
+
+
+class YourTurnSharedRegistry:
+    # Peer registry shared between the Relay worker processes.
+    # It's an open addressing hash table in shared memory, readers don't lock, but retry if they hit a record that
+    # is being written (seqlock), while the rare writes (registrations) are serialized with a lock.
+    # Withdrawn records are filled by shifting the following records of the probe chain back (no tombstones), so
+    # misses stay short after any churn. Shifting moves records, so a miss is only trusted if no shift ran meanwhile.
+    DEFAULT_CAPACITY: int = 1 << 16  # Has to be a power of 2
+    # Readers spin while a writer is in the middle of a record or a shift, then sleep for a bit. Writer, that takes
+    # longer than that, is taken for dead, so a crashed worker doesn't hang all the others.
+    SPIN_ATTEMPTS: int = 100
+    SLEEP_ATTEMPTS: int = 10
+    SLEEP_TIME: float = 0.001  # [s]
+
+    def __init__(self, memory: SharedMemory, lock, capacity: int) -> None:
+        self._memory: SharedMemory = memory
+        self._buffer: memoryview = memory.buf
+        self._lock = lock
+        self._capacity: int = capacity
+        self._mask: int = capacity - 1
+        # Odd generation & sequences left behind by a dead writer, they aren't waited for again
+        self._dead_generation: int = -1
+        self._dead_seqs: dict = {}  # slot -> sequence
+
+    @staticmethod
+    def create(lock, capacity: int = DEFAULT_CAPACITY) -> "YourTurnSharedRegistry":
+        if capacity & (capacity - 1) != 0:
+            raise ValueError("Shared registry capacity has to be a power of 2!")
+        memory = SharedMemory(create=True, size=SHARED_REGISTRY_GENERATION.size + capacity * SHARED_PEER_RECORD.size)
+        memory.buf[:] = bytes(memory.size)
+        return YourTurnSharedRegistry(memory, lock, capacity)
+
+    @staticmethod
+    def attach(name: str, lock, capacity: int = DEFAULT_CAPACITY) -> "YourTurnSharedRegistry":
+        return YourTurnSharedRegistry(SharedMemory(name=name), lock, capacity)
+
+    def get_name(self) -> str:
+        return self._memory.name
+
+    def get_lock(self):
+        return self._lock
+
+    def get_capacity(self) -> int:
+        return self._capacity
+
+    def close(self, unlink: bool = False) -> None:
+        self._buffer.release()
+        self._memory.close()
+        if unlink:
+            self._memory.unlink()
+
+    def get_seq(self, slot: int) -> int:
+        return SHARED_PEER_SEQ.unpack_from(self._buffer, self._offset(slot))[0]
+
+    def read(self, slot: int) -> tuple:
+        offset: int = self._offset(slot)
+        attempt: int = 0
+        while True:
+            record: tuple = SHARED_PEER_RECORD.unpack_from(self._buffer, offset)
+            seq: int = record[0]
+            if seq & 1 == 0 and SHARED_PEER_SEQ.unpack_from(self._buffer, offset)[0] == seq:
+                return record
+            if self._dead_seqs.get(slot, -1) == seq:
+                return record
+            if not self._back_off(attempt):
+                self._dead_seqs[slot] = seq
+                return record
+            attempt += 1
+
+    def find(self, peer_id: int) -> int:
+        attempt: int = 0
+        while True:
+            generation: int = self._get_generation()
+            is_shifting: bool = generation & 1 == 1 and generation != self._dead_generation
+            if is_shifting:
+                if self._back_off(attempt):
+                    attempt += 1
+                    continue
+                self._dead_generation = generation
+            slot: int = self._first_slot(peer_id)
+            for _ in range(self._capacity):
+                slot_id: int = self.read(slot)[1]
+                if slot_id == peer_id:
+                    return slot
+                if slot_id == SHARED_PEER_EMPTY_ID:
+                    break
+                slot = (slot + 1) & self._mask
+            # Record might have been shifted over the part of the chain, that was already scanned
+            if self._get_generation() == generation or not self._back_off(attempt):
+                return -1
+            attempt += 1
+
+    def publish(self, peer_id: int, addr: tuple, flags: int, owner: int) -> tuple:
+        # Returns the slot & sequence of the written record, slot is -1 if the registry is full
+        ip, port = addr
+        with self._lock:
+            slot: int = self.find(peer_id)
+            if slot < 0:
+                slot = self._free_slot(peer_id)
+                if slot < 0:
+                    return -1, 0
+            seq: int = self.get_seq(slot)
+            self._write(slot, seq, peer_id, socket.inet_aton(ip), port, flags, owner)
+            return slot, seq + 2
+
+    def withdraw(self, peer_id: int) -> None:
+        with self._lock:
+            slot: int = self.find(peer_id)
+            if slot < 0:
+                return
+            generation: int = self._get_generation()
+            SHARED_REGISTRY_GENERATION.pack_into(self._buffer, 0, generation + 1)
+            hole: int = slot
+            for _ in range(self._capacity - 1):
+                slot = (slot + 1) & self._mask
+                record: tuple = self.read(slot)
+                if record[1] == SHARED_PEER_EMPTY_ID:
+                    break
+                # Record can fill the hole, unless its chain starts after the hole
+                if (slot - self._first_slot(record[1])) & self._mask >= (slot - hole) & self._mask:
+                    self._write(hole, self.get_seq(hole), *record[1:])
+                    hole = slot
+            self._write(hole, self.get_seq(hole), SHARED_PEER_EMPTY_ID, bytes(4), 0, 0, 0)
+            SHARED_REGISTRY_GENERATION.pack_into(self._buffer, 0, (generation + 2) & 0xFFFFFFFF)
+
+    def _back_off(self, attempt: int) -> bool:
+        # Returns False once the writer was waited for long enough
+        if attempt < YourTurnSharedRegistry.SPIN_ATTEMPTS:
+            return True
+        if attempt >= YourTurnSharedRegistry.SPIN_ATTEMPTS + YourTurnSharedRegistry.SLEEP_ATTEMPTS:
+            return False
+        sleep(YourTurnSharedRegistry.SLEEP_TIME)
+        return True
+
+    def _get_generation(self) -> int:
+        return SHARED_REGISTRY_GENERATION.unpack_from(self._buffer, 0)[0]
+
+    def _offset(self, slot: int) -> int:
+        return SHARED_REGISTRY_GENERATION.size + slot * SHARED_PEER_RECORD.size
+
+    def _first_slot(self, peer_id: int) -> int:
+        # Fibonacci hashing, as IDs might not be uniformly distributed in the lower bits
+        return ((peer_id * 2654435761) >> 8) & self._mask
+
+    def _free_slot(self, peer_id: int) -> int:
+        slot: int = self._first_slot(peer_id)
+        for _ in range(self._capacity):
+            slot_id: int = self.read(slot)[1]
+            if slot_id == SHARED_PEER_EMPTY_ID:
+                return slot
+            slot = (slot + 1) & self._mask
+        return -1
+
+    def _write(self, slot: int, seq: int, peer_id: int, ip: bytes, port: int, flags: int, owner: int) -> None:
+        offset: int = self._offset(slot)
+        # Mark the record as being written, then publish it with the next even sequence
+        SHARED_PEER_SEQ.pack_into(self._buffer, offset, seq + 1)
+        SHARED_PEER_RECORD.pack_into(self._buffer, offset, seq + 1, peer_id, ip, port, flags, owner)
+        SHARED_PEER_SEQ.pack_into(self._buffer, offset, seq + 2)
+
+
+class YourTurnSharedPeerTable(YourTurnPeerTable):
+    # Peer table of a single worker, which caches records of the shared registry.
+    # Cached records are validated against the sequence of their registry slot, so a peer re-registering through
+    # another worker is picked up on the next lookup.
+    def __init__(self, registry: YourTurnSharedRegistry, relay: YourTurnRelay, worker: int) -> None:
+        super().__init__()
+
+        self._registry: YourTurnSharedRegistry = registry
+        self._relay: YourTurnRelay = relay
+        self._worker: int = worker
+
+        self._versions: dict = {}  # peer ID -> (slot, sequence) of the cached record
+        self._owned: set = set()  # IDs of peers registered through this worker, they are kept alive by it
+
+    def __len__(self) -> int:
+        return len(self._owned)
+
+    def __contains__(self, peer_id: int) -> bool:
+        return self.get(peer_id) is not None
+
+    def __iter__(self):
+        for peer_id in list(self._owned):
+            if self.is_owned(peer_id):
+                yield peer_id
+
+    def get(self, peer_id: int, default: YourTurnPeer = None) -> YourTurnPeer:
+        version: tuple = self._versions.get(peer_id, None)
+        if version is not None:
+            slot, seq = version
+            if self._registry.get_seq(slot) == seq:
+                return self._peers[peer_id]
+        return self._load(peer_id, default)
+
+    def get_by_addr(self, addr: tuple) -> YourTurnPeer:
+        # Cached address is validated through the ID, as the peer might have re-registered through another worker
+        peer: YourTurnPeer = self._peers_by_addr.get(addr, None)
+        if peer is None:
+            return None
+        current: YourTurnPeer = self.get(peer.get_id())
+        if current is not None and current.get_addr() == addr:
+            return current
+        if self._peers_by_addr.get(addr, None) is peer:
+            del self._peers_by_addr[addr]
+        return None
+
+    def get_id_by_addr(self, addr: tuple) -> int:
+        peer: YourTurnPeer = self.get_by_addr(addr)
+        return -1 if peer is None else peer.get_id()
+
+    def is_owned(self, peer_id: int) -> bool:
+        return self.get(peer_id) is not None and peer_id in self._owned
+
+    def add(self, peer_id: int, peer: YourTurnPeer) -> bool:
+        is_registered: bool = self.get(peer_id) is not None
+        super().add(peer_id, peer)
+        flags: int = SHARED_PEER_VIA_DATA_PORT if peer.get_send_function() == self._relay.get_data_port().send else 0
+        if peer.is_bundling():
+            flags |= SHARED_PEER_BUNDLING
+        slot, seq = self._registry.publish(peer_id, peer.get_addr(), flags, self._worker)
+        if slot < 0:
+            self._relay.get_logger().log("registry_full", "Shared peer registry is full!")
+            self._versions.pop(peer_id, None)
+        else:
+            self._versions[peer_id] = (slot, seq)
+        self._owned.add(peer_id)
+        return is_registered
+
+    def remove(self, peer_id: int) -> YourTurnPeer:
+        if peer_id in self._owned:
+            self._registry.withdraw(peer_id)
+        return self._forget(peer_id)
+
+    def _forget(self, peer_id: int) -> YourTurnPeer:
+        self._versions.pop(peer_id, None)
+        self._owned.discard(peer_id)
+        return super().remove(peer_id)
+
+    def _load(self, peer_id: int, default: YourTurnPeer) -> YourTurnPeer:
+        while True:
+            slot: int = self._registry.find(peer_id)
+            if slot < 0:
+                self._forget(peer_id)
+                return default
+            seq, slot_id, ip, port, flags, owner = self._registry.read(slot)
+            # Record might have been shifted away since it was found
+            if slot_id == peer_id:
+                break
+        if flags & SHARED_PEER_VIA_DATA_PORT:
+            send_function = self._relay.get_data_port().send
+        else:
+            send_function = self._relay.transport.write
+        counters = self._relay.get_metrics().get_peer_counters(peer_id)
+        peer = YourTurnPeer(peer_id, socket.inet_ntoa(ip), port, send_function, counters, bool(flags & SHARED_PEER_BUNDLING))
+        super().add(peer_id, peer)
+        self._versions[peer_id] = (slot, seq)
+        if owner == self._worker:
+            self._owned.add(peer_id)
+        else:
+            self._owned.discard(peer_id)
+        return peer
+
+
+def run_worker(worker: int, registry_name: str, lock, capacity: int, port: int, data_port: int, backend: str, metrics_port: int, verbose: bool, trace_sample: int, rate_limit: YourTurnRateLimit, keep_alive_max: float, profile_dir: str, profile_window: float) -> None:
+    registry = YourTurnSharedRegistry.attach(registry_name, lock, capacity)
+    relay = YourTurnRelay(verbose=verbose, trace_sample=trace_sample, rate_limit=rate_limit, keep_alive_max=keep_alive_max, profile_dir=profile_dir, profile_window=profile_window)
+    relay.get_profiler().install_signal()
+    relay.set_peer_map(YourTurnSharedPeerTable(registry, relay, worker))
+
+    endpoints: list = [(make_udp_socket(port, reuse_port=True), relay)]
+    if data_port > 0:
+        endpoints.append((make_udp_socket(data_port, reuse_port=True), relay.get_data_port()))
+
+    print(f"Started TURN worker {worker} on port {port}")
+    if metrics_port > 0:
+        # Every worker has its own counters, so each is scraped on its own port
+        worker_metrics_port: int = metrics_port + worker - 1
+        YourTurnMetricsServer(relay.get_metrics(), worker_metrics_port).start()
+        print(f"Serving metrics of worker {worker} on http://127.0.0.1:{worker_metrics_port}/metrics")
+    run_backend(backend, endpoints, relay.tick, YourTurnRelay.TICK_PERIOD)
+    registry.close()
+
+
+def run_workers(workers: int, port: int, data_port: int, backend: str = "twisted", metrics_port: int = 0, verbose: bool = False, trace_sample: int = YourTurnLogger.TRACE_SAMPLE_PERIOD, rate_limit: YourTurnRateLimit = None, keep_alive_max: float = YourTurnRelay.KEEP_ALIVE_MAX, profile_dir: str = ".", profile_window: float = YourTurnProfiler.WINDOW) -> None:
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("Multiple workers require SO_REUSEPORT support!")
+    if workers > 0xFF:
+        raise ValueError("At most 255 workers are supported!")
+
+    # Workers are spawned, so they don't inherit any reactor state
+    context = multiprocessing.get_context("spawn")
+    registry = YourTurnSharedRegistry.create(context.Lock())
+    processes: list = [
+        context.Process(
+            target=run_worker,
+            args=(
+                worker,
+                registry.get_name(),
+                registry.get_lock(),
+                registry.get_capacity(),
+                port,
+                data_port,
+                backend,
+                metrics_port,
+                verbose,
+                trace_sample,
+                rate_limit,
+                keep_alive_max,
+                profile_dir,
+                profile_window
+            ),
+            daemon=True
+        )
+        for worker in range(1, workers + 1)
+    ]
+    # Stop the workers & clean up the shared memory also when terminated, e.g. by Docker
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    def forward_profile_request(signum, frame) -> None:
+        # Every worker profiles itself into its own file
+        for process in processes:
+            if process.pid is not None:
+                os.kill(process.pid, signal.SIGUSR1)
+
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, forward_profile_request)
+    try:
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Don't get interrupted while cleaning up
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        registry.close(unlink=True)